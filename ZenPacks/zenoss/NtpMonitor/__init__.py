@@ -7,27 +7,20 @@
 #
 ##############################################################################
 
-import Globals
-import os.path
+import os
 import logging
-from ZenPacks.zenoss.ZenPackLib import zenpacklib
 
 log = logging.getLogger("zen.NtpMonitor")
 
-skinsDir = os.path.join(os.path.dirname(__file__), 'skins')
-from Products.CMFCore.DirectoryView import registerDirectory
-if os.path.isdir(skinsDir):
-    registerDirectory(skinsDir, globals())
+# Worker processes and command line checks need only the protocol
+# modules, they skip Zope and zenpacklib when this variable is set.
+if not os.environ.get("NTPMONITOR_STANDALONE"):
+    import Globals
+    from ZenPacks.zenoss.ZenPackLib import zenpacklib
 
-def onCollectorInstalled(ob, event):
-    zpFriendly = 'NtpMonitor'
-    errormsg = '{0} binary cannot be found on {1}. This is part of the nagios-plugins ' + \
-               'dependency, and must be installed before {2} can function.'
-    
-    verifyBin = 'check_ntp'
-    code, output = ob.executeCommand('zenbincheck %s' % verifyBin, 'zenoss', needsZenHome=True)
-    if code:
-        log.warn(errormsg.format(verifyBin, ob.hostname, zpFriendly))
+    skinsDir = os.path.join(os.path.dirname(__file__), 'skins')
+    from Products.CMFCore.DirectoryView import registerDirectory
+    if os.path.isdir(skinsDir):
+        registerDirectory(skinsDir, globals())
 
-
-zenpacklib.load_yaml()
+    zenpacklib.load_yaml()
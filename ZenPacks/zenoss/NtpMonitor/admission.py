@@ -0,0 +1,179 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Admission of NTP checks of the collector.
+
+At most limit checks run at once. Others wait in a heap ordered by
+priority, so that in an overloaded cycle unhealthy and important
+devices are checked first. A check which cannot start within its wait
+is shed with OverloadedError instead of running late and timing out.
+A running check holds its slot at most until its watchdog expires, so a
+check which never finishes cannot starve the others. Deadlines of
+waiting checks and watchdogs are kept on the timer wheel of sessions.
+"""
+
+import heapq
+import logging
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.python.failure import Failure
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+
+class OverloadedError(NtpException):
+    """
+    Check was not started because the collector was overloaded.
+    """
+    def __init__(self, message="skipped: overloaded"):
+        NtpException.__init__(self, message)
+
+
+class AdmissionController(object):
+    """
+    Bounded number of running checks with priority queue of the rest.
+    """
+    def __init__(self, limit=1000, timers=None):
+        """
+        Initialize AdmissionController.
+        :param limit: maximal number of checks running at once
+        :param timers: TimerWheel for deadlines, the sessions' one by
+            default
+        """
+        self.limit = max(int(limit), 1)
+        if timers is None:
+            from ZenPacks.zenoss.NtpMonitor.ntp import getTimerWheel
+            timers = getTimerWheel()
+        self.timers = timers
+        self.running = 0
+        # [priority, sequence, (start, watchdog), Deferred, deadline
+        # timer], the check is None once it was admitted or shed
+        self.queue = []
+        self.counter = 0
+        self.shed = 0
+        self.stuck = 0
+        self.admitting = False
+
+    def submit(self, start, priority=(), wait=None, watchdog=None):
+        """
+        Run start() now, or once a running check finishes.
+        :param start: function returning Deferred of the check
+        :param priority: sortable value, lowest is admitted first
+        :param wait: seconds the check may wait, unlimited if None
+        :param watchdog: seconds the check may run, unlimited if None
+        :return: Deferred firing with result of the check, failing with
+            OverloadedError if it was shed or with NtpException if it
+            did not finish in time
+        :rtype: Deferred
+        """
+        self.counter += 1
+        entry = [priority, self.counter, (start, watchdog), Deferred(), None]
+        heapq.heappush(self.queue, entry)
+        self.admit()
+        if entry[2] is not None and wait is not None:
+            entry[4] = self.timers.schedule(wait, self.expire, entry)
+        return entry[3]
+
+    def run(self, start, watchdog, d):
+        self.running += 1
+        # [slot held, watchdog timer]
+        state = [True, None]
+        check = maybeDeferred(start)
+        if watchdog is not None and not check.called:
+            state[1] = self.timers.schedule(watchdog, self.abandon, state,
+                                            watchdog, d)
+        check.addBoth(self.finished, state, d)
+
+    def release(self, state):
+        """
+        Free the slot of a check, once.
+        :return: True if the slot was still held
+        """
+        if not state[0]:
+            return False
+        state[0] = False
+        if state[1] is not None:
+            state[1].cancel()
+            state[1] = None
+        self.running -= 1
+        self.admit()
+        return True
+
+    def finished(self, result, state, d):
+        if not self.release(state):
+            log.debug("NTP check finished after its watchdog expired")
+            return None
+        if isinstance(result, Failure):
+            d.errback(result)
+        else:
+            d.callback(result)
+
+    def abandon(self, state, watchdog, d):
+        """
+        Give up a check running longer than its watchdog.
+        """
+        state[1] = None
+        self.stuck += 1
+        log.warn("NTP check did not finish in %.0f secs, slot released, "
+                 "%d such checks so far", watchdog, self.stuck)
+        self.release(state)
+        d.errback(NtpException(
+            "Timeout. Check did not finish in %.0f secs" % watchdog
+        ))
+
+    def admit(self):
+        # checks finishing at once call back here, the loop goes on
+        if self.admitting:
+            return
+        self.admitting = True
+        try:
+            while self.queue and self.running < self.limit:
+                entry = heapq.heappop(self.queue)
+                _, _, check, d, deadline = entry
+                if check is None:
+                    # shed, left in the heap
+                    continue
+                entry[2] = None
+                if deadline is not None:
+                    deadline.cancel()
+                start, watchdog = check
+                self.run(start, watchdog, d)
+        finally:
+            self.admitting = False
+
+    def expire(self, entry):
+        """
+        Shed waiting check whose wait is over.
+        """
+        d = entry[3]
+        # the heap entry is dropped when it reaches the top
+        entry[2] = None
+        entry[4] = None
+        self.shed += 1
+        log.debug("NTP check shed after waiting, %d running, %d shed so far",
+                  self.running, self.shed)
+        d.errback(OverloadedError())
+
+
+_admission = None
+
+
+def getAdmission(limit):
+    """
+    Return collector-wide admission controller with given limit.
+    """
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController(limit)
+    elif _admission.limit != limit:
+        _admission.limit = max(int(limit), 1)
+        _admission.admit()
+    return _admission
@@ -0,0 +1,311 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Capture of NTP exchanges and their deterministic replay.
+
+Capture file starts with CAPTURE_MAGIC followed by records of
+CAPTURE_RECORD header (time, session, kind, length of host, length of
+data), host and data. Every exchange is a CAPTURE_START record with its
+parameters as JSON and CAPTURE_SENT/CAPTURE_RECEIVED records with the
+datagrams. Exchanges are numbered from 1 in every process appending to
+the file, so each process first writes a CAPTURE_PROCESS record with
+its pid and start time, which scopes the numbers of its exchanges.
+
+Replay feeds captured datagrams to NtpSession at their recorded times
+under a simulated clock, so timeouts and fragmentation reproduce
+exactly, and checks that requests are the same as captured ones:
+
+    python -m ZenPacks.zenoss.NtpMonitor.capture capture.bin
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from optparse import OptionParser
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+from ZenPacks.zenoss.NtpMonitor.session import NtpSession, formatResult, \
+    ACTION_SEND, ACTION_TIMER, ACTION_CANCEL, ACTION_RESULT, ACTION_ERROR
+from ZenPacks.zenoss.NtpMonitor.timerwheel import TimerWheel
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+CAPTURE_MAGIC = "NTPCAP\x00\x01"
+CAPTURE_RECORD = struct.Struct("!dIBBH")
+CAPTURE_START = 0
+CAPTURE_SENT = 1
+CAPTURE_RECEIVED = 2
+CAPTURE_PROCESS = 3
+CAPTURE_LIMIT = 64 * 1024 * 1024
+CAPTURE_FILE = ("var", "ntpmonitor", "capture.bin")
+
+
+class CaptureWriter(object):
+    """
+    Appends records to capture file until its size reaches the limit.
+    """
+    def __init__(self, path, maxBytes=CAPTURE_LIMIT, clock=time.time):
+        """
+        Initialize CaptureWriter.
+        :param path: path of capture file
+        :param maxBytes: maximal size of capture file
+        :param clock: function returning current time in seconds
+        """
+        self.path = path
+        self.maxBytes = maxBytes
+        self.clock = clock
+        self.file = None
+        self.size = 0
+        self.sessionCounter = 0
+        self.full = False
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+        if not self.size:
+            self.file.write(CAPTURE_MAGIC)
+            self.size = len(CAPTURE_MAGIC)
+
+    def start(self, host, params):
+        """
+        Record start of an exchange.
+        :param params: port, timeout, thresholds and check state of the
+            exchange
+        :return: ID of the exchange for its records
+        :rtype: int
+        """
+        self.sessionCounter += 1
+        self.record(self.sessionCounter, CAPTURE_START, host,
+                    json.dumps(params))
+        return self.sessionCounter
+
+    def record(self, session, kind, host, data):
+        if self.full:
+            return
+        try:
+            if self.file is None:
+                self.open()
+                self.write(0, CAPTURE_PROCESS, "", json.dumps({
+                    "pid": os.getpid(),
+                    "started": self.clock()
+                }))
+            self.write(session, kind, host, data)
+        except (IOError, OSError) as ex:
+            log.warn("Unable to write NTP capture %s: %s", self.path, ex)
+            self.full = True
+
+    def write(self, session, kind, host, data):
+        if self.full:
+            return
+        host = str(host or "")[:255]
+        size = CAPTURE_RECORD.size + len(host) + len(data)
+        if self.size + size > self.maxBytes:
+            log.warn("NTP capture %s reached %d bytes, capture stopped",
+                     self.path, self.maxBytes)
+            self.full = True
+            self.close()
+            return
+        self.file.write(CAPTURE_RECORD.pack(
+            self.clock(), session, kind, len(host), len(data)
+        ) + host + data)
+        self.file.flush()
+        self.size += size
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def readCapture(stream):
+    """
+    Read records of capture file.
+    :param stream: file object opened in binary mode
+    :return: generator of (time, session, kind, host, data) tuples
+    """
+    if stream.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+        raise NtpException("Not an NTP capture file")
+    while True:
+        header = stream.read(CAPTURE_RECORD.size)
+        if len(header) < CAPTURE_RECORD.size:
+            # end of file or record cut by the size limit
+            return
+        when, session, kind, hostSize, dataSize = \
+            CAPTURE_RECORD.unpack(header)
+        host = stream.read(hostSize)
+        data = stream.read(dataSize)
+        if len(data) < dataSize:
+            return
+        yield when, session, kind, host, data
+
+
+class ReplayDriver(object):
+    """
+    Drives NtpSession with captured datagrams under a simulated clock.
+    """
+    def __init__(self, tick=0.1):
+        self.now = 0.0
+        self.timers = TimerWheel(tick, clock=lambda: self.now)
+        # number of CAPTURE_PROCESS records seen, scope of session IDs
+        self.process = 0
+        # (process, session ID) -> [NtpSession, timeout timer, requests
+        # to compare]
+        self.sessions = {}
+        self.results = []
+        self.mismatches = 0
+
+    def feed(self, record):
+        """
+        Process one captured record.
+        """
+        when, sessionId, kind, host, data = record
+        self.advance(when)
+        if kind == CAPTURE_PROCESS:
+            # exchanges of the previous process ended with it
+            for state in self.sessions.values():
+                if state[1] is not None:
+                    state[1].cancel()
+            if self.sessions:
+                log.debug("%d exchanges unfinished at end of process",
+                          len(self.sessions))
+            self.sessions = {}
+            self.process += 1
+            return
+        sessionId = (self.process, sessionId)
+        if kind == CAPTURE_START:
+            params = json.loads(data)
+            session = NtpSession(
+                host, params.get("port"), params.get("timeout"),
+                params.get("warning"), params.get("critical")
+            )
+            # captures of older versions hold no check state
+            if "checkMode" in params:
+                session.checkMode = params["checkMode"]
+            session.lastEventCount = params.get("lastEventCount")
+            if "getvar" in params:
+                session.getvar = str(params["getvar"])
+            self.sessions[sessionId] = [session, None, []]
+            session.start()
+        elif sessionId not in self.sessions:
+            return
+        elif kind == CAPTURE_RECEIVED:
+            self.sessions[sessionId][0].datagramReceived(data, host)
+        elif kind == CAPTURE_SENT:
+            requests = self.sessions[sessionId][2]
+            if not requests or requests.pop(0) != data:
+                log.debug("Request of session %d.%d differs from capture",
+                          *sessionId)
+                self.mismatches += 1
+        self.handleActions(sessionId)
+
+    def advance(self, when):
+        if when <= self.now:
+            return
+        self.now = when
+        self.timers.advance()
+        for sessionId in self.sessions.keys():
+            self.handleActions(sessionId)
+
+    def handleActions(self, sessionId):
+        state = self.sessions.get(sessionId)
+        if state is None:
+            return
+        session = state[0]
+        for action, value in session.popActions():
+            if action == ACTION_SEND:
+                state[2].append(value)
+            elif action == ACTION_TIMER:
+                state[1] = self.timers.schedule(value, session.timeoutHandler)
+            elif action == ACTION_CANCEL:
+                if state[1] is not None:
+                    state[1].cancel()
+            elif action in (ACTION_RESULT, ACTION_ERROR):
+                if state[1] is not None:
+                    state[1].cancel()
+                del self.sessions[sessionId]
+                result = value if action == ACTION_RESULT else None
+                error = value if action == ACTION_ERROR else None
+                self.results.append((sessionId, result, error))
+                return
+
+    def run(self, records):
+        """
+        Replay records and let remaining exchanges time out.
+        :return: ((process, session ID), result, error) of finished
+            exchanges
+        :rtype: list
+        """
+        for record in records:
+            self.feed(record)
+        while self.sessions and len(self.timers):
+            self.advance(self.now + self.timers.tick)
+        return self.results
+
+
+_writer = None
+
+
+def getCaptureWriter():
+    """
+    Return capture writer shared by all NTP datasources of the collector.
+    """
+    global _writer
+    if _writer is None:
+        from Products.ZenUtils.Utils import zenPath
+        _writer = CaptureWriter(zenPath(*CAPTURE_FILE))
+    return _writer
+
+
+def main(argv=None, stdout=sys.stdout):
+    parser = OptionParser(usage="%prog [options] CAPTURE_FILE")
+    parser.add_option("-n", "--repeat", dest="repeat", type="int",
+                      default=1,
+                      help="replay the capture this many times "
+                           "[default: %default]")
+    parser.add_option("-v", "--verbose", dest="verbose",
+                      action="store_true", default=False,
+                      help="print result of every exchange")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("capture file is required")
+    with open(args[0], "rb") as stream:
+        records = list(readCapture(stream))
+
+    started = time.time()
+    for _ in range(max(options.repeat, 1)):
+        driver = ReplayDriver()
+        results = driver.run(records)
+    elapsed = time.time() - started
+
+    if options.verbose:
+        for (process, sessionId), result, error in results:
+            if error is not None:
+                output = "NTP CRITICAL: %s" % error
+            else:
+                output = formatResult(result)[2]
+            stdout.write("%d.%d %s\n" % (process, sessionId, output))
+    exchanges = len(results) * max(options.repeat, 1)
+    stdout.write(
+        "%d exchanges, %d failed, %d requests differ from capture, "
+        "%.0f exchanges/s\n" % (
+            len(results), sum(1 for r in results if r[2] is not None),
+            driver.mismatches, exchanges / max(elapsed, 1e-9)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
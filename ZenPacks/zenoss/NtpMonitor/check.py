@@ -0,0 +1,185 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Command line NTP checker.
+
+Checks all given hosts concurrently and prints one line per host as
+results arrive, either check_ntp compatible output with performance
+data or JSON. Exit code is the worst Nagios status of all hosts.
+"""
+
+import json
+import logging
+import re
+import sys
+from optparse import OptionParser
+from ZenPacks.zenoss.NtpMonitor.engine import NtpEngine
+from ZenPacks.zenoss.NtpMonitor.packet import STATE_OK, STATE_UNKNOWN, \
+    STATE_WARNING, STATE_CRITICAL
+from ZenPacks.zenoss.NtpMonitor.session import formatResult, CHECK_FULL, \
+    CHECK_STATUS, CHECK_CLIENT
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+# STATE_* ordering differs from Nagios exit codes
+NAGIOS_CODES = {
+    STATE_OK: 0,
+    STATE_WARNING: 1,
+    STATE_CRITICAL: 2,
+    STATE_UNKNOWN: 3
+}
+
+NAGIOS_NAMES = {
+    STATE_OK: "OK",
+    STATE_WARNING: "WARNING",
+    STATE_CRITICAL: "CRITICAL",
+    STATE_UNKNOWN: "UNKNOWN"
+}
+
+
+def buildParser():
+    parser = OptionParser(
+        usage="%prog [options] [host ...]",
+        description="Check offset of NTP servers with mode 6 queries. "
+                    "Hosts are read from arguments, --file or stdin."
+    )
+    parser.add_option("-f", "--file", dest="file",
+                      help="read hosts from FILE, one per line ('-' for stdin)")
+    parser.add_option("-p", "--port", dest="port", type="int", default=123,
+                      help="NTP server's port [default: %default]")
+    parser.add_option("-t", "--timeout", dest="timeout", type="float",
+                      default=60.0,
+                      help="seconds to wait for a reply [default: %default]")
+    parser.add_option("-w", "--warning", dest="warning", type="float",
+                      default=60.0,
+                      help="offset in seconds for WARNING [default: %default]")
+    parser.add_option("-c", "--critical", dest="critical", type="float",
+                      default=120.0,
+                      help="offset in seconds for CRITICAL [default: %default]")
+    parser.add_option("-j", "--parallel", dest="parallel", type="int",
+                      default=256,
+                      help="maximum number of hosts checked at once "
+                           "[default: %default]")
+    parser.add_option("-s", "--status-only", dest="checkMode",
+                      action="store_const", const=CHECK_STATUS,
+                      default=CHECK_FULL,
+                      help="judge servers by system status without "
+                           "reading offsets")
+    parser.add_option("-C", "--client", dest="checkMode",
+                      action="store_const", const=CHECK_CLIENT,
+                      help="measure servers' clocks against this host's "
+                           "with SNTP queries")
+    parser.add_option("-r", "--reference", dest="references",
+                      action="append", default=[],
+                      help="reference servers correcting this host's clock "
+                           "in client mode, separated by commas or spaces "
+                           "like the datasource's Reference Servers, may "
+                           "be repeated")
+    parser.add_option("--calibrate", dest="calibrate", action="store_true",
+                      default=True,
+                      help="correct client mode offsets by the reference "
+                           "servers' [default]")
+    parser.add_option("--no-calibrate", dest="calibrate",
+                      action="store_false",
+                      help="report client mode offsets against this host's "
+                           "clock as measured")
+    parser.add_option("--json", dest="json", action="store_true",
+                      default=False, help="print JSON line per host")
+    parser.add_option("-v", "--verbose", dest="verbose", action="store_true",
+                      default=False, help="log protocol's exchange")
+    return parser
+
+
+def readHosts(lines):
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            yield line
+
+
+def getHosts(options, args, stdin=sys.stdin):
+    hosts = list(args)
+    if options.file == "-":
+        hosts.extend(readHosts(stdin))
+    elif options.file:
+        with open(options.file) as hostsFile:
+            hosts.extend(readHosts(hostsFile))
+    elif not hosts and not stdin.isatty():
+        hosts.extend(readHosts(stdin))
+    return hosts
+
+
+def getReferences(options):
+    """
+    Return reference servers calibrating this host's clock.
+    """
+    if not options.calibrate:
+        return []
+    return [name for value in options.references
+            for name in re.split(r"[,\s]+", value) if name]
+
+
+def describe(host, result, error):
+    """
+    Return final status and JSON-ready description of a host's check.
+    """
+    if error is not None:
+        status = STATE_CRITICAL
+        output = "NTP CRITICAL: %s" % error
+        record = {"host": host, "error": str(error)}
+    else:
+        status, _, output = formatResult(result)
+        record = {
+            "host": host,
+            "offset": result["offset"],
+            "offsetKnown": result["offsetResult"] != STATE_UNKNOWN,
+            "syncSource": result["syncSource"],
+            "liAlarm": result["liAlarm"],
+        }
+    record["status"] = NAGIOS_NAMES[status]
+    record["output"] = output
+    return status, record
+
+
+def main(argv=None, stdin=sys.stdin, stdout=sys.stdout):
+    parser = buildParser()
+    options, args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if options.verbose else logging.WARNING
+    )
+    hosts = getHosts(options, args, stdin)
+    if not hosts:
+        parser.error("no hosts to check")
+
+    engine = NtpEngine(parallel=options.parallel)
+    references = getReferences(options)
+    if references:
+        engine.calibrate(references)
+    for host in hosts:
+        engine.submit(host, options.port, options.timeout, options.warning,
+                      options.critical, checkMode=options.checkMode)
+    worst = STATE_OK
+    try:
+        for host, result, error in engine.run():
+            status, record = describe(host, result, error)
+            worst = max(worst, status)
+            if options.json:
+                stdout.write(json.dumps(record, sort_keys=True) + "\n")
+            else:
+                stdout.write("%s: %s\n" % (host, record["output"]))
+            stdout.flush()
+    finally:
+        engine.close()
+    return NAGIOS_CODES[worst]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+I/O-free check of chronyd over its command protocol (cmdmon).
+
+chronyd does not answer NTP mode 6 control messages. ChronySession
+sends the tracking and n_sources requests of protocol version 6 at once
+and builds a result compatible with NtpSession's from their replies, in
+a single round trip. chronyd answers only hosts allowed by its
+cmdallow directive, on UDP port 323.
+
+Layout of packets follows chrony's candm.h. Requests are padded to the
+length of their replies, otherwise chronyd drops them.
+"""
+
+import logging
+import math
+import random
+import struct
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException, STATE_OK, \
+    STATE_UNKNOWN, STATE_WARNING
+from ZenPacks.zenoss.NtpMonitor.session import NtpSession, \
+    ACTION_SEND, ACTION_TIMER, ACTION_CANCEL
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+CHRONY_PORT = 323
+PROTO_VERSION = 6
+PKT_TYPE_CMD_REQUEST = 1
+PKT_TYPE_CMD_REPLY = 2
+
+REQ_N_SOURCES = 14
+REQ_TRACKING = 33
+RPY_N_SOURCES = 2
+RPY_TRACKING = 5
+
+# version, type, res1, res2, command, attempt, sequence, pad1, pad2
+REQUEST_HEADER = struct.Struct("!BBBBHHIII")
+# version, type, res1, res2, command, reply, status, pad1-3, sequence,
+# pad4, pad5
+REPLY_HEADER = struct.Struct("!BBBBHHHHHHIII")
+# n_sources, EOR
+N_SOURCES_DATA = struct.Struct("!Ii")
+# ref_id, ip_addr (16 bytes, family, pad), stratum, leap_status,
+# ref_time (3 x uint32), 9 x Float, EOR
+TRACKING_DATA = struct.Struct("!I16sHHHH3I9Ii")
+
+STATUS_MAP = {
+    1: "request failed",
+    2: "not authorised",
+    3: "invalid request",
+    6: "not enabled",
+    10: "no command access from this host",
+    18: "unsupported protocol version",
+    19: "bad packet length"
+}
+
+LEAP_UNSYNCHRONIZED = 3
+
+FLOAT_EXP_BITS = 7
+FLOAT_COEF_BITS = 25
+MAX_FLOAT_EXP = (1 << (FLOAT_EXP_BITS - 1)) - 1
+MIN_FLOAT_EXP = -(1 << (FLOAT_EXP_BITS - 1))
+MAX_FLOAT_COEF = (1 << (FLOAT_COEF_BITS - 1)) - 1
+
+
+def decodeFloat(value):
+    """
+    Decode chrony's Float: 7-bit signed exponent and 25-bit signed
+    coefficient.
+    :param value: 32-bit unsigned integer in host order
+    :rtype: float
+    """
+    exp = value >> FLOAT_COEF_BITS
+    if exp >= 1 << (FLOAT_EXP_BITS - 1):
+        exp -= 1 << FLOAT_EXP_BITS
+    exp -= FLOAT_COEF_BITS
+    coef = value % (1 << FLOAT_COEF_BITS)
+    if coef >= 1 << (FLOAT_COEF_BITS - 1):
+        coef -= 1 << FLOAT_COEF_BITS
+    return coef * math.pow(2.0, exp)
+
+
+def encodeFloat(x):
+    """
+    Encode float to chrony's Float, as chronyd does.
+    :return: 32-bit unsigned integer in host order
+    :rtype: int
+    """
+    if x == 0:
+        exp = coef = 0
+    else:
+        negative = x < 0
+        _, exp = math.frexp(abs(x))
+        coef = int(abs(x) * math.pow(2.0, FLOAT_COEF_BITS - 1 - exp) + 0.5)
+        exp += 1
+        if coef > MAX_FLOAT_COEF:
+            coef >>= 1
+            exp += 1
+        if exp > MAX_FLOAT_EXP:
+            exp, coef = MAX_FLOAT_EXP, MAX_FLOAT_COEF
+        elif exp < MIN_FLOAT_EXP:
+            if exp + FLOAT_COEF_BITS >= MIN_FLOAT_EXP:
+                coef >>= MIN_FLOAT_EXP - exp
+                exp = MIN_FLOAT_EXP
+            else:
+                exp = coef = 0
+        if negative:
+            coef = -coef % (1 << FLOAT_COEF_BITS)
+    return (exp % (1 << FLOAT_EXP_BITS)) << FLOAT_COEF_BITS | coef
+
+
+def buildRequest(command, sequence, replySize):
+    """
+    Return cmdmon request without data, padded to the reply's size.
+    """
+    header = REQUEST_HEADER.pack(
+        PROTO_VERSION, PKT_TYPE_CMD_REQUEST, 0, 0, command, 0, sequence,
+        0, 0
+    )
+    return header + "\x00" * max(replySize - len(header), 0)
+
+
+class ChronySession(NtpSession):
+    """
+    Sans-IO check of chronyd's tracking state.
+    """
+    __slots__ = ("sequence", "pending", "tracking", "sources")
+    DEFAULT_PORT = CHRONY_PORT
+
+    def __init__(self, host=None, port=None, timeout=None, warning=None,
+                 critical=None):
+        NtpSession.__init__(self, host, port, timeout, warning, critical)
+        self.sequence = random.randint(0, 0xfffffff0)
+        # sequence number -> command of unanswered request
+        self.pending = {}
+        self.tracking = None
+        self.sources = None
+
+    def start(self):
+        if not self.host:
+            self.fail(NtpException("Host is not specified. Please check hostname"))
+            return
+        log.debug("Chrony check started for %s on port %d", self.host,
+                  self.port)
+        for command, replySize in (
+                (REQ_TRACKING, REPLY_HEADER.size + TRACKING_DATA.size),
+                (REQ_N_SOURCES, REPLY_HEADER.size + N_SOURCES_DATA.size)):
+            self.sequence += 1
+            self.pending[self.sequence] = command
+            self.emit(ACTION_SEND,
+                      buildRequest(command, self.sequence, replySize))
+        self.emit(ACTION_TIMER, self.timeout)
+
+    def timeoutHandler(self):
+        if self.finished:
+            return
+        log.info("Timeout. No response from chronyd after %.2fs",
+                 self.timeout)
+        # chronyd silently ignores hosts not allowed by cmdallow
+        self.fail(NtpException(
+            "Timeout. No response from chronyd, check its cmdallow setting"
+        ))
+
+    def datagramReceived(self, data, addr=None):
+        if self.finished:
+            log.debug("Exchange already finished, ignoring datagram")
+            return
+        try:
+            (version, pktType, _, _, command, reply, status, _, _, _,
+             sequence, _, _) = REPLY_HEADER.unpack_from(data)
+        except struct.error:
+            log.debug("Short cmdmon reply from %s", addr)
+            return
+        if version != PROTO_VERSION or pktType != PKT_TYPE_CMD_REPLY or \
+                self.pending.get(sequence) != command:
+            log.debug("Unexpected cmdmon reply from %s", addr)
+            return
+        del self.pending[sequence]
+        if status:
+            self.emit(ACTION_CANCEL)
+            self.fail(NtpException("chronyd refused request: %s" % (
+                STATUS_MAP.get(status, "status %d" % status)
+            )))
+            return
+        try:
+            if reply == RPY_TRACKING:
+                self.tracking = TRACKING_DATA.unpack_from(
+                    data, REPLY_HEADER.size
+                )
+            elif reply == RPY_N_SOURCES:
+                self.sources = N_SOURCES_DATA.unpack_from(
+                    data, REPLY_HEADER.size
+                )[0]
+        except struct.error:
+            self.emit(ACTION_CANCEL)
+            self.fail(NtpException("Invalid packet received from chronyd"))
+            return
+        if not self.pending:
+            self.emit(ACTION_CANCEL)
+            self.finish(self.getResult())
+
+    def getResult(self):
+        """
+        Return result of the check, NtpSession's result with chrony's
+        stratum, skew, frequency and number of sources.
+        :rtype: dict
+        """
+        values = {}
+        if self.tracking is not None:
+            refId, stratum, leap = \
+                self.tracking[0], self.tracking[4], self.tracking[5]
+            (correction, lastOffset, rmsOffset, frequency, _, skew, _, _,
+             _) = [decodeFloat(value) for value in self.tracking[9:18]]
+            self.syncSource = bool(refId) and leap != LEAP_UNSYNCHRONIZED
+            self.liAlarm = leap == LEAP_UNSYNCHRONIZED
+            if self.syncSource:
+                # positive when the system clock is behind NTP time
+                self.offset = correction
+                self.offsetResult = STATE_OK
+            values = {
+                "stratum": stratum,
+                "skew": skew,
+                "frequency": frequency,
+                "lastOffset": lastOffset,
+                "rmsOffset": rmsOffset
+            }
+        self.status = STATE_OK
+        if not self.syncSource or self.liAlarm:
+            self.status = STATE_WARNING
+        if self.offsetResult != STATE_UNKNOWN:
+            self.status = max(self.status, self.getProcessedOffset())
+        result = NtpSession.getResult(self)
+        result.update(values)
+        if self.sources is not None:
+            result["sources"] = self.sources
+        return result
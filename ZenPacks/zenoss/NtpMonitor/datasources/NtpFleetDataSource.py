@@ -0,0 +1,99 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+NtpFleetDataSource.py
+
+Defines datasource storing the summary of NTP checks of the collector
+"""
+
+import logging
+from twisted.internet.defer import succeed, fail
+from ZenPacks.zenoss.PythonCollector.datasources.PythonDataSource import \
+    PythonDataSource, PythonDataSourcePlugin
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+from Products.ZenEvents import ZenEventClasses
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+FLEET_EVENT_KEY = "NtpMonitorFleet"
+
+
+class NtpFleetDataSource(PythonDataSource):
+    """
+    Datasource for summary of NtpMonitor checks run by the collector
+    monitoring the device.
+    """
+    ZENPACKID = "ZenPacks.zenoss.NtpMonitor"
+    NTP_FLEET = "NtpFleet"
+
+    sourcetypes = (NTP_FLEET,)
+    sourcetype = NTP_FLEET
+
+    plugin_classname = (
+        "ZenPacks.zenoss.NtpMonitor.datasources."
+        "NtpFleetDataSource.NtpFleetDataSourcePlugin"
+    )
+
+    eventClass = "/Status/Ntp/Fleet"
+    eventKey = FLEET_EVENT_KEY
+
+
+class NtpFleetDataSourcePlugin(PythonDataSourcePlugin):
+    """
+    Datasource plugin storing the collector's summary of NTP checks as
+    datapoints of the device. An event is raised while not all servers
+    are OK.
+    """
+    def __init__(self, *args, **kwargs):
+        super(NtpFleetDataSourcePlugin, self).__init__(*args, **kwargs)
+        # severity of the previous summary, None until the first one
+        self.lastSeverity = None
+
+    def collect(self, config):
+        try:
+            from ZenPacks.zenoss.NtpMonitor.fleet import getFleetSummary
+        except ImportError as ex:
+            return fail(NtpException("NTP fleet summary unavailable: %s" % ex))
+        return succeed(getFleetSummary().compute())
+
+    def onSuccess(self, summary, config):
+        data = self.new_data()
+        if not summary["targets"]:
+            # no NtpMonitor check run by this collector yet
+            return data
+        data["values"][None].update(summary)
+
+        text = "NTP fleet: %d servers, %d not OK, %d unsynchronized, " \
+            "%d timeouts" % (summary["targets"],
+                             summary["targets"] - summary["ok"],
+                             summary["unsynchronized"], summary["timeouts"])
+        if "offset_p50" in summary:
+            text += ", offset median %.6f secs, 95th percentile %.6f secs" % (
+                summary["offset_p50"], summary["offset_p95"]
+            )
+        log.info(text)
+        severity = ZenEventClasses.Clear
+        if summary["ok"] < summary["targets"]:
+            severity = ZenEventClasses.Warning
+        # all servers OK, only the first summary and recovery clear
+        if severity != ZenEventClasses.Clear or \
+                self.lastSeverity != ZenEventClasses.Clear:
+            datasource = config.datasources[0]
+            data["events"].append({
+                "eventKey": datasource.eventKey or FLEET_EVENT_KEY,
+                "summary": text,
+                "message": text,
+                "device": config.id,
+                "eventClass": datasource.eventClass,
+                "severity": severity
+            })
+        self.lastSeverity = severity
+        return data
@@ -11,20 +11,102 @@
 NtpMonitorDataSource.py
 
 Defines datasource for NtpMonitor
+
+zenhub imports this module for the datasource class only. Modules
+needed by collection alone (numpy history, SQLite state, worker pool,
+Zenoss IP utilities) are imported by the plugin on first use.
 """
 
+import importlib
 import logging
-from twisted.internet.defer import Deferred
+import re
+import time
+from twisted.internet.defer import DeferredList, succeed
 from ZenPacks.zenoss.PythonCollector.datasources.PythonDataSource import \
     PythonDataSource, PythonDataSourcePlugin
-from ZenPacks.zenoss.NtpMonitor.ntp import NtpProtocol, NtpController, \
-    STATUS_MAP, STATE_UNKNOWN, STATE_CRITICAL, STATE_WARNING
+from ZenPacks.zenoss.NtpMonitor.ntp import NtpProtocol, execute, STATE_OK, \
+    STATE_UNKNOWN, STATE_CRITICAL
+from ZenPacks.zenoss.NtpMonitor.session import formatResult, \
+    combineResults, POLICY_BEST, CHECK_FULL, CHECK_CLIENT
+from ZenPacks.zenoss.NtpMonitor.detect import OffsetDetector
+from ZenPacks.zenoss.NtpMonitor.schedule import PollSchedule
+from ZenPacks.zenoss.NtpMonitor.profiling import getProfiler, profiled
+from ZenPacks.zenoss.NtpMonitor.admission import OverloadedError
 from Products.ZenEvents import ZenEventClasses
-from Products.ZenUtils.IpUtil import getHostByName
 
 
 log = logging.getLogger("zen.NtpMonitor")
 
+TREND_EVENT_CLASS = "/Status/Ntp/Trend"
+PROFILE_FILE = ("var", "ntpmonitor", "profile.pstats")
+ENGINE_NTP = "ntp"
+ENGINE_CHRONY = "chrony"
+# properties passed to collect(), left out while literal and equal to
+# the default
+PARAMS = ("hostname", "port", "warning", "critical", "timeout", "workers",
+          "heartbeat", "maxInterval", "policy", "quorum", "capture",
+          "profiling", "engine", "checkMode", "references", "maxSessions")
+# deviation from expected offset, in standard deviations, still stable
+STABLE_SIGMAS = 3.0
+# servers checked by one datasource, one offset_N datapoint each
+MAX_SERVERS = 3
+# timeouts after which a check which did not finish frees its slot
+WATCHDOG_TIMEOUTS = 3
+
+
+# modules of optional features whose dependencies are missing
+_unavailable = set()
+
+
+def loadOptional(name):
+    """
+    Import module of an optional feature, which needs numpy.
+    :return: the module, or None if its dependencies are missing
+    """
+    if name in _unavailable:
+        return None
+    try:
+        return importlib.import_module(name)
+    except ImportError as ex:
+        log.warn("%s is disabled: %s", name, ex)
+        _unavailable.add(name)
+        return None
+
+
+def getNumber(value, default=0, kind=int):
+    """
+    Return non-negative number from datasource's parameter or default.
+    """
+    try:
+        return max(kind(value), 0)
+    except (ValueError, TypeError):
+        return default
+
+
+def isLiteral(value):
+    """
+    Return True if datasource's property holds no TALES expression.
+    """
+    return not isinstance(value, basestring) or "$" not in value
+
+
+def getParam(datasource, name):
+    """
+    Return parameter of datasource's config, or default of the property
+    if params() left it out.
+    """
+    return datasource.params.get(name, getattr(NtpMonitorDataSource, name))
+
+
+def getHostnames(value, limit=None):
+    """
+    Return hostnames listed in datasource's parameter, separated by
+    commas or whitespace.
+    :param limit: maximal number of hostnames returned, all if None
+    """
+    names = [name for name in re.split(r"[,\s]+", str(value or "")) if name]
+    return names[:limit]
+
 
 class NtpMonitorDataSource(PythonDataSource):
     """
@@ -48,6 +130,18 @@ class NtpMonitorDataSource(PythonDataSource):
     port = 123
     warning = 60
     critical = 120
+    workers = 0
+    heartbeat = 3600
+    # adaptive intervals are opt-in, 0 probes every cycle
+    maxInterval = 0
+    policy = POLICY_BEST
+    quorum = 1
+    capture = False
+    profiling = False
+    engine = ENGINE_NTP
+    checkMode = CHECK_FULL
+    references = ""
+    maxSessions = 1000
 
     _properties = PythonDataSource._properties + (
         {"id": "hostname", "type": "string", "mode": "w"},
@@ -55,6 +149,17 @@ class NtpMonitorDataSource(PythonDataSource):
         {"id": "warning", "type": "string", "mode": "w"},
         {"id": "critical", "type": "string", "mode": "w"},
         {"id": "timeout", "type": "int", "mode": "w"},
+        {"id": "workers", "type": "int", "mode": "w"},
+        {"id": "heartbeat", "type": "int", "mode": "w"},
+        {"id": "maxInterval", "type": "int", "mode": "w"},
+        {"id": "policy", "type": "string", "mode": "w"},
+        {"id": "quorum", "type": "int", "mode": "w"},
+        {"id": "capture", "type": "boolean", "mode": "w"},
+        {"id": "profiling", "type": "boolean", "mode": "w"},
+        {"id": "engine", "type": "string", "mode": "w"},
+        {"id": "checkMode", "type": "string", "mode": "w"},
+        {"id": "references", "type": "string", "mode": "w"},
+        {"id": "maxSessions", "type": "int", "mode": "w"},
     )
 
 
@@ -62,97 +167,441 @@ class NtpMonitorDataSourcePlugin(PythonDataSourcePlugin):
     """
     Datasource plugin for NTP protocol.
     """
+    # production state and priority order admission of checks
+    proxy_attributes = ("getProductionState", "getPriority")
+
+    def __init__(self, *args, **kwargs):
+        super(NtpMonitorDataSourcePlugin, self).__init__(*args, **kwargs)
+        # (device, eventKey) -> (state, time of sending)
+        self.lastEvents = {}
+        self.historyRow = None
+        self.detector = OffsetDetector()
+        self.schedule = PollSchedule()
+        self.lastState = None
+        # hostname -> variables accepted by READVAR
+        self.capabilities = {}
+        # hostname -> system event counter seen by previous check
+        self.eventCounts = {}
+        self.store = None
+        self.stateKey = None
+        self.fleet = None
+        self.priority = ()
+
     @classmethod
     def params(cls, datasource, context):
-        params = {
-            "hostname": datasource.talesEval(datasource.hostname, context),
-            "port": datasource.talesEval(datasource.port, context),
-            "warning": datasource.talesEval(datasource.warning, context),
-            "critical": datasource.talesEval(datasource.critical, context),
-            "timeout": datasource.talesEval(datasource.timeout, context),
-            "eventKey": datasource.talesEval(datasource.eventKey, context),
-            "eventClass": datasource.talesEval(datasource.eventClass, context)
-        }
+        params = {}
+        # TALES expression -> value, each evaluated once per datasource
+        evaluated = {}
+        for name in PARAMS:
+            value = getattr(datasource, name)
+            if isLiteral(value):
+                if value != getattr(NtpMonitorDataSource, name):
+                    params[name] = value
+                continue
+            if value not in evaluated:
+                evaluated[value] = datasource.talesEval(value, context)
+            params[name] = evaluated[value]
         return params
 
+    @profiled("NtpMonitorDataSourcePlugin.collect")
     def collect(self, config):
         ds0 = config.datasources[0]
+        if getParam(ds0, "profiling") is True:
+            from Products.ZenUtils.Utils import zenPath
+            getProfiler().request(zenPath(*PROFILE_FILE))
+        if self.stateKey is None:
+            self.restoreState(config)
+        floor = getNumber(ds0.cycletime, 300, float)
+        if not self.schedule.isDue(time.time(), floor):
+            log.debug("Skipping NTP check of %s, stable for %s secs",
+                      config.id, self.schedule.interval)
+            return succeed(None)
+
+        self.priority = self.getPriority(config)
+        hostnames = getHostnames(getParam(ds0, "hostname"), MAX_SERVERS)
+        if len(hostnames) < 2:
+            return self.checkServer(ds0, hostnames[0] if hostnames else None)
+
+        # all servers are checked at once, results are combined
+        policy = getParam(ds0, "policy") or POLICY_BEST
+        quorum = getNumber(getParam(ds0, "quorum"), 1)
+        d = DeferredList(
+            [self.checkServer(ds0, hostname) for hostname in hostnames],
+            consumeErrors=True
+        )
+
+        def combine(results):
+            if not any(success for success, _ in results):
+                return results[0][1]
+            return combineResults(
+                [value if success else None for success, value in results],
+                policy, quorum
+            )
+        return d.addCallback(combine)
+
+    def getPriority(self, config):
+        """
+        Return admission priority of the device's checks, lowest first:
+        targets not known to be healthy, then by production state and
+        priority of the device.
+        """
+        # proxy_attributes are set on the datasources' configs
+        datasource = config.datasources[0]
+        healthy = self.lastState is not None and \
+            self.lastState[0] == ZenEventClasses.Clear
+        return (
+            healthy,
+            -getNumber(getattr(datasource, "getProductionState", None)),
+            -getNumber(getattr(datasource, "getPriority", None))
+        )
+
+    def checkServer(self, datasource, hostname):
+        """
+        Run NTP check of one server once the collector's admission
+        controller lets it start. Checks which cannot start before the
+        end of their cycle less the timeout are shed.
+        :return: Deferred firing with NtpSession's result, or failing
+            with OverloadedError
+        :rtype: Deferred
+        """
+        limit = getNumber(getParam(datasource, "maxSessions"))
+        if not limit:
+            return self.startCheck(datasource, hostname)
+        from ZenPacks.zenoss.NtpMonitor.admission import getAdmission
+        cycle = getNumber(datasource.cycletime, 300, float)
+        timeout = getNumber(getParam(datasource, "timeout"),
+                            NtpMonitorDataSource.timeout, float)
+        return getAdmission(limit).submit(
+            lambda: self.startCheck(datasource, hostname), self.priority,
+            max(cycle - timeout, 0), WATCHDOG_TIMEOUTS * timeout
+        )
+
+    def startCheck(self, datasource, hostname):
+        """
+        Run NTP check of one server.
+        :return: Deferred firing with NtpSession's result
+        :rtype: Deferred
+        """
+        from Products.ZenUtils.IpUtil import getHostByName
         try:
-            hostname = getHostByName(ds0.params["hostname"])
+            hostname = getHostByName(hostname)
         except Exception:
             hostname = None
-        port = ds0.params["port"]
-        timeout = ds0.params["timeout"]
-        warning = ds0.params["warning"]
-        critical = ds0.params["critical"]
+        port = getParam(datasource, "port")
+        timeout = getParam(datasource, "timeout")
+        warning = getParam(datasource, "warning")
+        critical = getParam(datasource, "critical")
+
+        if getParam(datasource, "engine") == ENGINE_CHRONY:
+            from ZenPacks.zenoss.NtpMonitor.chrony import CHRONY_PORT
+            from ZenPacks.zenoss.NtpMonitor.protocols import ChronyProtocol
+            if str(port) == str(NtpMonitorDataSource.port):
+                # default NTP port left in place, use chronyd's one
+                port = CHRONY_PORT
+            return execute(ChronyProtocol(
+                hostname, port, timeout, warning, critical
+            ))
+
+        checkMode = getParam(datasource, "checkMode") or CHECK_FULL
+        if checkMode == CHECK_CLIENT:
+            from ZenPacks.zenoss.NtpMonitor.protocols import SntpProtocol, \
+                getCalibrator
+            protocol = SntpProtocol(hostname, port, timeout, warning,
+                                    critical)
+            references = getHostnames(getParam(datasource, "references"))
+            if references:
+                calibrator = getCalibrator()
+                calibrator.addReferences(references)
+                protocol.calibration = calibrator.calibration
+                return calibrator.whenReady().addCallback(
+                    lambda _: execute(protocol)
+                )
+            return execute(protocol)
+
+        lastEventCount = self.eventCounts.get(hostname)
+
+        def rememberEvents(result):
+            systemStatus = result.get("systemStatus")
+            if systemStatus:
+                self.eventCounts[hostname] = systemStatus["eventCount"]
+            return result
+
+        workers = getNumber(getParam(datasource, "workers"))
+        if workers:
+            from ZenPacks.zenoss.NtpMonitor.pool import getWorkerPool
+            pool = getWorkerPool(workers)
+            return pool.check(
+                hostname, port, timeout, warning, critical,
+                checkMode, lastEventCount
+            ).addCallback(rememberEvents)
 
         protocol = NtpProtocol(hostname, port, timeout, warning, critical)
-        controller = NtpController()
+        protocol.getvar = self.capabilities.get(hostname, protocol.getvar)
+        protocol.checkMode = checkMode
+        protocol.lastEventCount = lastEventCount
+        if getParam(datasource, "capture") is True:
+            from ZenPacks.zenoss.NtpMonitor.capture import getCaptureWriter
+            protocol.capture = getCaptureWriter()
+
+        def remember(result):
+            self.capabilities[hostname] = protocol.getvar
+            return result
+        d = execute(protocol).addBoth(remember)
+        return d.addCallback(rememberEvents)
+
+    def restoreState(self, config):
+        """
+        Load state of the target kept by previous run of the collector.
+        """
+        self.stateKey = "%s/%s" % (config.id, config.datasources[0].datasource)
+        if self.store is None:
+            from ZenPacks.zenoss.NtpMonitor.state import getStateStore
+            self.store = getStateStore()
+        state = self.store.get(self.stateKey)
+        if not state:
+            return
+        log.debug("Restoring NTP state of %s", self.stateKey)
+        try:
+            for device, eventKey, eventState, sent in state["events"]:
+                self.lastEvents[(device, eventKey)] = (tuple(eventState), sent)
+            self.detector.setState(state["detector"])
+            self.schedule.setState(state["schedule"])
+            if state["lastState"] is not None:
+                self.lastState = tuple(state["lastState"])
+            self.capabilities.update(state["capabilities"])
+            self.eventCounts.update(state.get("eventCounts") or {})
+        except (KeyError, TypeError, ValueError) as ex:
+            log.debug("Invalid NTP state of %s: %s", self.stateKey, ex)
+
+    def saveState(self):
+        """
+        Pass state of the target to the store, if it was restored.
+        """
+        if self.stateKey is None:
+            return
+        self.store.put(self.stateKey, {
+            "events": [
+                [device, eventKey, eventState, sent]
+                for (device, eventKey), (eventState, sent)
+                in self.lastEvents.iteritems()
+            ],
+            "detector": self.detector.getState(),
+            "schedule": self.schedule.getState(),
+            "lastState": self.lastState,
+            "capabilities": self.capabilities,
+            "eventCounts": self.eventCounts
+        })
 
-        d = Deferred()
-        d.addCallback(controller.success)
-        d.addErrback(controller.failure)
-        protocol.d = d
+    def addEvent(self, data, config, event, state):
+        """
+        Append event unless the same state of device was already sent
+        within datasource's heartbeat interval.
+        :param event: event to send
+        :param state: values distinguishing the event from previous one
+        """
+        datasource = config.datasources[0]
+        heartbeat = getNumber(
+            getParam(datasource, "heartbeat"),
+            NtpMonitorDataSource.heartbeat, float
+        )
+        key = (event["device"], event["eventKey"])
+        now = time.time()
+        last = self.lastEvents.get(key)
+        if heartbeat and last and last[0] == state and \
+                now - last[1] < heartbeat:
+            log.debug("State of %s did not change, event not sent",
+                      event["device"])
+            return
+        self.lastEvents[key] = (state, now)
+        data["events"].append(event)
+
+    def getStability(self, datasource, offset):
+        """
+        Record offset in collector's history and return stability
+        statistics of this datasource.
+        """
+        module = loadOptional("ZenPacks.zenoss.NtpMonitor.history")
+        if module is None:
+            return {}
+        history = module.getOffsetHistory()
+        if self.historyRow is None:
+            self.historyRow = history.allocate()
+        now = time.time()
+        history.add(self.historyRow, now, offset)
+        interval = getNumber(datasource.cycletime, 300, float)
+        return history.getStats(self.historyRow, now, interval)
 
-        controller.start(protocol)
+    def isSteady(self, offset):
+        """
+        Return True if offset is within the noise the detector expects.
+        """
+        detector = self.detector
+        return detector.count >= detector.WARMUP and \
+            detector.trend is None and \
+            abs(offset - detector.mean) <= STABLE_SIGMAS * detector.sigma
 
-        return d
+    def reschedule(self, config, state, stable):
+        """
+        Plan the next probe of the target after a check.
+        :param state: values distinguishing the check from previous one
+        :param stable: True if offset was steady
+        """
+        datasource = config.datasources[0]
+        floor = getNumber(datasource.cycletime, 300, float)
+        ceiling = getNumber(
+            getParam(datasource, "maxInterval"),
+            NtpMonitorDataSource.maxInterval, float
+        )
+        reset = state != self.lastState
+        self.lastState = state
+        interval = self.schedule.update(
+            time.time(), floor, ceiling, stable, reset
+        )
+        log.debug("Next NTP check of %s in %s secs", config.id, interval)
 
+    def addTrendEvent(self, data, config, eventKey, offset):
+        """
+        Feed offset to trend detector and report start and end of trends.
+        :return: detected trend or None
+        """
+        trend = self.detector.update(offset)
+        eventKey = "%sTrend" % eventKey
+        if trend is None and (config.id, eventKey) not in self.lastEvents:
+            return
+        if trend:
+            severity = ZenEventClasses.Warning
+            summary = "NTP offset trending %s: %.10g secs (expected " \
+                "%.10g +/- %.3g secs)" % (trend, offset, self.detector.mean,
+                                          self.detector.sigma)
+        else:
+            severity = ZenEventClasses.Clear
+            summary = "NTP offset trend returned to normal"
+        self.addEvent(data, config, {
+            "eventKey": eventKey,
+            "summary": summary,
+            "message": summary,
+            "device": config.id,
+            "eventClass": TREND_EVENT_CLASS,
+            "severity": severity
+        }, (severity, trend))
+        return trend
+
+    def addFleetSummary(self, config, status, offset=None,
+                        synchronized=False, timeout=False):
+        """
+        Record check in collector's fleet summary, stored by NtpFleet
+        datasources.
+        """
+        if self.fleet is None:
+            module = loadOptional("ZenPacks.zenoss.NtpMonitor.fleet")
+            if module is None:
+                return
+            self.fleet = module.getFleetSummary()
+        datasource = config.datasources[0]
+        self.fleet.add("%s/%s" % (config.id, datasource.datasource), status,
+                       offset, synchronized, timeout)
+
+    @profiled("NtpMonitorDataSourcePlugin.onSuccess")
     def onSuccess(self, result, config):
         data = self.new_data()
+        if result is None:
+            # probe skipped by the schedule
+            return data
         datasource = config.datasources[0]
         eventKey = datasource.eventKey or "NtpMonitor"
         severity = ZenEventClasses.Error
 
-        if result["offsetResult"] == STATE_UNKNOWN:
-            result["status"] = STATE_CRITICAL
-        summary = STATUS_MAP.get(result["status"], "NTP UNKNOWN:")
-        if not result["syncSource"]:
-            summary += " Server not synchronized"
-        elif result["liAlarm"]:
-            summary += " Server has the LI_ALARM bit set"
-        if result["offsetResult"] == STATE_UNKNOWN:
-            summary += " Offset unknown"
-        elif result["status"] == STATE_WARNING:
-            summary += " Offset %.10g secs (WARNING)" % result["offset"]
-        elif result["status"] == STATE_CRITICAL:
-            summary += " Offset %.10g secs (CRITICAL)" % result["offset"]
-        else:
-            summary += " Offset %.10g secs" % result["offset"]
+        status, summary, output = formatResult(result)
+        stable = False
         if result["offsetResult"] != STATE_UNKNOWN:
-            output = summary + "|offset=%.10gs;%.6f;%.6f;" % (
-                result["offset"], result["warning"], result["critical"]
-            )
             severity = ZenEventClasses.Clear
+            stable = self.isSteady(result["offset"])
             data["values"][None]["offset"] = result["offset"]
-        else:
-            output = summary
+            for name in ("skew", "stratum"):
+                if name in result:
+                    data["values"][None][name] = result[name]
+            data["values"][None].update(
+                self.getStability(datasource, result["offset"])
+            )
+            trend = self.addTrendEvent(
+                data, config, eventKey, result["offset"]
+            )
+            stable = stable and trend is None
+        elif result.get("headerOnly"):
+            # offsets not read, health comes from the system status
+            severity = ZenEventClasses.Clear
+            if result["status"] != STATE_OK:
+                severity = ZenEventClasses.Warning
+            stable = severity == ZenEventClasses.Clear
 
-        data["events"].append({
+        if "rtt" in result:
+            data["values"][None]["rtt"] = result["rtt"]
+
+        servers = result.get("servers") or ()
+        for index, server in enumerate(servers, 1):
+            if server and server["offsetResult"] != STATE_UNKNOWN:
+                data["values"][None]["offset_%d" % index] = server["offset"]
+        if servers:
+            data["values"][None]["responding"] = result["responding"]
+
+        offset = None
+        if result["offsetResult"] != STATE_UNKNOWN:
+            offset = result["offset"]
+        self.addFleetSummary(
+            config, result["status"], offset,
+            result["syncSource"] and not result["liAlarm"]
+        )
+
+        state = (severity, status, result["syncSource"], result["liAlarm"],
+                 result.get("responding"))
+        self.reschedule(config, state, stable)
+        self.addEvent(data, config, {
             "eventKey": eventKey,
             "summary": summary,
             "message": output,
             "device": config.id,
             "eventClass": datasource.eventClass,
             "severity": severity
-        })
+        }, state)
+        self.saveState()
 
         return data
 
     def onError(self, result, config):
         data = self.new_data()
+        if isinstance(result.value, OverloadedError):
+            # not a failure of the target, its state is kept
+            log.info("NTP check of %s %s", config.id,
+                     result.getErrorMessage())
+            return data
         datasource = config.datasources[0]
         eventKey = datasource.eventKey or "NtpMonitor"
         severity = ZenEventClasses.Error
         output = "NTP CRITICAL: " + result.getErrorMessage()
+        self.reschedule(config, (severity, output), False)
+        self.addFleetSummary(
+            config, STATE_CRITICAL,
+            timeout=result.getErrorMessage().startswith("Timeout")
+        )
 
-        data["events"].append({
+        self.addEvent(data, config, {
             "eventKey": eventKey,
             "summary": output,
             "message": output,
             "device": config.id,
             "eventClass": datasource.eventClass,
             "severity": severity
-        })
+        }, (severity, output))
+        self.saveState()
 
         return data
+
+    def cleanup(self, config):
+        if self.fleet is not None:
+            self.fleet.remove(
+                "%s/%s" % (config.id, config.datasources[0].datasource)
+            )
+        if self.historyRow is not None:
+            from ZenPacks.zenoss.NtpMonitor.history import getOffsetHistory
+            getOffsetHistory().release(self.historyRow)
+            self.historyRow = None
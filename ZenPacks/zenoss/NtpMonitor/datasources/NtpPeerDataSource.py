@@ -0,0 +1,162 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+NtpPeerDataSource.py
+
+Defines datasource collecting statistics of modeled NTP peers
+"""
+
+import logging
+from ZenPacks.zenoss.PythonCollector.datasources.PythonDataSource import \
+    PythonDataSource, PythonDataSourcePlugin
+from ZenPacks.zenoss.NtpMonitor.ntp import NtpPeerProtocol, execute
+from ZenPacks.zenoss.NtpMonitor.session import PEER_STATS_VARIABLES
+from Products.ZenEvents import ZenEventClasses
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+
+class NtpPeerDataSource(PythonDataSource):
+    """
+    Datasource for associations of NTP server.
+    """
+    ZENPACKID = "ZenPacks.zenoss.NtpMonitor"
+    NTP_PEER = "NtpPeer"
+
+    sourcetypes = (NTP_PEER,)
+    sourcetype = NTP_PEER
+
+    plugin_classname = (
+        "ZenPacks.zenoss.NtpMonitor.datasources."
+        "NtpPeerDataSource.NtpPeerDataSourcePlugin"
+    )
+
+    timeout = 60
+    eventClass = "/Status/Ntp"
+
+    hostname = "${dev/id}"
+    port = 123
+
+    _properties = PythonDataSource._properties + (
+        {"id": "hostname", "type": "string", "mode": "w"},
+        {"id": "port", "type": "int", "mode": "w"},
+        {"id": "timeout", "type": "int", "mode": "w"},
+    )
+
+
+class NtpPeerDataSourcePlugin(PythonDataSourcePlugin):
+    """
+    Datasource plugin reading offset, delay and jitter of all modeled
+    peers of a device in one exchange.
+    """
+    def __init__(self, *args, **kwargs):
+        super(NtpPeerDataSourcePlugin, self).__init__(*args, **kwargs)
+        # components which returned no variables, None until the first
+        # exchange after start
+        self.missing = None
+
+    @classmethod
+    def config_key(cls, datasource, context):
+        # one task per device, its datasources are the peers
+        return (
+            context.device().id,
+            datasource.getCycleTime(context),
+            datasource.plugin_classname
+        )
+
+    @classmethod
+    def params(cls, datasource, context):
+        params = {
+            "hostname": datasource.talesEval(datasource.hostname, context),
+            "port": datasource.talesEval(datasource.port, context),
+            "timeout": datasource.talesEval(datasource.timeout, context),
+            "eventKey": datasource.talesEval(datasource.eventKey, context),
+            "eventClass": datasource.talesEval(datasource.eventClass, context),
+            "assocId": context.assocId
+        }
+        return params
+
+    def collect(self, config):
+        from Products.ZenUtils.IpUtil import getHostByName
+        ds0 = config.datasources[0]
+        try:
+            hostname = getHostByName(ds0.params["hostname"])
+        except Exception:
+            hostname = None
+        assocIds = [ds.params["assocId"] for ds in config.datasources]
+        protocol = NtpPeerProtocol(
+            hostname, ds0.params["port"], ds0.params["timeout"],
+            assocIds, PEER_STATS_VARIABLES
+        )
+        return execute(protocol)
+
+    def onSuccess(self, result, config):
+        data = self.new_data()
+        peers = dict((peer["assocId"], peer) for peer in result["peers"])
+        missing = []
+        for datasource in config.datasources:
+            peer = peers.get(datasource.params["assocId"], {})
+            received = False
+            for name in PEER_STATS_VARIABLES.split(","):
+                if name in peer:
+                    data["values"][datasource.component][name] = peer[name]
+                    received = True
+            if not received:
+                missing.append(datasource)
+        if len(missing) < len(config.datasources):
+            data["events"].append(self.getEvent(
+                config, ZenEventClasses.Clear, "NTP peers collected"
+            ))
+        else:
+            data["events"].append(self.getEvent(
+                config, ZenEventClasses.Error,
+                "NTP CRITICAL: No modeled peer returned its variables"
+            ))
+        # associations gone since modeling answer without variables,
+        # events are sent when the component's state changes
+        components = set(datasource.component for datasource in missing)
+        for datasource in config.datasources:
+            isMissing = datasource in missing
+            if self.missing is not None and \
+                    isMissing == (datasource.component in self.missing):
+                continue
+            severity = ZenEventClasses.Clear
+            summary = "NTP peer %d collected" % datasource.params["assocId"]
+            if isMissing:
+                severity = ZenEventClasses.Warning
+                summary = "NTP peer %d returned no variables, remodel " \
+                    "the device if it is gone" % datasource.params["assocId"]
+            event = self.getEvent(config, severity, summary)
+            event["eventKey"] = "%sMissing" % event["eventKey"]
+            event["component"] = datasource.component
+            data["events"].append(event)
+        self.missing = components
+        return data
+
+    def onError(self, result, config):
+        data = self.new_data()
+        output = "NTP CRITICAL: Unable to collect peers: " + \
+            result.getErrorMessage()
+        data["events"].append(self.getEvent(
+            config, ZenEventClasses.Error, output
+        ))
+        return data
+
+    def getEvent(self, config, severity, summary):
+        datasource = config.datasources[0]
+        return {
+            "eventKey": datasource.eventKey or "NtpPeer",
+            "summary": summary,
+            "message": summary,
+            "device": config.id,
+            "eventClass": datasource.eventClass,
+            "severity": severity
+        }
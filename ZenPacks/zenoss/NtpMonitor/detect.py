@@ -0,0 +1,86 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Incremental detection of offset trends.
+
+Every offset is standardized against exponentially weighted mean and
+variance of the previous ones and accumulated in two-sided CUSUM. A
+clock walking away moves the sums over the limit long before the
+offset reaches static thresholds.
+"""
+
+import math
+
+TREND_UP = "up"
+TREND_DOWN = "down"
+
+
+class OffsetDetector(object):
+    """
+    EWMA/CUSUM state of one target, O(1) per offset.
+    """
+    __slots__ = ("count", "mean", "variance", "high", "low")
+
+    # weight of newest offset in mean and variance
+    ALPHA = 0.1
+    # allowed deviation in standard deviations before accumulating
+    SLACK = 0.5
+    # accumulated deviation raising the alarm
+    LIMIT = 5.0
+    # offsets learning mean and variance before accumulating
+    WARMUP = 8
+    # floor for standard deviation, in seconds
+    MIN_SIGMA = 1e-5
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.high = 0.0
+        self.low = 0.0
+
+    def getState(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def setState(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def sigma(self):
+        return max(math.sqrt(self.variance), self.MIN_SIGMA)
+
+    def update(self, offset):
+        """
+        Add offset and return the current trend.
+        :param offset: measured offset in seconds
+        :return: TREND_UP, TREND_DOWN or None
+        """
+        if self.count >= self.WARMUP:
+            score = (offset - self.mean) / self.sigma
+            self.high = max(0.0, self.high + score - self.SLACK)
+            self.low = max(0.0, self.low - score - self.SLACK)
+        if self.count:
+            diff = offset - self.mean
+            increment = self.ALPHA * diff
+            self.mean += increment
+            self.variance = (1 - self.ALPHA) * (self.variance + diff * increment)
+        else:
+            self.mean = offset
+        self.count += 1
+        return self.trend
+
+    @property
+    def trend(self):
+        if self.high > self.LIMIT:
+            return TREND_UP
+        if self.low > self.LIMIT:
+            return TREND_DOWN
+        return None
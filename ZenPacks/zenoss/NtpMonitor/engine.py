@@ -0,0 +1,361 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Standalone engine running many NTP checks without Twisted reactor.
+
+All sessions share one unconnected UDP socket per address family and
+replies are dispatched by server's address. The number of sessions in
+flight is bounded and response timeouts are kept in a single heap of
+absolute deadlines. Round trip times are measured with kernel receive
+timestamps where available.
+
+With calibrate(), a few reference servers are queried once per interval
+while checks are queued, and checks in client mode are corrected by the
+resulting estimate of the collector's own clock offset.
+"""
+
+import errno
+import heapq
+import logging
+import select
+import socket
+import time
+from collections import deque
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException, STATE_UNKNOWN
+from ZenPacks.zenoss.NtpMonitor.session import NtpSession, \
+    ACTION_SEND, ACTION_TIMER, ACTION_CANCEL, ACTION_RESULT, ACTION_ERROR, \
+    CHECK_FULL, CHECK_CLIENT, SessionPool
+from ZenPacks.zenoss.NtpMonitor.sntp import SntpSession, Calibration
+from ZenPacks.zenoss.NtpMonitor.timestamps import enableTimestamps, \
+    getReceiveTime
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+RECV_SIZE = 4096
+
+
+class NtpCheck(object):
+    """
+    Single NTP check handled by NtpEngine.
+    """
+    __slots__ = ("host", "tag", "session", "family", "addr", "timerId",
+                 "reference")
+
+    def __init__(self, host, port=None, timeout=None, warning=None,
+                 critical=None, tag=None, checkMode=None,
+                 lastEventCount=None, pool=None):
+        """
+        Initialize NtpCheck.
+        :param pool: SessionPool providing the session
+        """
+        self.host = host
+        self.tag = host if tag is None else tag
+        if checkMode == CHECK_CLIENT:
+            self.session = SntpSession(host, port, timeout, warning,
+                                       critical)
+        elif pool is None:
+            self.session = NtpSession(host, port, timeout, warning, critical)
+        else:
+            self.session = pool.acquire(host, port, timeout, warning,
+                                        critical)
+        self.session.checkMode = checkMode or CHECK_FULL
+        self.session.lastEventCount = lastEventCount
+        self.family = None
+        self.addr = None
+        self.timerId = None
+        # sample for calibration of the collector's clock
+        self.reference = False
+
+    @property
+    def key(self):
+        return self.addr[:2]
+
+
+class NtpEngine(object):
+    """
+    Drives NtpSession instances over shared UDP sockets.
+    """
+    def __init__(self, parallel=256, clock=time.time):
+        """
+        Initialize NtpEngine.
+        :param parallel: maximum number of checks in flight
+        :param clock: function returning current time in seconds
+        """
+        self.parallel = max(int(parallel), 1)
+        self.clock = clock
+        self.sockets = {}
+        # sockets with kernel receive timestamps
+        self.stamped = set()
+        self.waiting = deque()
+        self.blocked = {}
+        self.active = {}
+        self.timers = []
+        self.timerCounter = 0
+        self.finished = deque()
+        # sessions of finished checks are reused
+        self.pool = SessionPool(self.parallel)
+        self.calibration = Calibration()
+        self.references = ()
+        self.calibrationInterval = None
+        self.calibrationTimeout = None
+        self.calibrationPort = None
+        self.nextCalibration = None
+        # client checks wait for the first round of references
+        self.held = deque()
+        self.pendingReferences = 0
+        self.calibrated = False
+
+    def calibrate(self, references, interval=64.0, timeout=5.0, port=None):
+        """
+        Query reference servers every interval to estimate offset of
+        the collector's clock, applied to checks in client mode.
+        :param references: hostnames of reference servers
+        :param timeout: seconds to wait for a reference
+        :param port: port of reference servers, 123 by default
+        """
+        self.references = tuple(references)
+        self.calibrationPort = port
+        self.calibrationInterval = interval
+        self.calibrationTimeout = timeout
+        self.nextCalibration = self.clock()
+
+    def submit(self, host, port=None, timeout=None, warning=None,
+               critical=None, tag=None, checkMode=None, lastEventCount=None):
+        """
+        Queue NTP check of host.
+        :param tag: value returned with result, host by default
+        :param checkMode: one of CHECK_* modes of NtpSession
+        :param lastEventCount: system event counter seen by previous check
+        :return: queued check
+        :rtype: NtpCheck
+        """
+        check = NtpCheck(host, port, timeout, warning, critical, tag,
+                         checkMode, lastEventCount, self.pool)
+        self.waiting.append(check)
+        return check
+
+    @property
+    def busy(self):
+        return bool(self.waiting or self.active or self.finished or
+                    self.held)
+
+    def run(self):
+        """
+        Run queued checks and yield results as they complete.
+        :return: generator of (tag, result, error) tuples
+        """
+        while self.busy:
+            self.step()
+            while self.finished:
+                yield self.finished.popleft()
+
+    def step(self, maxWait=None, readers=()):
+        """
+        Start waiting checks, expire timeouts and process replies
+        that arrive until next deadline.
+        :param maxWait: upper limit for waiting on sockets, in seconds
+        :param readers: other file objects to wait for
+        :return: readers ready for reading
+        :rtype: list
+        """
+        self.expireTimers()
+        self.startCalibration()
+        self.admit()
+        if self.finished:
+            maxWait = 0
+        wait = self.nextDeadline()
+        if wait is not None:
+            wait = max(wait - self.clock(), 0)
+        if maxWait is not None:
+            wait = maxWait if wait is None else min(wait, maxWait)
+        sockets = self.sockets.values() + list(readers)
+        if not sockets:
+            return []
+        readable, _, _ = select.select(sockets, [], [], wait)
+        ready = []
+        for sock in readable:
+            if sock in readers:
+                ready.append(sock)
+            else:
+                self.readSocket(sock)
+        self.expireTimers()
+        return ready
+
+    def startCalibration(self):
+        """
+        Queue queries of reference servers ahead of other checks, if
+        they are due and checks are waiting.
+        """
+        if not self.references or not self.waiting or \
+                self.clock() < self.nextCalibration:
+            return
+        self.nextCalibration = self.clock() + self.calibrationInterval
+        if not self.calibrated:
+            self.pendingReferences += len(self.references)
+        for host in self.references:
+            check = NtpCheck(host, self.calibrationPort,
+                             self.calibrationTimeout, checkMode=CHECK_CLIENT)
+            check.reference = True
+            self.waiting.appendleft(check)
+
+    def admit(self):
+        while self.waiting and len(self.active) < self.parallel:
+            check = self.waiting.popleft()
+            if self.references and not self.calibrated and \
+                    not check.reference and \
+                    check.session.checkMode == CHECK_CLIENT:
+                # correction would be 0 until references answer
+                self.held.append(check)
+                continue
+            if not self.resolve(check):
+                continue
+            if check.key in self.active:
+                # replies are matched by address, one check per server
+                self.blocked.setdefault(check.key, deque()).append(check)
+                continue
+            self.active[check.key] = check
+            check.session.start()
+            self.handleActions(check)
+
+    def resolve(self, check):
+        if check.addr:
+            return True
+        session = check.session
+        if not check.host:
+            session.start()
+            self.handleActions(check)
+            return False
+        try:
+            info = socket.getaddrinfo(
+                check.host, session.port, 0, socket.SOCK_DGRAM
+            )
+        except socket.error as ex:
+            log.debug("Unable to resolve %s: %s", check.host, ex)
+            session.fail(NtpException("Unable to resolve %s" % check.host))
+            self.handleActions(check)
+            return False
+        check.family, check.addr = info[0][0], info[0][4]
+        return True
+
+    def getSocket(self, family):
+        sock = self.sockets.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            # kernel stamps are of the system clock
+            if self.clock is time.time and enableTimestamps(sock):
+                self.stamped.add(sock)
+            self.sockets[family] = sock
+        return sock
+
+    def readSocket(self, sock):
+        while True:
+            try:
+                data, addr = sock.recvfrom(RECV_SIZE)
+            except socket.error as ex:
+                if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if ex.args[0] in (errno.ECONNREFUSED, errno.EINTR):
+                    continue
+                raise
+            if sock in self.stamped:
+                received = getReceiveTime(sock)
+            else:
+                received = self.clock()
+            check = self.active.get(addr[:2])
+            if check is None:
+                log.debug("Unexpected datagram from %s", addr)
+                continue
+            check.session.responseReceived(received)
+            if self.references and not check.reference and \
+                    check.session.checkMode == CHECK_CLIENT:
+                check.session.calibration = self.calibration
+            check.session.datagramReceived(data, addr)
+            self.handleActions(check)
+
+    def handleActions(self, check):
+        for action, value in check.session.popActions():
+            if action == ACTION_SEND:
+                try:
+                    sock = self.getSocket(check.family)
+                    check.session.requestSent(self.clock())
+                    sock.sendto(value, check.addr)
+                except socket.error as ex:
+                    check.session.fail(NtpException(str(ex)))
+                    self.handleActions(check)
+                    return
+            elif action == ACTION_TIMER:
+                self.timerCounter += 1
+                check.timerId = self.timerCounter
+                heapq.heappush(
+                    self.timers,
+                    (self.clock() + value, check.timerId, check)
+                )
+            elif action == ACTION_CANCEL:
+                # heap entries are dropped lazily
+                check.timerId = None
+            elif action == ACTION_RESULT:
+                self.complete(check, value, None)
+                return
+            elif action == ACTION_ERROR:
+                self.complete(check, None, value)
+                return
+
+    def complete(self, check, result, error):
+        check.timerId = None
+        session = check.session
+        if check.addr and self.active.get(check.key) is check:
+            del self.active[check.key]
+            blocked = self.blocked.get(check.key)
+            if blocked:
+                self.waiting.appendleft(blocked.popleft())
+                if not blocked:
+                    del self.blocked[check.key]
+        if not check.reference:
+            self.finished.append((check.tag, result, error))
+        elif result is not None and result["offsetResult"] != STATE_UNKNOWN:
+            self.calibration.add(check.host, session.measured, session.delay,
+                                 self.clock())
+        else:
+            log.debug("Reference %s not used for calibration: %s",
+                      check.host, error or "not synchronized")
+        if check.reference and not self.calibrated:
+            self.pendingReferences -= 1
+            if self.pendingReferences <= 0:
+                log.debug("First calibration done, releasing %d checks",
+                          len(self.held))
+                self.calibrated = True
+                self.waiting.extendleft(reversed(self.held))
+                self.held.clear()
+        self.pool.release(session)
+        check.session = None
+
+    def nextDeadline(self):
+        while self.timers and self.timers[0][2].timerId != self.timers[0][1]:
+            heapq.heappop(self.timers)
+        if self.timers:
+            return self.timers[0][0]
+
+    def expireTimers(self):
+        now = self.clock()
+        while self.timers and self.timers[0][0] <= now:
+            _, timerId, check = heapq.heappop(self.timers)
+            if check.timerId != timerId:
+                continue
+            check.timerId = None
+            check.session.timeoutHandler()
+            self.handleActions(check)
+
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets.clear()
+        self.stamped.clear()
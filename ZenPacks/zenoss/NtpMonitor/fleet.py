@@ -0,0 +1,125 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Collector-wide summary of NTP checks.
+
+The latest check of every target is one row of a few arrays. Targets
+the poll schedule skipped keep their previous check. Once per cycle of
+NtpFleet datasources all rows are summarized together: offset
+percentiles, number of targets per status, unsynchronized targets and
+timeouts. Between summaries the cost per check is an array store.
+"""
+
+import numpy
+from ZenPacks.zenoss.NtpMonitor.packet import STATE_OK, STATE_UNKNOWN, \
+    STATE_WARNING, STATE_CRITICAL
+
+STATE_NAMES = {
+    STATE_OK: "ok",
+    STATE_UNKNOWN: "unknown",
+    STATE_WARNING: "warning",
+    STATE_CRITICAL: "critical"
+}
+PERCENTILES = (5, 50, 95)
+
+
+class FleetSummary(object):
+    """
+    Latest check results of all targets of the collector.
+    """
+    def __init__(self, capacity=256):
+        """
+        Initialize FleetSummary.
+        :param capacity: initial number of rows
+        """
+        # target -> row
+        self.rows = {}
+        self.offsets = numpy.full(capacity, numpy.nan)
+        self.statuses = numpy.zeros(capacity, dtype=numpy.int8)
+        self.synchronized = numpy.zeros(capacity, dtype=bool)
+        self.timeouts = numpy.zeros(capacity, dtype=bool)
+        self.known = numpy.zeros(capacity, dtype=bool)
+
+    def grow(self):
+        capacity = len(self.offsets)
+        self.offsets = numpy.concatenate(
+            (self.offsets, numpy.full(capacity, numpy.nan))
+        )
+        for name in ("statuses", "synchronized", "timeouts", "known"):
+            values = getattr(self, name)
+            setattr(self, name, numpy.concatenate(
+                (values, numpy.zeros(capacity, dtype=values.dtype))
+            ))
+
+    def add(self, target, status, offset=None, synchronized=False,
+            timeout=False):
+        """
+        Record check of target, replacing its previous one.
+        :param status: STATE_* of the check
+        :param offset: measured offset in seconds or None
+        """
+        row = self.rows.get(target)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.offsets):
+                self.grow()
+            self.rows[target] = row
+        self.offsets[row] = numpy.nan if offset is None else offset
+        self.statuses[row] = status
+        self.synchronized[row] = synchronized
+        self.timeouts[row] = timeout
+        self.known[row] = True
+
+    def remove(self, target):
+        """
+        Leave target out of next summaries.
+        """
+        row = self.rows.get(target)
+        if row is not None:
+            self.known[row] = False
+
+    def compute(self):
+        """
+        Summarize latest checks of known targets.
+        :rtype: dict
+        """
+        known = self.known
+        statuses = self.statuses[known]
+        offsets = self.offsets[known]
+        offsets = offsets[numpy.isfinite(offsets)]
+        counts = numpy.bincount(statuses, minlength=len(STATE_NAMES))
+        timeouts = self.timeouts[known]
+        unsynchronized = ~self.synchronized[known] & ~timeouts
+        summary = {
+            "targets": int(len(statuses)),
+            "unsynchronized": int(numpy.sum(unsynchronized)),
+            "timeouts": int(numpy.sum(timeouts))
+        }
+        for status, name in STATE_NAMES.iteritems():
+            summary[name] = int(counts[status])
+        if len(offsets):
+            for percentile, value in zip(
+                    PERCENTILES, numpy.percentile(offsets, PERCENTILES)):
+                summary["offset_p%d" % percentile] = float(value)
+            summary["offset_max"] = float(numpy.max(numpy.abs(offsets)))
+        return summary
+
+
+_fleet = None
+
+
+def getFleetSummary():
+    """
+    Return summary shared by all NTP datasources of the collector.
+    """
+    global _fleet
+    if _fleet is None:
+        _fleet = FleetSummary()
+    return _fleet
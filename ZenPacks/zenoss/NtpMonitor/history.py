@@ -0,0 +1,180 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+History of measured offsets and clock stability statistics.
+
+Recent offsets of all monitored targets are kept in ring buffers which
+are rows of one array. Statistics are computed for all rows together,
+at most once per interval, so the cost per check is an array store.
+Rows which got a sample since are recomputed alone when their
+statistics are read, so these always include the latest sample.
+
+Computed values, for samples in chronological order:
+
+* drift - least squares slope of offset over time, in ppm
+* jitter - RMS of differences between consecutive offsets, in seconds
+* adev - Allan deviation at the sampling interval
+* tdev - time deviation at the sampling interval, in seconds
+
+Targets probed at adaptive intervals are sampled unevenly. Differences
+of offsets are therefore taken as frequencies over the real elapsed
+time and scaled to the shortest interval between samples, which for
+even sampling gives the usual estimates.
+"""
+
+import warnings
+import numpy
+
+
+class OffsetHistory(object):
+    """
+    Ring buffers of (time, offset) samples, one row per target.
+    """
+    def __init__(self, size=64, capacity=256):
+        """
+        Initialize OffsetHistory.
+        :param size: number of samples kept per target
+        :param capacity: initial number of rows
+        """
+        self.size = size
+        self.times = numpy.full((capacity, size), numpy.nan)
+        self.offsets = numpy.full((capacity, size), numpy.nan)
+        self.positions = numpy.zeros(capacity, dtype=int)
+        # rows with samples added after the last computation
+        self.updated = numpy.zeros(capacity, dtype=bool)
+        self.free = range(capacity - 1, -1, -1)
+        self.stats = None
+        self.computedAt = None
+
+    def allocate(self):
+        """
+        Return index of an empty row.
+        """
+        if not self.free:
+            self.grow()
+        return self.free.pop()
+
+    def release(self, row):
+        self.times[row] = numpy.nan
+        self.offsets[row] = numpy.nan
+        self.positions[row] = 0
+        self.updated[row] = False
+        self.free.append(row)
+        if self.stats is not None:
+            for values in self.stats.itervalues():
+                values[row] = numpy.nan
+
+    def grow(self):
+        capacity = len(self.positions)
+        pad = numpy.full((capacity, self.size), numpy.nan)
+        self.times = numpy.vstack((self.times, pad))
+        self.offsets = numpy.vstack((self.offsets, pad))
+        self.positions = numpy.concatenate(
+            (self.positions, numpy.zeros(capacity, dtype=int))
+        )
+        self.updated = numpy.concatenate(
+            (self.updated, numpy.zeros(capacity, dtype=bool))
+        )
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+        if self.stats is not None:
+            for name, values in self.stats.items():
+                self.stats[name] = numpy.concatenate(
+                    (values, numpy.full(capacity, numpy.nan))
+                )
+
+    def add(self, row, when, offset):
+        position = self.positions[row]
+        self.times[row, position] = when
+        self.offsets[row, position] = offset
+        self.positions[row] = (position + 1) % self.size
+        self.updated[row] = True
+
+    def getStats(self, row, now, interval):
+        """
+        Return statistics of row, computing them for all rows if the
+        previous computation is older than interval, otherwise for the
+        row alone if it got samples since.
+        :return: name -> value, for statistics known for the row
+        :rtype: dict
+        """
+        if self.computedAt is None or now - self.computedAt >= interval:
+            self.stats = self.compute()
+            self.computedAt = now
+            self.updated[:] = False
+        elif self.updated[row]:
+            for name, values in self.compute([row]).iteritems():
+                self.stats[name][row] = values[0]
+            self.updated[row] = False
+        result = {}
+        for name, values in self.stats.iteritems():
+            if row < len(values) and numpy.isfinite(values[row]):
+                result[name] = float(values[row])
+        return result
+
+    def compute(self, rows=None):
+        """
+        Compute statistics of rows.
+        :param rows: indices of rows, all rows by default
+        :return: name -> array of values per row, NaN where unknown
+        :rtype: dict
+        """
+        if rows is None:
+            rows = numpy.arange(len(self.positions))
+        rows = numpy.asarray(rows)[:, None]
+        # oldest sample first
+        order = (self.positions[rows] + numpy.arange(self.size)) % self.size
+        t = self.times[rows, order]
+        x = self.offsets[rows, order]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                dt = t - numpy.nanmean(t, axis=1)[:, None]
+                dx = x - numpy.nanmean(x, axis=1)[:, None]
+                drift = numpy.nansum(dt * dx, axis=1) / \
+                    numpy.nansum(dt * dt, axis=1)
+
+                # unfilled samples are NaN and drop out of the means
+                elapsed = numpy.diff(t, axis=1)
+                frequency = numpy.diff(x, axis=1) / elapsed
+                tau = numpy.nanmin(elapsed, axis=1)
+                jitter = tau * numpy.sqrt(
+                    numpy.nanmean(frequency * frequency, axis=1)
+                )
+
+                second = numpy.diff(frequency, axis=1)
+                adev = numpy.sqrt(numpy.nanmean(second * second, axis=1) / 2)
+                tdev = tau * adev / numpy.sqrt(3)
+
+                # tau of rows without samples is NaN, comparing it warns
+                counts = numpy.sum(numpy.isfinite(x), axis=1)
+                drift[counts < 2] = numpy.nan
+                jitter[(counts < 2) | ~(tau > 0)] = numpy.nan
+                adev[(counts < 3) | ~(tau > 0)] = numpy.nan
+                tdev[(counts < 3) | ~(tau > 0)] = numpy.nan
+        return {
+            "drift": drift * 1e6,
+            "jitter": jitter,
+            "adev": adev,
+            "tdev": tdev
+        }
+
+
+_history = None
+
+
+def getOffsetHistory():
+    """
+    Return history shared by all NTP datasources of the collector.
+    """
+    global _history
+    if _history is None:
+        _history = OffsetHistory()
+    return _history
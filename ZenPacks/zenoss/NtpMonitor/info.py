@@ -11,17 +11,70 @@
 from Products.Zuul.infos import ProxyProperty
 from zope.interface import implements
 from Products.Zuul.infos.template import RRDDataSourceInfo
-from ZenPacks.zenoss.NtpMonitor.interfaces import INtpMonitorDataSourceInfo
+from ZenPacks.zenoss.NtpMonitor.interfaces import INtpMonitorDataSourceInfo, \
+    INtpPeerDataSourceInfo, INtpFleetDataSourceInfo
+from ZenPacks.zenoss.NtpMonitor.datasources.NtpMonitorDataSource import \
+    MAX_SERVERS, getHostnames, isLiteral
 
 
 class NtpMonitorDataSourceInfo(RRDDataSourceInfo):
     implements(INtpMonitorDataSourceInfo)
     timeout = ProxyProperty('timeout')
     cycletime = ProxyProperty('cycletime')
-    hostname = ProxyProperty('hostname')
     port = ProxyProperty('port')
     warning = ProxyProperty('warning')
     critical = ProxyProperty('critical')
+    workers = ProxyProperty('workers')
+    heartbeat = ProxyProperty('heartbeat')
+    maxInterval = ProxyProperty('maxInterval')
+    policy = ProxyProperty('policy')
+    quorum = ProxyProperty('quorum')
+    capture = ProxyProperty('capture')
+    profiling = ProxyProperty('profiling')
+    engine = ProxyProperty('engine')
+    checkMode = ProxyProperty('checkMode')
+    references = ProxyProperty('references')
+    maxSessions = ProxyProperty('maxSessions')
+
+    def getHostname(self):
+        return self._object.hostname
+
+    def setHostname(self, value):
+        # expressions are known only on the collector
+        if isLiteral(value) and len(getHostnames(value)) > MAX_SERVERS:
+            raise ValueError(
+                "At most %d servers can be listed in Host Names" % MAX_SERVERS
+            )
+        self._object.hostname = value
+
+    hostname = property(getHostname, setHostname)
+
+    @property
+    def testable(self):
+        """
+        We can NOT test this datsource against a specific device
+        """
+        return False
+
+
+class NtpPeerDataSourceInfo(RRDDataSourceInfo):
+    implements(INtpPeerDataSourceInfo)
+    timeout = ProxyProperty('timeout')
+    cycletime = ProxyProperty('cycletime')
+    hostname = ProxyProperty('hostname')
+    port = ProxyProperty('port')
+
+    @property
+    def testable(self):
+        """
+        We can NOT test this datsource against a specific device
+        """
+        return False
+
+
+class NtpFleetDataSourceInfo(RRDDataSourceInfo):
+    implements(INtpFleetDataSourceInfo)
+    cycletime = ProxyProperty('cycletime')
 
     @property
     def testable(self):
@@ -16,9 +16,47 @@ from Products.Zuul.utils import ZuulMessageFactory as _t
 class INtpMonitorDataSourceInfo(IRRDDataSourceInfo):
     timeout = schema.Int(title=_t(u'Timeout (seconds)'))
     cycletime = schema.TextLine(title=_t(u'Cycle Time (seconds)'))
-    hostname = schema.TextLine(title=_t(u'Host Name'),
+    hostname = schema.TextLine(title=_t(u'Host Names (at most 3)'),
                                group=_t(u'Ntp'))
     warning = schema.Int(title=_t(u'Warning Response Time (seconds)'),
                            group=_t(u'Ntp'))
     critical = schema.Int(title=_t(u'Critical Response Time (seconds)'),
                            group=_t(u'Ntp'))
+    workers = schema.Int(title=_t(u'Worker Processes (0 to disable)'),
+                         group=_t(u'Ntp'))
+    heartbeat = schema.Int(title=_t(u'Repeat Unchanged Events After (seconds)'),
+                           group=_t(u'Ntp'))
+    maxInterval = schema.Int(title=_t(u'Maximum Interval of Stable Checks (seconds, 0 to disable)'),
+                             group=_t(u'Ntp'))
+    policy = schema.TextLine(title=_t(u'Policy for Several Servers (best, median or quorum)'),
+                             group=_t(u'Ntp'))
+    quorum = schema.Int(title=_t(u'Quorum of Servers'),
+                        group=_t(u'Ntp'))
+    capture = schema.Bool(title=_t(u'Capture Datagrams for Replay'),
+                          group=_t(u'Ntp'))
+    profiling = schema.Bool(title=_t(u'Profile Collection'),
+                            group=_t(u'Ntp'))
+    engine = schema.TextLine(title=_t(u'Protocol Engine (ntp or chrony)'),
+                             group=_t(u'Ntp'))
+    checkMode = schema.TextLine(
+        title=_t(u'Check Mode (full, status, auto or client)'),
+        group=_t(u'Ntp'))
+    references = schema.TextLine(
+        title=_t(u'Reference Servers for client mode'),
+        group=_t(u'Ntp'))
+    maxSessions = schema.Int(
+        title=_t(u'Maximum Concurrent Checks per Collector (0 for no limit)'),
+        group=_t(u'Ntp'))
+
+
+class INtpPeerDataSourceInfo(IRRDDataSourceInfo):
+    timeout = schema.Int(title=_t(u'Timeout (seconds)'))
+    cycletime = schema.TextLine(title=_t(u'Cycle Time (seconds)'))
+    hostname = schema.TextLine(title=_t(u'Host Name'),
+                               group=_t(u'Ntp'))
+    port = schema.Int(title=_t(u'Port'),
+                      group=_t(u'Ntp'))
+
+
+class INtpFleetDataSourceInfo(IRRDDataSourceInfo):
+    cycletime = schema.TextLine(title=_t(u'Cycle Time (seconds)'))
@@ -0,0 +1,62 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+NtpPeers
+
+Models associations of NTP server as NtpPeer components.
+"""
+
+from Products.DataCollector.plugins.CollectorPlugin import PythonPlugin
+from Products.ZenUtils.Utils import prepId
+from ZenPacks.zenoss.NtpMonitor.ntp import NtpPeerProtocol, execute
+
+
+class NtpPeers(PythonPlugin):
+    """
+    Discovers associations with READSTAT and reads their variables.
+    """
+    relname = "ntpPeers"
+    modname = "ZenPacks.zenoss.NtpMonitor.NtpPeer"
+
+    deviceProperties = PythonPlugin.deviceProperties + (
+        "manageIp",
+    )
+
+    def collect(self, device, log):
+        hostname = device.manageIp or device.id
+        log.info("Discovering NTP peers of %s (%s)", device.id, hostname)
+        return execute(NtpPeerProtocol(hostname))
+
+    def process(self, device, results, log):
+        log.info("Modeler %s processing data for device %s",
+                 self.name(), device.id)
+        rm = self.relMap()
+        addresses = [peer.get("srcadr", "") for peer in results["peers"]]
+        for peer in results["peers"]:
+            srcadr = peer.get("srcadr", "")
+            # association IDs change when ntpd restarts, they are part
+            # of the id only of peers sharing their source address
+            if not srcadr:
+                peerId = "assoc-%d" % peer["assocId"]
+            elif addresses.count(srcadr) > 1:
+                peerId = "%s-%d" % (srcadr, peer["assocId"])
+            else:
+                peerId = srcadr
+            rm.append(self.objectMap({
+                "id": prepId(peerId),
+                "title": srcadr or str(peer["assocId"]),
+                "assocId": peer["assocId"],
+                "srcadr": srcadr,
+                "refid": peer.get("refid", ""),
+                "stratum": peer.get("stratum"),
+                "clockSelect": peer.get("clockSelect")
+            }))
+        log.info("Found %d NTP peers on %s", len(rm.maps), device.id)
+        return rm
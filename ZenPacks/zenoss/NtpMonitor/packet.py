@@ -0,0 +1,349 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Encoding and decoding of NTP mode 6 (control message) packets.
+"""
+
+import struct
+import logging
+from ZenPacks.zenoss.NtpMonitor.profiling import profiled
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+LEAP_MAP = {
+    0: "NO WARNING",
+    1: "EXTRA SEC",  # last minute "has" 61 seconds
+    2: "MISSING SEC",  # last minute "has" 59 seconds
+    3: "ALARM"  # clock not synchronized
+}
+
+STATUS_MAP = {
+    0: "NTP OK:",
+    1: "NTP UNKNOWN:",
+    2: "NTP WARNING:",
+    3: "NTP CRITICAL:"
+}
+
+# clock source of system status word
+SOURCE_MAP = {
+    0: "unspecified",
+    1: "pps",
+    2: "lf_radio",
+    3: "hf_radio",
+    4: "uhf_radio",
+    5: "local",
+    6: "ntp",
+    7: "other",
+    8: "wristwatch",
+    9: "telephone"
+}
+
+# last event code of system status word
+SYSTEM_EVENT_MAP = {
+    0: "unspecified",
+    1: "freq_not_set",
+    2: "freq_set",
+    3: "spike_detect",
+    4: "freq_mode",
+    5: "clock_sync",
+    6: "restart",
+    7: "panic_stop",
+    8: "no_sys_peer",
+    9: "leap_armed",
+    10: "leap_disarmed",
+    11: "leap_event",
+    12: "clock_step",
+    13: "kern",
+    14: "TAI",
+    15: "stale_leapsecond"
+}
+
+# STATE_OK < STATE_UNKNOWN < STATE_WARNING < STATE_CRITICAL
+STATE_OK = 0
+STATE_UNKNOWN = 1
+STATE_WARNING = 2
+STATE_CRITICAL = 3
+
+
+def parseVariables(text):
+    """
+    Parse variable list of READVAR response, e.g. 'srcadr=10.0.0.1,
+    refid="GPS", stratum=1'.
+    :param text: data of response
+    :return: name -> value, values as strings
+    :rtype: dict
+    """
+    variables = {}
+    for item in text.split(","):
+        name, sep, value = item.partition("=")
+        name = name.strip()
+        if name and sep:
+            variables[name] = value.strip().strip('"')
+    return variables
+
+
+class NtpException(Exception):
+    """
+    Exception raised by NTP related classes.
+    """
+    pass
+
+
+class NtpPacket(object):
+    """
+    Represents NTP packet. Contains methods for converting
+    data to/from binary format and checking flags.
+    """
+
+    _BASE_FIELDS = "!B B 5H"
+    _DATA = "!{0}s"
+    _PADDING = "!{0}B"
+
+    MAX_CM_SIZE = 468
+
+    def __init__(self, version=2, opcode=1, sequence=1):
+        """
+        Initialize NtpPacket.
+        :param version: version number of NTP protocol
+        :param opcode: type of the REQUEST (0x01 READSTAT, 0x02 READVAR)
+        :param sequence: ordinal of packet during exchange
+        """
+        self.leap = 0
+        self.version = version
+        self.opcode = opcode
+        self.sequence = sequence
+        self.status = 0
+        self.mode = 6  # 0x06 - NTP control message
+        self.assoc = 0
+        self.offset = 0
+        self.count = 0
+        self.errorBit = 0
+        self.data = None
+        self.peerData = None
+
+    @profiled("NtpPacket.toDataReadstat")
+    def toDataReadstat(self):
+        """
+        Returns this instance as a READSTAT request in binary form.
+        :return: binary format of NTP READSTAT packet.
+        :rtype: str
+        """
+        if self.version == 2:
+            try:
+                # pack: 2 x 1 byte, 5 x 2 bytes
+                packed = struct.pack(
+                    NtpPacket._BASE_FIELDS,
+                    # masks for first byte:
+                    # - leap: 11000000
+                    # - version: 00111000
+                    # - mode: 00000111
+                    (
+                        (self.leap << 6 & 0xc0) |
+                        (self.version << 3 & 0x38) |
+                        (self.mode & 0x07)
+                    ),
+                    self.opcode,
+                    self.sequence,
+                    self.status,
+                    self.assoc,
+                    self.offset,
+                    self.count
+                )
+            except struct.error:
+                raise NtpException("Internal packet parsing error")
+            return packed
+        else:
+            raise NtpException(
+                "Version %i of NTP protocol is not implemented" % self.version
+            )
+
+    @profiled("NtpPacket.toDataReadvar")
+    def toDataReadvar(self):
+        """
+        Returns this instance as a READVAR request in binary form.
+        :return: binary format of NTP READVAR packet.
+        :rtype: str
+        """
+        if self.version == 2:
+            try:
+                # unpack: 2 x 1 byte, 5 x 2 bytes, self.count x 1 byte
+                packed = struct.pack(
+                    NtpPacket._BASE_FIELDS,
+                    (
+                        (self.leap << 6 & 0xc0) |
+                        (self.version << 3 & 0x38) |
+                        (self.mode & 0x07)
+                    ),
+                    self.opcode,
+                    self.sequence,
+                    self.status,
+                    self.assoc,
+                    self.offset,
+                    self.count
+                )
+                packed += struct.pack(
+                    NtpPacket._DATA.format(self.count), self.data
+                )
+                padding = ''
+                if self.count % 12 != 0:
+                    toPad = 12 - (self.count - 12 * int(self.count / 12))
+                    for _ in range(0, toPad):
+                        padding += struct.pack("!B", 0)
+                packed += padding
+            except struct.error:
+                raise NtpException("Invalid packet received from NTP server")
+            return packed
+        else:
+            raise NtpException(
+                "Version %i of NTP protocol is not implemented" % self.version
+            )
+
+    @classmethod
+    @profiled("NtpPacket.fromData")
+    def fromData(cls, data):
+        """
+        Creates NtpPacket, extracts values from binary data to packet's fields and return NtpPacket instance.
+        :param data: binary data
+        :return: NtpPacket with extracted data
+        :rtype: NtpPacket
+        """
+        try:
+            unpacked = struct.unpack(
+                NtpPacket._BASE_FIELDS,
+                data[0:struct.calcsize(NtpPacket._BASE_FIELDS)]
+            )
+        except struct.error:
+            raise NtpException("Invalid packet received from NTP server")
+
+        packet = cls()
+        packet.leap = unpacked[0] >> 6 & 0x03
+        packet.version = unpacked[0] >> 3 & 0x07
+        packet.mode = unpacked[0] & 0x07
+        packet.opcode = unpacked[1]
+        packet.sequence = unpacked[2]
+        packet.status = unpacked[3]
+        packet.assoc = unpacked[4]
+        packet.offset = unpacked[5]
+        packet.count = unpacked[6]
+        if packet.count >= 4:
+            packet.peerData = data[12:]
+
+        return packet
+
+    @property
+    def peers(self):
+        """
+        Extract data about peers from NTP packet's data field.
+        Pair of 2 bytes per one peer.
+        """
+        peers = {}
+        if self.peerData:
+            try:
+                unpacked = struct.unpack(
+                    '!{0}H'.format(self.count / 2),
+                    self.peerData[:self.count]
+                )
+            except struct.error:
+                log.debug("Error during extracting data from NTP packet")
+                raise NtpException("Invalid packet received from NTP server")
+            for peer in range(0, len(unpacked) - 1, 2):
+                peers[unpacked[peer]] = unpacked[peer + 1]
+        return peers
+
+    @property
+    def systemStatus(self):
+        """
+        Decode status word of READSTAT response, the system status:
+        - leap: 11000000 00000000
+        - clock source: 00111111 00000000
+        - event count: 00000000 11110000
+        - last event code: 00000000 00001111
+        :rtype: dict
+        """
+        return {
+            "leap": self.status >> 14 & 0x03,
+            "source": self.status >> 8 & 0x3f,
+            "eventCount": self.status >> 4 & 0x0f,
+            "eventCode": self.status & 0x0f
+        }
+
+    @property
+    def hasError(self):
+        """
+        Check if error bit is set inside packet.
+        """
+        return bool((self.opcode >> 6) & 0x01)
+
+    @property
+    def hasAlarm(self):
+        """
+        Check if alarm bit is set in leap indicator.
+        """
+        return bool(self.leap == 3)
+
+    @property
+    def hasWrongSize(self):
+        """
+        Check if packet exceeds max specified size.
+        """
+        return bool(self.count > self.MAX_CM_SIZE)
+
+    @property
+    def hasMorePackets(self):
+        """
+        Check if packet has 'more packets' bit set.
+        Server has more data prepared if this flag is active.
+        """
+        return bool((self.opcode >> 5) & 0x01)
+
+    @property
+    def isResponse(self):
+        """
+        Check if packet has response bit set (0x02).
+        """
+        return bool((self.opcode >> 1) & 0x01)
+
+    def getPeerOffset(self):
+        if self.peerData:
+            peerData = self.peerData[:self.count].strip().replace(" ", "")
+            peerDataDict = {
+                key: value for key, value
+                in [d.split("=") for d in peerData.split(",")]
+            }
+            tmpOffset = peerDataDict.get("offset", None)
+            if tmpOffset:
+                return float(tmpOffset) / 1000
+
+    def getVariables(self):
+        """
+        Extract variables of READVAR response.
+        :return: name -> value, values as strings
+        :rtype: dict
+        """
+        if not self.peerData:
+            return {}
+        return parseVariables(self.peerData[:self.count])
+
+    def setPeerToRequest(self, peer):
+        """
+        Set peer for which data will be requested.
+        :param peer: peer to set
+        """
+        self.assoc = peer
+
+    def setDataToRequest(self, requestDetails):
+        """
+        Set string that specifies variables to request about.
+        Empty string for all possible values.
+        :param requestDetails: requested variables separated by commma
+        """
+        self.data = requestDetails
+        self.count = len(requestDetails)
@@ -0,0 +1,172 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Pool of worker processes sharing NTP checks of the collector.
+
+Targets are hashed to workers, so a server is always checked by the
+same process. Each worker runs NtpEngine (see worker.py) and only sends
+result dicts back, codec and exchange work happen outside of the
+collector's reactor thread.
+"""
+
+import json
+import logging
+import os
+import sys
+import zlib
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.protocol import ProcessProtocol
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+WORKER_MODULE = "ZenPacks.zenoss.NtpMonitor.worker"
+# workers skip loading of the ZenPack into Zope, see __init__.py
+STANDALONE_ENV = "NTPMONITOR_STANDALONE"
+
+
+class NtpWorkerProtocol(ProcessProtocol):
+    """
+    Parent side of a worker process.
+    """
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.buffer = ""
+        self.pending = {}
+        self.requestCounter = 0
+
+    def check(self, request):
+        self.requestCounter += 1
+        request["id"] = self.requestCounter
+        d = Deferred()
+        self.pending[self.requestCounter] = d
+        self.transport.write(json.dumps(request) + "\n")
+        return d
+
+    def outReceived(self, data):
+        self.buffer += data
+        lines = self.buffer.split("\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            try:
+                response = json.loads(line)
+                d = self.pending.pop(response["id"])
+            except (ValueError, KeyError, TypeError):
+                log.warn("Invalid response from NTP worker %d: %r",
+                         self.index, line)
+                continue
+            if "error" in response:
+                d.errback(NtpException(response["error"]))
+            else:
+                d.callback(response["result"])
+
+    def errReceived(self, data):
+        log.debug("NTP worker %d: %s", self.index, data.rstrip())
+
+    def processEnded(self, reason):
+        log.debug("NTP worker %d ended: %s", self.index,
+                  reason.getErrorMessage())
+        self.pool.workerEnded(self)
+        pending, self.pending = self.pending, {}
+        for d in pending.itervalues():
+            d.errback(NtpException("NTP worker process exited"))
+
+
+class NtpWorkerPool(object):
+    """
+    Spawns worker processes on demand and distributes checks by target.
+    """
+    def __init__(self, size, parallel=256):
+        """
+        Initialize NtpWorkerPool.
+        :param size: number of worker processes
+        :param parallel: checks in flight per worker
+        """
+        self.size = max(int(size), 1)
+        self.parallel = parallel
+        self.workers = {}
+
+    def shard(self, host):
+        """
+        Return index of worker responsible for host.
+        """
+        return (zlib.crc32(str(host)) & 0xffffffff) % self.size
+
+    def getWorker(self, index):
+        worker = self.workers.get(index)
+        if worker is None:
+            worker = NtpWorkerProtocol(self, index)
+            args = [sys.executable, "-m", WORKER_MODULE,
+                    "--parallel", str(self.parallel)]
+            env = dict(os.environ)
+            env[STANDALONE_ENV] = "1"
+            reactor.spawnProcess(worker, sys.executable, args, env=env)
+            self.workers[index] = worker
+        return worker
+
+    def workerEnded(self, worker):
+        if self.workers.get(worker.index) is worker:
+            del self.workers[worker.index]
+
+    def check(self, host, port=None, timeout=None, warning=None,
+              critical=None, checkMode=None, lastEventCount=None):
+        """
+        Run NTP check in worker process.
+        :param checkMode: one of CHECK_* modes of NtpSession
+        :param lastEventCount: system event counter seen by previous check
+        :return: Deferred firing with NtpSession's result
+        :rtype: Deferred
+        """
+        request = {
+            "host": host,
+            "port": port,
+            "timeout": timeout,
+            "warning": warning,
+            "critical": critical,
+            "checkMode": checkMode,
+            "lastEventCount": lastEventCount
+        }
+        return self.getWorker(self.shard(host)).check(request)
+
+    def stop(self):
+        """
+        Close workers' input, they exit after finishing their checks.
+        """
+        for worker in self.workers.values():
+            worker.transport.closeStdin()
+        self.workers = {}
+
+
+_pool = None
+
+
+def getWorkerPool(size):
+    """
+    Return collector-wide pool with at least given number of workers.
+    Datasources asking for different sizes share the largest pool ever
+    requested, running workers and their checks are kept.
+    """
+    global _pool
+    size = max(int(size), 1)
+    if _pool is None:
+        _pool = NtpWorkerPool(size)
+        reactor.addSystemEventTrigger("before", "shutdown", _pool.stop)
+    elif size > _pool.size:
+        log.info("NTP worker pool grows from %d to %d workers",
+                 _pool.size, size)
+        # workers are spawned on demand, targets move to new shards
+        _pool.size = size
+    elif size < _pool.size:
+        log.debug("%d NTP workers requested, pool of %d workers kept",
+                  size, _pool.size)
+    return _pool
@@ -0,0 +1,149 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Opt-in profiling of the NTP collection hot path.
+
+Functions decorated with profiled() cost a single attribute check while
+profiling is disabled. When enabled, calls are timed per name and the
+outermost ones run under cProfile. Every interval the busiest names and
+functions are logged and the cProfile statistics can be dumped to a
+file for pstats or snakeviz. Profiling turns itself off after an
+interval in which nobody requested it.
+"""
+
+import functools
+import logging
+import time
+from StringIO import StringIO
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+
+class Profiler(object):
+    """
+    Aggregates timings and cProfile statistics of profiled calls.
+    """
+    def __init__(self, interval=300, top=10, clock=time.time):
+        """
+        Initialize Profiler.
+        :param interval: seconds between reports
+        :param top: number of entries in a report
+        :param clock: function returning current time in seconds
+        """
+        self.interval = interval
+        self.top = top
+        self.clock = clock
+        self.enabled = False
+        self.statsPath = None
+        self.lastRequest = None
+        self.reset()
+
+    def reset(self):
+        self.started = self.clock()
+        # name -> [calls, total time, maximal time]
+        self.timings = {}
+        self.depth = 0
+        self.profile = None
+        if self.enabled:
+            # loaded only once somebody asks for profiling
+            import cProfile
+            self.profile = cProfile.Profile()
+
+    def request(self, statsPath=None):
+        """
+        Enable profiling, or keep it enabled for the next interval.
+        :param statsPath: file for cProfile statistics of every interval
+        """
+        self.lastRequest = self.clock()
+        self.statsPath = statsPath
+        if not self.enabled:
+            log.info("NTP profiling enabled")
+            self.enabled = True
+            self.reset()
+
+    def call(self, name, func, args, kwargs):
+        outer = not self.depth
+        self.depth += 1
+        if outer:
+            self.profile.enable()
+        started = self.clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = self.clock() - started
+            self.depth -= 1
+            if outer:
+                self.profile.disable()
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = [0, 0.0, 0.0]
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+            if outer and self.clock() - self.started >= self.interval:
+                self.report()
+
+    def report(self):
+        """
+        Log hot spots of the finished interval and start a new one.
+        """
+        now = self.clock()
+        lines = ["NTP profile of last %.0f secs:" % (now - self.started),
+                 "%-40s %10s %12s %12s" % ("name", "calls", "total",
+                                           "max")]
+        timings = sorted(self.timings.iteritems(),
+                         key=lambda item: item[1][1], reverse=True)
+        for name, (calls, total, longest) in timings[:self.top]:
+            lines.append("%-40s %10d %12.6f %12.6f" % (
+                name, calls, total, longest
+            ))
+        if timings:
+            import pstats
+            output = StringIO()
+            stats = pstats.Stats(self.profile, stream=output)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            lines.append(output.getvalue())
+            if self.statsPath:
+                try:
+                    self.profile.dump_stats(self.statsPath)
+                except (IOError, OSError) as ex:
+                    log.warn("Unable to write NTP profile %s: %s",
+                             self.statsPath, ex)
+        log.info("\n".join(lines))
+        if now - self.lastRequest >= self.interval:
+            log.info("NTP profiling disabled")
+            self.enabled = False
+        self.reset()
+
+
+_profiler = Profiler()
+
+
+def getProfiler():
+    """
+    Return profiler of the process.
+    """
+    return _profiler
+
+
+def profiled(name):
+    """
+    Decorator measuring calls of function under name while profiling
+    is enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+            return _profiler.call(name, func, args, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,177 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Twisted adapters of chronyd and SNTP sessions and calibration of the
+collector's clock.
+
+Kept apart from the ntp module, so that plugins checking servers in the
+default mode do not load the chrony and sntp modules.
+"""
+
+import logging
+import time
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import LoopingCall
+from ZenPacks.zenoss.NtpMonitor.packet import STATE_UNKNOWN
+from ZenPacks.zenoss.NtpMonitor.chrony import ChronySession
+from ZenPacks.zenoss.NtpMonitor.sntp import SntpSession, Calibration
+from ZenPacks.zenoss.NtpMonitor.ntp import NtpProtocol, getReactor, execute
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+
+class ChronyProtocol(ChronySession, NtpProtocol):
+    """
+    Twisted adapter for ChronySession.
+    """
+
+    def __init__(self, host=None, port=None, timeout=None, warning=None,
+                 critical=None):
+        ChronySession.__init__(self, host, port, timeout, warning, critical)
+        self.d = None
+        self.timeoutCall = None
+        self.timers = None
+        self.peerCallback = None
+        self.capture = None
+        self.captureId = None
+        self.kernelTimestamps = False
+
+
+class SntpProtocol(SntpSession, NtpProtocol):
+    """
+    Twisted adapter for SntpSession.
+    """
+
+    def __init__(self, host=None, port=None, timeout=None, warning=None,
+                 critical=None):
+        SntpSession.__init__(self, host, port, timeout, warning, critical)
+        self.d = None
+        self.timeoutCall = None
+        self.timers = None
+        self.peerCallback = None
+        self.capture = None
+        self.captureId = None
+        self.kernelTimestamps = False
+
+
+class Calibrator(object):
+    """
+    Background task sampling reference servers every interval, keeping
+    Calibration of the collector's clock for SntpProtocol checks.
+    """
+    def __init__(self, interval=64.0, timeout=5.0, clock=None):
+        """
+        Initialize Calibrator.
+        :param interval: seconds between samples of references
+        :param timeout: seconds to wait for a reference
+        :param clock: provider of IReactorTime, reactor by default
+        """
+        self.interval = interval
+        self.timeout = timeout
+        self.clock = clock
+        self.calibration = Calibration()
+        self.references = set()
+        self.call = None
+        # samples of the first round still expected, checks waiting
+        # for them
+        self.pending = None
+        self.waiters = []
+
+    def addReferences(self, references):
+        """
+        Add reference servers and start sampling if it is not running.
+        :param references: hostnames of reference servers
+        """
+        added = set(references) - self.references
+        if added:
+            log.info("Calibrating collector's clock against %s",
+                     ", ".join(sorted(added)))
+            self.references.update(added)
+        if self.references and self.call is None:
+            self.call = LoopingCall(self.sample)
+            self.call.clock = self.clock or getReactor()
+            self.call.start(self.interval, now=True)
+
+    def whenReady(self):
+        """
+        Return Deferred firing once the first round of samples has been
+        answered or timed out, so that checks are not reported with no
+        correction while the references are being queried.
+        :rtype: Deferred
+        """
+        if self.pending == 0:
+            return succeed(None)
+        d = Deferred()
+        self.waiters.append(d)
+        return d
+
+    def sample(self):
+        """
+        Query all reference servers once.
+        """
+        from Products.ZenUtils.IpUtil import getHostByName
+        first = self.pending is None
+        if first:
+            self.pending = len(self.references)
+        for reference in sorted(self.references):
+            try:
+                address = getHostByName(reference)
+            except Exception:
+                log.debug("Unable to resolve reference %s", reference)
+                if first:
+                    self.done()
+                continue
+            protocol = SntpProtocol(address, timeout=self.timeout)
+            d = execute(protocol)
+            d.addCallback(self.sampled, reference, protocol)
+            d.addErrback(self.failed, reference)
+            if first:
+                d.addBoth(self.done)
+
+    def sampled(self, result, reference, protocol):
+        if result["offsetResult"] == STATE_UNKNOWN:
+            log.debug("Reference %s is not synchronized", reference)
+            return
+        self.calibration.add(reference, protocol.measured, protocol.delay,
+                             time.time())
+
+    def failed(self, failure, reference):
+        log.debug("Reference %s not sampled: %s", reference,
+                  failure.getErrorMessage())
+
+    def done(self, result=None):
+        """
+        Count a finished sample of the first round, release waiting
+        checks after the last one.
+        """
+        self.pending -= 1
+        if self.pending == 0:
+            waiters, self.waiters = self.waiters, []
+            for d in waiters:
+                d.callback(None)
+
+    def stop(self):
+        if self.call is not None and self.call.running:
+            self.call.stop()
+        self.call = None
+
+
+_calibrator = None
+
+
+def getCalibrator():
+    """
+    Return calibrator shared by all client mode checks of the process.
+    """
+    global _calibrator
+    if _calibrator is None:
+        _calibrator = Calibrator()
+    return _calibrator
@@ -0,0 +1,63 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Adaptive probing interval of one target.
+
+The collector still calls the datasource every cycle time, which is the
+floor of the interval. A target whose status and offset stay stable is
+probed at doubling intervals up to the ceiling; a noisy offset halves
+the interval and a status change or failure returns it to the floor.
+"""
+
+
+class PollSchedule(object):
+    """
+    Decides which collection cycles probe the target.
+    """
+    __slots__ = ("interval", "nextProbe")
+
+    def __init__(self):
+        self.interval = None
+        self.nextProbe = None
+
+    def getState(self):
+        return [self.interval, self.nextProbe]
+
+    def setState(self, state):
+        self.interval, self.nextProbe = state
+
+    def isDue(self, now, floor):
+        """
+        Return True if the target should be probed at time now.
+        :param floor: collection cycle time in seconds
+        """
+        # half a cycle of slack for the collector's scheduling jitter
+        return self.nextProbe is None or now >= self.nextProbe - floor / 2.0
+
+    def update(self, now, floor, ceiling, stable, reset=False):
+        """
+        Adjust the interval after a probe and plan the next one.
+        :param floor: collection cycle time in seconds
+        :param ceiling: maximal interval in seconds
+        :param stable: True if the probe showed nothing new
+        :param reset: True if status changed or the probe failed
+        :return: interval until the next probe
+        :rtype: float
+        """
+        interval = self.interval or floor
+        if reset or ceiling <= floor:
+            interval = floor
+        elif stable:
+            interval = min(interval * 2, ceiling)
+        else:
+            interval = max(interval / 2, floor)
+        self.interval = interval
+        self.nextProbe = now + interval
+        return interval
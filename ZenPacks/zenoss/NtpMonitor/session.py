@@ -0,0 +1,912 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+I/O-free state machine of the NTP mode 6 READSTAT/READVAR exchange.
+
+NtpSession consumes received datagrams (datagramReceived) and expired
+timers (timeoutHandler) and produces actions through emit():
+
+* (ACTION_SEND, data) - datagram to be sent to the NTP server
+* (ACTION_TIMER, delay) - arm the response timeout
+* (ACTION_CANCEL, None) - disarm the response timeout
+* (ACTION_PEER, (assocId, values)) - variables of a peer arrived
+* (ACTION_RESULT, result) - exchange finished, result dict
+* (ACTION_ERROR, exception) - exchange failed
+
+By default actions are queued and collected with popActions(), so a
+single loop can drive any number of sessions. NtpProtocol overrides
+emit() to execute them on top of the Twisted reactor.
+
+NtpPeerSession reads variables of all server's associations instead of
+picking a single offset.
+
+The check mode decides if offsets are read at all. CHECK_STATUS judges
+the server by the READSTAT response alone: leap, clock source and
+clock select bits of peers. CHECK_AUTO reads offsets only when the
+system event counter changed since the previous check (lastEventCount)
+or the server does not look healthy.
+"""
+
+import logging
+from ZenPacks.zenoss.NtpMonitor.packet import NtpPacket, NtpException, \
+    parseVariables, LEAP_MAP, STATUS_MAP, SYSTEM_EVENT_MAP, STATE_OK, \
+    STATE_UNKNOWN, STATE_WARNING, STATE_CRITICAL
+from ZenPacks.zenoss.NtpMonitor.profiling import profiled
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+ACTION_SEND = "send"
+ACTION_TIMER = "timer"
+ACTION_CANCEL = "cancel"
+ACTION_RESULT = "result"
+ACTION_ERROR = "error"
+ACTION_PEER = "peer"
+
+# variables of associations read by modeling and by collection
+PEER_VARIABLES = "srcadr,refid,stratum"
+PEER_STATS_VARIABLES = "offset,delay,jitter"
+# variables reported in milliseconds, converted to seconds
+MILLISECOND_VARIABLES = ("offset", "delay", "jitter", "dispersion")
+INTEGER_VARIABLES = ("stratum",)
+
+# policies combining results of several servers
+POLICY_BEST = "best"
+POLICY_MEDIAN = "median"
+POLICY_QUORUM = "quorum"
+
+# caps protecting the collector from misbehaving servers
+MAX_PEERS = 1024
+MAX_BUFFERED = 8192
+
+# modes of check
+CHECK_FULL = "full"
+CHECK_STATUS = "status"
+CHECK_AUTO = "auto"
+# SNTP query measuring server's clock against collector's, see sntp.py
+CHECK_CLIENT = "client"
+
+
+def formatResult(result):
+    """
+    Build check_ntp compatible description of exchange's result.
+    :param result: result returned by NtpSession.getResult
+    :return: final status, summary and output with performance data
+    :rtype: tuple
+    """
+    if result.get("headerOnly"):
+        return formatStatusResult(result)
+    status = result["status"]
+    if result["offsetResult"] == STATE_UNKNOWN:
+        status = STATE_CRITICAL
+    summary = STATUS_MAP.get(status, "NTP UNKNOWN:")
+    if not result["syncSource"]:
+        summary += " Server not synchronized"
+    elif result["liAlarm"]:
+        summary += " Server has the LI_ALARM bit set"
+    if result["offsetResult"] == STATE_UNKNOWN:
+        summary += " Offset unknown"
+    elif status == STATE_WARNING:
+        summary += " Offset %.10g secs (WARNING)" % result["offset"]
+    elif status == STATE_CRITICAL:
+        summary += " Offset %.10g secs (CRITICAL)" % result["offset"]
+    else:
+        summary += " Offset %.10g secs" % result["offset"]
+    if result.get("calibrated") is False:
+        # collector's clock was not corrected by reference servers
+        summary += " (uncalibrated)"
+    servers = result.get("servers")
+    if servers and len(servers) > 1:
+        summary += " (%d of %d servers responding)" % (
+            result["responding"], len(servers)
+        )
+    if result["offsetResult"] != STATE_UNKNOWN:
+        output = summary + "|offset=%.10gs;%.6f;%.6f;" % (
+            result["offset"], result["warning"], result["critical"]
+        )
+        if "calibrated" in result:
+            output += " calibrated=%d" % result["calibrated"]
+    else:
+        output = summary
+    return status, summary, output
+
+
+def formatStatusResult(result):
+    """
+    Build description of result of check without offsets.
+    """
+    status = result["status"]
+    summary = STATUS_MAP.get(status, "NTP UNKNOWN:")
+    if not result["syncSource"]:
+        summary += " Server not synchronized"
+    elif result["liAlarm"]:
+        summary += " Server has the LI_ALARM bit set"
+    else:
+        summary += " Server synchronized"
+    systemStatus = result.get("systemStatus")
+    if systemStatus:
+        summary += " (last event: %s)" % SYSTEM_EVENT_MAP.get(
+            systemStatus["eventCode"], systemStatus["eventCode"]
+        )
+    return status, summary, summary
+
+
+def getOffsetStatus(offset, warning, critical):
+    """
+    Compare offset to limits and return appropriate status.
+    """
+    if offset > critical:
+        return STATE_CRITICAL
+    elif offset > warning:
+        return STATE_WARNING
+    return STATE_OK
+
+
+def combineResults(results, policy=POLICY_BEST, quorum=1):
+    """
+    Combine results of several servers into one.
+    :param results: results of NtpSession.getResult, None for failed servers
+    :param policy: POLICY_BEST takes the server with the smallest offset,
+        POLICY_MEDIAN the median offset, POLICY_QUORUM the median offset
+        known by at least quorum servers
+    :param quorum: number of servers required by POLICY_QUORUM
+    :return: result of the same form, with results of all servers and
+        number of responding servers
+    :rtype: dict
+    """
+    answered = [result for result in results if result is not None]
+    known = [result for result in answered
+             if result["offsetResult"] != STATE_UNKNOWN]
+    if not known:
+        combined = dict(answered[0])
+    elif policy not in (POLICY_MEDIAN, POLICY_QUORUM):
+        combined = dict(min(known, key=lambda result: abs(result["offset"])))
+    else:
+        offsets = sorted(result["offset"] for result in known)
+        middle = len(offsets) // 2
+        if len(offsets) % 2:
+            offset = offsets[middle]
+        else:
+            offset = (offsets[middle - 1] + offsets[middle]) / 2.0
+        combined = dict(known[0])
+        combined["offset"] = offset
+        # server flags are decided by majority
+        combined["syncSource"] = \
+            2 * sum(result["syncSource"] for result in known) > len(known)
+        combined["liAlarm"] = \
+            2 * sum(result["liAlarm"] for result in known) > len(known)
+        status = STATE_OK
+        if not combined["syncSource"] or combined["liAlarm"]:
+            status = STATE_WARNING
+        combined["status"] = max(status, getOffsetStatus(
+            offset, combined["warning"], combined["critical"]
+        ))
+        if policy == POLICY_QUORUM and len(known) < quorum:
+            log.debug("Offset known by %d servers, quorum is %d",
+                      len(known), quorum)
+            combined["offsetResult"] = STATE_UNKNOWN
+    combined["servers"] = results
+    combined["responding"] = len(answered)
+    return combined
+
+
+class NtpSession(object):
+    """
+    Sans-IO logic for NTP protocol.
+
+    Instances are compact (__slots__) and can be recycled with reset(),
+    see SessionPool. Both apply to plain sessions driven by NtpEngine
+    (zenntpcheck and worker processes); Twisted adapters such as
+    NtpProtocol also derive from DatagramProtocol, keep an instance
+    dict and are not pooled.
+    """
+    __slots__ = (
+        "host", "port", "timeout", "warning", "critical", "version",
+        "peersToCheck", "readstat", "sequenceCounter", "getvar",
+        "minPeerSource", "currentPeer", "status", "offsetResult", "offset",
+        "syncSource", "liAlarm", "dataQueue", "dataQueueCtr", "finished",
+        "peerError", "actions", "sentTime", "rtt", "checkMode",
+        "lastEventCount", "systemStatus", "headerOnly", "__weakref__"
+    )
+    DEFAULT_PORT = 123
+    DEFAULT_TIMEOUT = 60.0
+    DEFAULT_WARNING = 60.0
+    DEFAULT_CRITICAL = 120.0
+
+    def __init__(self, host=None, port=None, timeout=None, warning=None,
+                 critical=None, version=2):
+        """
+        Initialize NtpSession class.
+        :param host: targeted host
+        :param port: exposed server's port, 123 by default
+        :param timeout: timeout for socket's calls, 60 seconds by default
+        :param warning: value causes warning status, 60 seconds by default
+        :param critical: value causes critical status, 120 seconds by default
+        :param version: version number of NTP protocol
+        """
+        self.peersToCheck = {}
+        self.actions = []
+        self.reset(host, port, timeout, warning, critical, version)
+
+    def reset(self, host=None, port=None, timeout=None, warning=None,
+              critical=None, version=2):
+        """
+        Prepare session for a new exchange, keeping its containers.
+        Parameters are the same as of __init__.
+        """
+        self.host = host
+        self.port = self.DEFAULT_PORT
+        self.timeout = self.DEFAULT_TIMEOUT
+        self.warning = self.DEFAULT_WARNING
+        self.critical = self.DEFAULT_CRITICAL
+        if port:
+            self.parsePort(port)
+        if timeout:
+            self.parseTimeout(timeout)
+        self.parseThresholds(warning, critical)
+        self.version = version
+        self.peersToCheck.clear()
+        self.readstat = True
+        self.sequenceCounter = 1
+        self.getvar = "offset"
+        self.minPeerSource = 4  # peer included
+        self.currentPeer = None
+        self.status = STATE_OK
+        self.offsetResult = STATE_UNKNOWN
+        self.offset = 0
+        self.syncSource = False
+        self.liAlarm = False
+        self.dataQueue = ""
+        self.dataQueueCtr = 0
+        self.finished = False
+        self.peerError = None
+        del self.actions[:]
+        # time of the unanswered request and shortest round trip, set
+        # by the driver through requestSent() and responseReceived()
+        self.sentTime = None
+        self.rtt = None
+        self.checkMode = CHECK_FULL
+        # event counter of system status seen by previous check
+        self.lastEventCount = None
+        self.systemStatus = None
+        self.headerOnly = False
+
+    def emit(self, action, value=None):
+        """
+        Output of the state machine. Queues action for the driver.
+        :param action: one of ACTION_* constants
+        :param value: value related to action
+        """
+        self.actions.append((action, value))
+
+    def popActions(self):
+        """
+        Return and forget actions produced since last call.
+        :return: list of (action, value) tuples
+        :rtype: list
+        """
+        actions, self.actions = self.actions, []
+        return actions
+
+    def finish(self, result):
+        self.finished = True
+        self.emit(ACTION_RESULT, result)
+
+    def fail(self, err):
+        self.finished = True
+        self.emit(ACTION_ERROR, err)
+
+    def requestSent(self, when):
+        """
+        Record time a request was sent.
+        """
+        self.sentTime = when
+
+    def responseReceived(self, when):
+        """
+        Update the round trip time with arrival time of a response.
+        Later fragments of the same response are not counted.
+        """
+        if self.sentTime is None:
+            return
+        rtt = when - self.sentTime
+        self.sentTime = None
+        if rtt >= 0 and (self.rtt is None or rtt < self.rtt):
+            self.rtt = rtt
+
+    def parsePort(self, port):
+        try:
+            self.port = int(port)
+        except (ValueError, TypeError):
+            log.debug("Wrong value for port is specified. Using default: %i",
+                      self.port)
+
+    def parseTimeout(self, timeout):
+        try:
+            self.timeout = float(timeout)
+        except (ValueError, TypeError):
+            log.debug("Unable to parse timeout's value. Using default: %.2fs",
+                      self.timeout)
+
+    def parseThresholds(self, warning, critical):
+        """
+        Set limits for received offset from provided values.
+        """
+        if warning:
+            try:
+                self.warning = float(warning)
+            except (ValueError, TypeError):
+                log.debug("Unable to parse warning's value. Using default: %.2fs",
+                          self.warning)
+        if critical:
+            try:
+                self.critical = float(critical)
+            except (ValueError, TypeError):
+                log.debug("Unable to parse critical's value. Using default: %.2fs",
+                          self.critical)
+
+    def updateOffset(self, tmpOffset):
+        """
+        Update final offset under certain conditions.
+        :param tmpOffset: peer's offset value
+        """
+
+        offsetAbs = abs(self.offset)
+        tmpOffsetAbs = abs(tmpOffset)
+
+        if self.offsetResult == STATE_UNKNOWN or tmpOffsetAbs < offsetAbs:
+            self.offset = tmpOffset
+            self.offsetResult = STATE_OK
+
+    def getProcessedOffset(self):
+        """
+        Compare offset to limits and return appropriate status.
+        :return: state of status after processing
+        :rtype: int
+        """
+        if self.offsetResult == STATE_UNKNOWN:
+            return STATE_UNKNOWN
+        return getOffsetStatus(self.offset, self.warning, self.critical)
+
+    def getMaxStatus(self):
+        return max(self.status, self.offsetResult)
+
+    def getClockStatus(self, peerStatus):
+        """
+        Return clock's status of NTP server.
+        Possible values:
+        * 0x06 PEER SYNCSOURCE
+        * 0x04 PEER INCLUDED
+        * 0x02 PEER TRUECHIMER
+        :param peerStatus: received peer's status
+        :return: clock's status
+        :rtype: int
+        """
+        return (peerStatus >> 8) & 0x07
+
+    def start(self):
+        """
+        Begin the exchange by sending READSTAT request.
+        """
+        if not self.host:
+            self.fail(NtpException("Host is not specified. Please check hostname"))
+            return
+        log.debug("Protocol started for %s on port %d", self.host, self.port)
+        self.sendReadstatRequest()
+
+    def timeoutHandler(self):
+        if self.finished:
+            return
+        if not self.readstat and self.offsetResult != STATE_UNKNOWN:
+            log.info("Timeout. No response for peer %d after %.2fs, "
+                     "skipping %d remaining peers", self.currentPeer,
+                     self.timeout, len(self.peersToCheck))
+            self.peersToCheck = {}
+            self.controlReadvarExchange()
+            return
+        log.info("Timeout. No response from NTP server after %.2fs",
+                 self.timeout)
+        self.fail(NtpException("Timeout. No response from NTP server"))
+
+    @profiled("NtpSession.datagramReceived")
+    def datagramReceived(self, data, addr=None):
+        log.debug("Datagram received from %s", addr)
+        if self.finished:
+            log.debug("Exchange already finished, ignoring datagram")
+            return
+        self.emit(ACTION_CANCEL)
+        if self.readstat:
+            self.processReadstatResponse(data, addr)
+        else:
+            self.processReadvarResponse(data, addr)
+
+    def connectionRefused(self):
+        if self.finished:
+            return
+        self.fail(NtpException("Connection refused"))
+
+    def updateReadstatStatus(self):
+        if not self.syncSource:
+            self.status = STATE_WARNING
+        if self.liAlarm:
+            self.status = STATE_WARNING
+
+    def checkCandidates(self):
+        """
+        Check if NTP server sent proper candidates to ask for NTP's offset.
+        """
+        log.debug("Processing READSTAT responses for %d peers",
+                  len(self.peersToCheck))
+        # figure out self.minPeerSource
+        for peer, peerStatus in self.peersToCheck.iteritems():
+            clockSelect = self.getClockStatus(peerStatus)
+            # self.minPeerSource == 4 by default
+            if clockSelect == 6:  # 0x06 PEER SYNCSOURCE
+                self.minPeerSource = 6
+                self.syncSource = True
+                log.debug("Synchronization source found, peer: %d", peer)
+        # only include peers for which clockSelect >= self.minPeerSource
+        candidates = []
+        for peer, peerStatus in self.peersToCheck.iteritems():
+            if self.getClockStatus(peerStatus) >= self.minPeerSource:
+                candidates.append((peer, peerStatus))
+        self.peersToCheck = dict(candidates)
+        peerCandidates = len(self.peersToCheck.keys())
+        log.debug("%d candidate peers available", peerCandidates)
+        self.updateReadstatStatus()
+
+    def sendReadstatRequest(self):
+        packet = NtpPacket(self.version, sequence=self.sequenceCounter)
+        try:
+            data = packet.toDataReadstat()
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return
+        self.emit(ACTION_SEND, data)
+        self.emit(ACTION_TIMER, self.timeout)
+        log.debug("READSTAT request was sent to host %s", self.host)
+
+    def controlReadvarExchange(self):
+        """
+        Controls process of READVAR exchange.
+        """
+        if self.peersToCheck:
+            peer, _ = self.peersToCheck.popitem()
+            self.currentPeer = peer
+            self.sendReadvarRequest()
+        elif self.offsetResult == STATE_UNKNOWN and self.peerError:
+            self.fail(self.peerError)
+        else:
+            self.status = self.getProcessedOffset()
+            self.status = self.getMaxStatus()
+            data = self.getResult()
+            self.finish(data)
+
+    def processReadstatResponse(self, data, addr):
+        log.debug("READSTAT response was received from %s", addr)
+        try:
+            packet = NtpPacket.fromData(data)
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return
+        if packet.hasWrongSize:
+            log.debug("Invalid READSTAT packet (MAX_CM_SIZE) "
+                      "was received from host %s", self.host)
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if packet.sequence != self.sequenceCounter:
+            log.debug("Wrong sequence number was set in packet")
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if packet.hasError:
+            log.debug("Error bit was set in packet")
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if LEAP_MAP.get(packet.leap, None):
+            if packet.hasAlarm:
+                log.info("Leap indicator: alarm bit is set")
+                self.liAlarm = True
+        else:
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if self.systemStatus is None:
+            self.systemStatus = packet.systemStatus
+            if self.systemStatus["leap"] == 3:
+                self.liAlarm = True
+        try:
+            self.peersToCheck.update(packet.peers)
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return
+        if len(self.peersToCheck) > MAX_PEERS:
+            log.debug("More than %d peers reported by host %s", MAX_PEERS,
+                      self.host)
+            self.fail(NtpException("Too many peers reported by NTP server"))
+            return
+        if not packet.hasMorePackets:
+            self.readstat = False
+            self.sequenceCounter += 1
+            self.checkCandidates()
+            if not self.needsReadvar():
+                log.debug("Offsets of %s not read, %s check", self.host,
+                          self.checkMode)
+                self.headerOnly = True
+                self.finish(self.getResult())
+                return
+            self.controlReadvarExchange()
+        else:
+            # wait for the next fragment
+            self.emit(ACTION_TIMER, self.timeout)
+
+    def needsReadvar(self):
+        """
+        Decide after READSTAT if offsets have to be read.
+        """
+        if self.checkMode == CHECK_STATUS:
+            return False
+        if self.checkMode != CHECK_AUTO:
+            return True
+        if self.lastEventCount is None or self.systemStatus is None:
+            return True
+        return self.status != STATE_OK or \
+            self.systemStatus["eventCount"] != self.lastEventCount
+
+    def sendReadvarRequest(self):
+        log.debug("Getting offset for peer %d", self.currentPeer)
+        packet = NtpPacket(
+            version=self.version, sequence=self.sequenceCounter, opcode=2
+        )
+        packet.setPeerToRequest(self.currentPeer)
+        packet.setDataToRequest(self.getvar)
+        try:
+            data = packet.toDataReadvar()
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return
+        self.emit(ACTION_SEND, data)
+        self.emit(ACTION_TIMER, self.timeout)
+        # ZPS-3520. Set self.minPeerSource to the default value.
+        self.minPeerSource = 4
+
+    def processReadvarResponse(self, data, addr):
+        log.debug("READVAR response was received from %s", addr)
+        try:
+            packet = NtpPacket.fromData(data)
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return
+        if packet.hasWrongSize:
+            log.debug("Invalid READVAR packet (MAX_CM_SIZE) "
+                      "was received from host %s", self.host)
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if packet.sequence != self.sequenceCounter:
+            log.debug("Wrong sequence number was set in packet")
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if packet.assoc != self.currentPeer:
+            # READVAR requests share the sequence number, fragments of
+            # a skipped peer may still arrive
+            log.debug("Ignoring READVAR response of peer %d, waiting for "
+                      "peer %d", packet.assoc, self.currentPeer)
+            # the timeout was cancelled as the datagram arrived
+            self.emit(ACTION_TIMER, self.timeout)
+            return
+        if packet.hasError:
+            if self.getvar:
+                log.debug("Error bit set in packet, trying to get "
+                          "all possible values")
+                self.getvar = ""
+                self.sendReadvarRequest()
+                return
+            else:
+                log.debug("Error bit was set in packet")
+                self.skipPeer(
+                    NtpException("Invalid packet received from NTP server")
+                )
+                return
+        if not packet.isResponse:
+            self.skipPeer(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        if packet.hasMorePackets:
+            self.dataQueue += packet.peerData or ""
+            self.dataQueueCtr += packet.count
+            if len(self.dataQueue) > MAX_BUFFERED:
+                log.debug("READVAR response of peer %d exceeds %d bytes",
+                          self.currentPeer, MAX_BUFFERED)
+                self.dataQueue = ""
+                self.dataQueueCtr = 0
+                self.skipPeer(
+                    NtpException("Response of NTP server is too long")
+                )
+            else:
+                # wait for the next fragment
+                self.emit(ACTION_TIMER, self.timeout)
+        else:
+            packet.peerData = self.dataQueue + (packet.peerData or "")
+            packet.count += self.dataQueueCtr
+            self.dataQueue = ""
+            self.dataQueueCtr = 0
+            tmpOffset = packet.getPeerOffset()
+            if tmpOffset:
+                log.debug("Offset for peer %d: %f", self.currentPeer, tmpOffset)
+                self.updateOffset(tmpOffset)
+                self.emit(ACTION_PEER, (self.currentPeer, {"offset": tmpOffset}))
+            self.controlReadvarExchange()
+
+    def skipPeer(self, err):
+        """
+        Continue with remaining peers after failure of the current one.
+        The exchange fails with err only if no offset is known at the end.
+        """
+        log.debug("Skipping peer %d: %s", self.currentPeer, err)
+        self.peerError = err
+        self.controlReadvarExchange()
+
+    def getResult(self):
+        """
+        Return result of executing NTP protocol.
+        :return: final values after exchange
+        :rtype: dict
+        """
+        result = {
+            "offset": self.offset,
+            "offsetResult": self.offsetResult,
+            "status": self.status,
+            "syncSource": self.syncSource,
+            "liAlarm": self.liAlarm,
+            "warning": self.warning,
+            "critical": self.critical
+        }
+        if self.rtt is not None:
+            result["rtt"] = self.rtt
+        if self.systemStatus is not None:
+            result["systemStatus"] = self.systemStatus
+        if self.headerOnly:
+            result["headerOnly"] = True
+        return result
+
+
+class NtpPeerSession(NtpSession):
+    """
+    Sans-IO exchange reading variables of all server's associations.
+
+    Unless association IDs are known, they are discovered with READSTAT
+    first. READVAR requests of all associations are then sent at once,
+    each with its own sequence number, under a single timeout.
+    """
+    __slots__ = ("assocIds", "variables", "peers", "pending", "fragments",
+                 "answered")
+
+    def __init__(self, host=None, port=None, timeout=None, assocIds=None,
+                 variables=PEER_VARIABLES, version=2):
+        """
+        Initialize NtpPeerSession class.
+        :param assocIds: IDs of associations to read, None to discover them
+        :param variables: names of variables separated by comma
+        """
+        NtpSession.__init__(self, host, port, timeout, version=version)
+        self.assocIds = assocIds
+        self.variables = variables
+        # association ID -> dict of variables
+        self.peers = {}
+        # sequence number -> (association ID, requested variables)
+        self.pending = {}
+        # sequence number -> data of previous fragments
+        self.fragments = {}
+        self.answered = 0
+
+    def start(self):
+        if not self.host:
+            self.fail(NtpException("Host is not specified. Please check hostname"))
+            return
+        log.debug("Peer exchange started for %s on port %d", self.host,
+                  self.port)
+        if self.assocIds is None:
+            self.sendReadstatRequest()
+            return
+        self.readstat = False
+        for assocId in self.assocIds:
+            self.peers[assocId] = {"assocId": assocId}
+        self.controlReadvarExchange()
+
+    @profiled("NtpPeerSession.datagramReceived")
+    def datagramReceived(self, data, addr=None):
+        if self.finished:
+            log.debug("Exchange already finished, ignoring datagram")
+            return
+        if self.readstat:
+            self.emit(ACTION_CANCEL)
+            self.processReadstatResponse(data, addr)
+        else:
+            self.processPeerResponse(data, addr)
+
+    def timeoutHandler(self):
+        if self.finished:
+            return
+        if self.answered:
+            log.info("Timeout. %d peers did not respond after %.2fs",
+                     len(self.pending), self.timeout)
+            self.pending = {}
+            self.finish(self.getResult())
+            return
+        NtpSession.timeoutHandler(self)
+
+    def checkCandidates(self):
+        """
+        Record all associations, not only candidates for the offset.
+        """
+        for peer, peerStatus in self.peersToCheck.iteritems():
+            clockSelect = self.getClockStatus(peerStatus)
+            self.peers[peer] = {"assocId": peer, "clockSelect": clockSelect}
+            if clockSelect == 6:  # 0x06 PEER SYNCSOURCE
+                self.syncSource = True
+        self.peersToCheck = {}
+        self.updateReadstatStatus()
+
+    def controlReadvarExchange(self):
+        if not self.peers:
+            self.finish(self.getResult())
+            return
+        for assocId in sorted(self.peers):
+            if not self.sendPeerRequest(assocId, self.variables):
+                return
+        self.emit(ACTION_TIMER, self.timeout)
+
+    def sendPeerRequest(self, assocId, variables):
+        """
+        Send READVAR request for one association.
+        :return: False if request could not be built
+        :rtype: bool
+        """
+        self.sequenceCounter = self.sequenceCounter % 0xffff + 1
+        packet = NtpPacket(
+            version=self.version, sequence=self.sequenceCounter, opcode=2
+        )
+        packet.setPeerToRequest(assocId)
+        packet.setDataToRequest(variables)
+        try:
+            data = packet.toDataReadvar()
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return False
+        self.pending[self.sequenceCounter] = (assocId, variables)
+        self.emit(ACTION_SEND, data)
+        return True
+
+    def processPeerResponse(self, data, addr):
+        try:
+            packet = NtpPacket.fromData(data)
+        except NtpException as ntpEx:
+            self.fail(ntpEx)
+            return
+        if packet.hasWrongSize:
+            log.debug("Invalid READVAR packet (MAX_CM_SIZE) "
+                      "was received from host %s", self.host)
+            self.fail(
+                NtpException("Invalid packet received from NTP server")
+            )
+            return
+        request = self.pending.get(packet.sequence)
+        if request is None or request[0] != packet.assoc or \
+                not packet.isResponse:
+            log.debug("Unexpected READVAR response from %s", addr)
+            return
+        assocId, variables = self.pending.pop(packet.sequence)
+        if packet.hasError:
+            if variables:
+                log.debug("Error bit set in packet, trying to get all "
+                          "possible values of association %d", assocId)
+                if not self.sendPeerRequest(assocId, ""):
+                    return
+            else:
+                log.debug("Variables of association %d not available",
+                          assocId)
+                self.answered += 1
+        else:
+            text = self.fragments.pop(packet.sequence, "") + \
+                (packet.peerData or "")[:packet.count]
+            if packet.hasMorePackets and len(text) > MAX_BUFFERED:
+                log.debug("Variables of association %d exceed %d bytes",
+                          assocId, MAX_BUFFERED)
+                text = ""
+            elif packet.hasMorePackets:
+                self.pending[packet.sequence] = (assocId, variables)
+                self.fragments[packet.sequence] = text
+                return
+            self.answered += 1
+            self.updatePeer(assocId, parseVariables(text))
+            self.emit(ACTION_PEER, (assocId, self.peers[assocId]))
+        if not self.pending:
+            self.emit(ACTION_CANCEL)
+            self.finish(self.getResult())
+
+    def updatePeer(self, assocId, values):
+        """
+        Store requested variables of association, converted to numbers
+        where their meaning is known.
+        """
+        peer = self.peers[assocId]
+        for name in self.variables.split(","):
+            value = values.get(name)
+            if value is None:
+                continue
+            try:
+                if name in MILLISECOND_VARIABLES:
+                    value = float(value) / 1000
+                elif name in INTEGER_VARIABLES:
+                    value = int(value)
+            except ValueError:
+                log.debug("Invalid value of %s for association %d: %r",
+                          name, assocId, value)
+                continue
+            peer[name] = value
+
+    def getResult(self):
+        """
+        Return result of the peer exchange.
+        :return: associations sorted by ID and status of the server
+        :rtype: dict
+        """
+        return {
+            "peers": [self.peers[assocId] for assocId in sorted(self.peers)],
+            "syncSource": self.syncSource,
+            "liAlarm": self.liAlarm
+        }
+
+
+class SessionPool(object):
+    """
+    Free list of NtpSession instances, so that NtpEngine does not
+    allocate a session and its containers for every check. Sessions of
+    the collector's own checks are NtpProtocol instances, which are
+    bound to their transport and Deferred and are not pooled.
+    """
+    def __init__(self, maxSize=1024):
+        """
+        Initialize SessionPool.
+        :param maxSize: maximal number of idle sessions kept
+        """
+        self.maxSize = maxSize
+        self.free = []
+
+    def acquire(self, host=None, port=None, timeout=None, warning=None,
+                critical=None, version=2):
+        """
+        Return session prepared for exchange with host.
+        :rtype: NtpSession
+        """
+        if self.free:
+            session = self.free.pop()
+            session.reset(host, port, timeout, warning, critical, version)
+            return session
+        return NtpSession(host, port, timeout, warning, critical, version)
+
+    def release(self, session):
+        """
+        Return finished session to the pool. Sessions of other
+        classes are not kept.
+        """
+        if type(session) is NtpSession and len(self.free) < self.maxSize:
+            self.free.append(session)
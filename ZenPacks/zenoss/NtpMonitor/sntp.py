@@ -0,0 +1,235 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+I/O-free SNTP client exchange and calibration of the collector's clock.
+
+SntpSession sends one NTP mode 3 request and measures the server's
+clock against the collector's one, as check_ntp_time does. Such an
+offset is only as good as the collector's clock, so Calibration keeps
+an estimate of the collector's own offset from a few reference servers.
+Sessions given a Calibration report offsets against the references.
+
+Per reference the sample with the shortest delay of the recent ones is
+used, as NTP's clock filter does, and the estimate is the median of the
+references.
+"""
+
+import logging
+import struct
+import time
+from collections import deque
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException, STATE_OK, \
+    STATE_UNKNOWN, STATE_WARNING
+from ZenPacks.zenoss.NtpMonitor.session import NtpSession, \
+    ACTION_SEND, ACTION_TIMER, ACTION_CANCEL, CHECK_CLIENT
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+# seconds from 1900-01-01 to 1970-01-01
+NTP_EPOCH = 2208988800
+MODE_CLIENT = 3
+MODE_SERVER = 4
+SNTP_VERSION = 4
+LEAP_UNSYNCHRONIZED = 3
+
+# LI/VN/mode, stratum, poll, precision, root delay, root dispersion,
+# reference id, reference, originate, receive and transmit timestamps
+SNTP_PACKET = struct.Struct("!BBbbII4s8I")
+
+
+def toTimestamp(seconds):
+    """
+    Return NTP timestamp of Unix time as (seconds, fraction).
+    """
+    seconds += NTP_EPOCH
+    whole = int(seconds)
+    return whole, int((seconds - whole) * 0x100000000) & 0xffffffff
+
+
+def fromTimestamp(seconds, fraction):
+    """
+    Return Unix time of NTP timestamp.
+    """
+    return seconds - NTP_EPOCH + fraction / float(0x100000000)
+
+
+def buildRequest(transmitted):
+    """
+    Return mode 3 request with transmit timestamp of time transmitted.
+    """
+    return SNTP_PACKET.pack(
+        SNTP_VERSION << 3 | MODE_CLIENT, 0, 0, 0, 0, 0, "\x00" * 4,
+        0, 0, 0, 0, 0, 0, *toTimestamp(transmitted)
+    )
+
+
+class Calibration(object):
+    """
+    Filtered estimate of the collector's offset from reference servers.
+    """
+    def __init__(self, samples=8, maxAge=3600.0):
+        """
+        Initialize Calibration.
+        :param samples: number of recent samples kept per reference
+        :param maxAge: seconds after which a sample is not used
+        """
+        self.samples = samples
+        self.maxAge = maxAge
+        # reference -> (delay, offset, time) samples
+        self.filters = {}
+        self.estimate = None
+        self.updated = None
+
+    def add(self, reference, offset, delay, when):
+        """
+        Record sample of reference and update the estimate.
+        :param offset: reference's clock minus collector's, in seconds
+        :param delay: round trip delay of the sample
+        """
+        window = self.filters.get(reference)
+        if window is None:
+            window = self.filters[reference] = deque(maxlen=self.samples)
+        window.append((delay, offset, when))
+        best = []
+        for window in self.filters.itervalues():
+            fresh = [sample for sample in window
+                     if when - sample[2] <= self.maxAge]
+            if fresh:
+                best.append(min(fresh)[1])
+        best.sort()
+        middle = len(best) // 2
+        if len(best) % 2:
+            self.estimate = best[middle]
+        else:
+            self.estimate = (best[middle - 1] + best[middle]) / 2.0
+        self.updated = when
+        log.debug("Collector's clock offset %.6f secs from %d references",
+                  self.estimate, len(best))
+
+    def getCorrection(self, now):
+        """
+        Return collector's offset from references, 0 if unknown or not
+        refreshed for maxAge.
+        :rtype: float
+        """
+        if not self.isKnown(now):
+            return 0.0
+        return self.estimate
+
+    def isKnown(self, now):
+        """
+        Return True if an estimate refreshed within maxAge exists.
+        """
+        return self.estimate is not None and now - self.updated <= self.maxAge
+
+
+class SntpSession(NtpSession):
+    """
+    Sans-IO SNTP exchange measuring server's clock against collector's.
+    """
+    __slots__ = ("clock", "transmitted", "received", "measured", "delay",
+                 "stratum", "correction", "calibration", "calibrated")
+
+    def __init__(self, host=None, port=None, timeout=None, warning=None,
+                 critical=None, clock=time.time):
+        """
+        Initialize SntpSession.
+        :param clock: function returning current time in seconds
+        """
+        NtpSession.__init__(self, host, port, timeout, warning, critical)
+        self.clock = clock
+        self.checkMode = CHECK_CLIENT
+        self.transmitted = None
+        self.received = None
+        # server's clock minus collector's
+        self.measured = None
+        self.delay = None
+        self.stratum = None
+        self.correction = 0.0
+        # Calibration of the collector's clock, read when reply arrives
+        self.calibration = None
+        # None without calibration, False if it had no estimate yet
+        self.calibrated = None
+
+    def start(self):
+        if not self.host:
+            self.fail(NtpException("Host is not specified. Please check hostname"))
+            return
+        log.debug("SNTP check started for %s on port %d", self.host,
+                  self.port)
+        self.transmitted = self.clock()
+        self.emit(ACTION_SEND, buildRequest(self.transmitted))
+        self.emit(ACTION_TIMER, self.timeout)
+
+    def responseReceived(self, when):
+        NtpSession.responseReceived(self, when)
+        self.received = when
+
+    def datagramReceived(self, data, addr=None):
+        if self.finished:
+            log.debug("Exchange already finished, ignoring datagram")
+            return
+        try:
+            values = SNTP_PACKET.unpack_from(data)
+        except struct.error:
+            log.debug("Short SNTP reply from %s", addr)
+            return
+        first, stratum, refId = values[0], values[1], values[6]
+        originate = values[9:11]
+        if first & 0x07 != MODE_SERVER or \
+                originate != toTimestamp(self.transmitted):
+            log.debug("Unexpected SNTP reply from %s", addr)
+            return
+        self.emit(ACTION_CANCEL)
+        if not stratum:
+            self.fail(NtpException(
+                "Kiss-o'-Death from NTP server: %s" % refId.strip("\x00")
+            ))
+            return
+        received = self.received or self.clock()
+        serverReceived = fromTimestamp(*values[11:13])
+        serverTransmitted = fromTimestamp(*values[13:15])
+        self.measured = ((serverReceived - self.transmitted) +
+                         (serverTransmitted - received)) / 2
+        self.delay = (received - self.transmitted) - \
+            (serverTransmitted - serverReceived)
+        self.stratum = stratum
+        leap = first >> 6
+        self.liAlarm = leap == LEAP_UNSYNCHRONIZED
+        self.syncSource = not self.liAlarm
+        if self.calibration is not None:
+            self.correction = self.calibration.getCorrection(received)
+            self.calibrated = self.calibration.isKnown(received)
+        if self.syncSource:
+            # positive when the server's clock is behind, as ntpd's
+            self.offset = self.correction - self.measured
+            self.offsetResult = STATE_OK
+        self.finish(self.getResult())
+
+    def getResult(self):
+        """
+        Return result of the check, NtpSession's result with server's
+        stratum, delay and the correction of the collector's clock.
+        :rtype: dict
+        """
+        self.status = STATE_OK
+        if not self.syncSource:
+            self.status = STATE_WARNING
+        if self.offsetResult != STATE_UNKNOWN:
+            self.status = max(self.status, self.getProcessedOffset())
+        result = NtpSession.getResult(self)
+        if self.stratum is not None:
+            result["stratum"] = self.stratum
+            result["delay"] = self.delay
+            result["correction"] = self.correction
+        if self.calibrated is not None:
+            result["calibrated"] = self.calibrated
+        return result
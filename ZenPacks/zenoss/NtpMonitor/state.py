@@ -0,0 +1,152 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+On-disk state of NTP datasources surviving collector restarts.
+
+State of every target is a small JSON document in one SQLite table. It
+is read when the target is collected for the first time and written
+back in batches, at most once per flush interval, so a restarted
+collector continues with its schedules, detectors and event states
+instead of starting from scratch.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+STATE_FILE = ("var", "ntpmonitor", "state.sqlite")
+
+
+class StateStore(object):
+    """
+    Key-value store of targets' state, read lazily and flushed in batches.
+    """
+    def __init__(self, path, flushInterval=60, maxAge=7 * 86400,
+                 clock=time.time):
+        """
+        Initialize StateStore.
+        :param path: path of SQLite database
+        :param flushInterval: minimal number of seconds between writes
+        :param maxAge: state not updated for this many seconds is dropped
+        :param clock: function returning current time in seconds
+        """
+        self.path = path
+        self.flushInterval = flushInterval
+        self.maxAge = maxAge
+        self.clock = clock
+        self.connection = None
+        self.dirty = {}
+        self.lastFlush = clock()
+        self.failed = False
+
+    def connect(self):
+        """
+        Return database connection, opening it on first use.
+        """
+        if self.connection is None and not self.failed:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                connection = sqlite3.connect(self.path)
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS state "
+                    "(key TEXT PRIMARY KEY, value TEXT, updated REAL)"
+                )
+                connection.execute(
+                    "DELETE FROM state WHERE updated < ?",
+                    (self.clock() - self.maxAge,)
+                )
+                connection.commit()
+                self.connection = connection
+            except (sqlite3.Error, OSError) as ex:
+                log.warn("Unable to open NTP state %s, state will not be "
+                         "kept: %s", self.path, ex)
+                self.failed = True
+        return self.connection
+
+    def get(self, key):
+        """
+        Return stored state of key.
+        :return: state or None if not known
+        :rtype: dict
+        """
+        if key in self.dirty:
+            return self.dirty[key]
+        connection = self.connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, ValueError) as ex:
+            log.debug("Unable to read NTP state of %s: %s", key, ex)
+            return None
+
+    def put(self, key, state):
+        """
+        Remember state of key, it is written with the next flush.
+        """
+        self.dirty[key] = state
+        if self.clock() - self.lastFlush >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all changed states.
+        """
+        self.lastFlush = self.clock()
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, {}
+        connection = self.connect()
+        if connection is None:
+            return
+        now = self.clock()
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO state (key, value, updated) "
+                "VALUES (?, ?, ?)",
+                [(key, json.dumps(state), now)
+                 for key, state in dirty.iteritems()]
+            )
+            connection.commit()
+            log.debug("NTP state of %d targets written", len(dirty))
+        except (sqlite3.Error, TypeError, ValueError) as ex:
+            log.warn("Unable to write NTP state: %s", ex)
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+_store = None
+
+
+def getStateStore():
+    """
+    Return state store shared by all NTP datasources of the collector.
+    """
+    global _store
+    if _store is None:
+        from twisted.internet import reactor
+        from Products.ZenUtils.Utils import zenPath
+        _store = StateStore(zenPath(*STATE_FILE))
+        reactor.addSystemEventTrigger("before", "shutdown", _store.close)
+    return _store
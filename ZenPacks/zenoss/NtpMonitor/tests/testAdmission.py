@@ -0,0 +1,146 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from ZenPacks.zenoss.NtpMonitor.admission import AdmissionController, \
+    OverloadedError
+from ZenPacks.zenoss.NtpMonitor.ntp import ReactorTimerWheel
+
+
+class TestAdmissionController(unittest.TestCase):
+    """
+    Test bounded, prioritized admission of checks.
+    """
+    def setUp(self):
+        super(TestAdmissionController, self).setUp()
+        self.clock = Clock()
+        self.admission = AdmissionController(
+            limit=2, timers=ReactorTimerWheel(clock=self.clock)
+        )
+        # name -> Deferred of started check
+        self.started = {}
+
+    def check(self, name):
+        def start():
+            self.started[name] = Deferred()
+            return self.started[name]
+        return start
+
+    def testBounded(self):
+        for name in "abc":
+            self.admission.submit(self.check(name))
+        self.assertEqual(sorted(self.started), ["a", "b"])
+        self.started["a"].callback({})
+        self.assertEqual(sorted(self.started), ["a", "b", "c"])
+        self.assertEqual(self.admission.running, 2)
+
+    def testPriority(self):
+        for name in "ab":
+            self.admission.submit(self.check(name))
+        self.admission.submit(self.check("lab"), priority=(True, 0))
+        self.admission.submit(self.check("core"), priority=(False, -1000))
+        self.started["a"].callback({})
+        self.assertIn("core", self.started)
+        self.assertNotIn("lab", self.started)
+
+    def testResultPassed(self):
+        for name in "ab":
+            self.admission.submit(self.check(name))
+        results = []
+        self.admission.submit(self.check("c")).addCallback(results.append)
+        self.started["a"].callback({})
+        self.started["c"].callback({"offset": 0.1})
+        self.assertEqual(results, [{"offset": 0.1}])
+
+    def testShed(self):
+        for name in "ab":
+            self.admission.submit(self.check(name))
+        errors = []
+        self.admission.submit(self.check("c"), wait=10).addErrback(
+            errors.append
+        )
+        self.clock.advance(5)
+        self.assertEqual(errors, [])
+        self.clock.advance(6)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].check(OverloadedError))
+        self.assertEqual(errors[0].getErrorMessage(), "skipped: overloaded")
+        # a freed slot goes to the next check, not the shed one
+        self.admission.submit(self.check("d"))
+        self.started["a"].callback({})
+        self.assertNotIn("c", self.started)
+        self.assertIn("d", self.started)
+        self.assertEqual(self.admission.shed, 1)
+
+    def testAdmittedNotShed(self):
+        for name in "ab":
+            self.admission.submit(self.check(name))
+        errors = []
+        self.admission.submit(self.check("c"), wait=10).addErrback(
+            errors.append
+        )
+        self.started["a"].callback({})
+        self.clock.advance(20)
+        self.assertEqual(errors, [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def testStuckCheckReleased(self):
+        errors = []
+        self.admission.submit(self.check("a"), watchdog=30).addErrback(
+            errors.append
+        )
+        self.admission.submit(self.check("b"))
+        self.admission.submit(self.check("c"))
+        self.assertNotIn("c", self.started)
+        self.clock.advance(31)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("did not finish", errors[0].getErrorMessage())
+        self.assertIn("c", self.started)
+        self.assertEqual(self.admission.running, 2)
+        # late result of the abandoned check frees nothing
+        self.started["a"].callback({})
+        self.assertEqual(self.admission.running, 2)
+        self.assertEqual(self.admission.stuck, 1)
+
+    def testWatchdogCancelled(self):
+        results = []
+        self.admission.submit(self.check("a"), watchdog=30).addCallback(
+            results.append
+        )
+        self.started["a"].callback({"offset": 0.1})
+        self.assertEqual(results, [{"offset": 0.1}])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def testSynchronousChecks(self):
+        admission = AdmissionController(limit=1)
+        results = []
+        for i in range(5000):
+            admission.submit(lambda i=i: succeed(i)).addCallback(results.append)
+        self.assertEqual(len(results), 5000)
+        self.assertEqual(admission.running, 0)
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestAdmissionController))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
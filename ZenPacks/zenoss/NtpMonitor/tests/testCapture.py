@@ -0,0 +1,156 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.test import proto_helpers
+from ZenPacks.zenoss.NtpMonitor.ntp import NtpProtocol, ReactorTimerWheel
+from ZenPacks.zenoss.NtpMonitor.capture import *
+from ZenPacks.zenoss.NtpMonitor.session import CHECK_STATUS, CHECK_AUTO
+
+
+class Transport(proto_helpers.FakeDatagramTransport):
+    def connect(self, host, port):
+        pass
+
+
+class TestCapture(unittest.TestCase):
+    """
+    Test capture of exchanges and their replay.
+    """
+    readstatResponse = '\x16\x81\x00\x01\x06\x18\x00\x00\x00\x00\x00\x04g\xf3\x96Z'
+    readvarResponse = '\x16\x82\x00\x02\x96Zg\xf3\x00\x00\x00\x0eoffset=2.063\r\n\x00\x00'
+
+    def setUp(self):
+        super(TestCapture, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "capture.bin")
+        self.clock = Clock()
+        self.clock.advance(1000)
+        self.writer = CaptureWriter(self.path, clock=self.clock.seconds)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def exchange(self, *responses, **state):
+        protocol = NtpProtocol(host="127.0.0.1", timeout=5)
+        for name, value in state.items():
+            setattr(protocol, name, value)
+        protocol.transport = Transport()
+        protocol.timers = ReactorTimerWheel(clock=self.clock)
+        protocol.capture = self.writer
+        protocol.d = Deferred()
+        protocol.d.addErrback(lambda failure: None)
+        protocol.startProtocol()
+        for response in responses:
+            self.clock.advance(0.01)
+            protocol.datagramReceived(response)
+        return protocol
+
+    def records(self):
+        self.writer.close()
+        with open(self.path, "rb") as stream:
+            return list(readCapture(stream))
+
+    def testCaptured(self):
+        self.exchange(self.readstatResponse, self.readvarResponse)
+        records = self.records()
+        self.assertEqual(
+            [record[2] for record in records],
+            [CAPTURE_PROCESS, CAPTURE_START, CAPTURE_SENT, CAPTURE_RECEIVED,
+             CAPTURE_SENT, CAPTURE_RECEIVED]
+        )
+        self.assertEqual(json.loads(records[0][4])["pid"], os.getpid())
+        self.assertEqual(records[3][4], self.readstatResponse)
+        self.assertEqual(records[3][0], 1000.01)
+
+    def testReplay(self):
+        self.exchange(self.readstatResponse, self.readvarResponse)
+        self.exchange(self.readstatResponse)
+        self.clock.advance(6)
+        driver = ReplayDriver()
+        results = driver.run(self.records())
+
+        self.assertEqual(driver.mismatches, 0)
+        self.assertEqual([result[0] for result in results], [(1, 1), (1, 2)])
+        self.assertEqual(results[0][1]["offset"], 0.002063)
+        # second exchange timed out under the simulated clock
+        self.assertEqual(str(results[1][2]),
+                         "Timeout. No response from NTP server")
+
+    def testReplayStatusMode(self):
+        # server's status is enough, no READVAR in the capture
+        self.exchange(self.readstatResponse, checkMode=CHECK_STATUS)
+        self.exchange(self.readstatResponse, checkMode=CHECK_AUTO,
+                      lastEventCount=1)
+        driver = ReplayDriver()
+        results = driver.run(self.records())
+
+        self.assertEqual(driver.mismatches, 0)
+        self.assertEqual([result[2] for result in results], [None, None])
+        self.assertTrue(results[0][1]["headerOnly"])
+        self.assertTrue(results[1][1]["headerOnly"])
+
+    def testRestartedProcess(self):
+        self.exchange(self.readstatResponse, self.readvarResponse)
+        # unfinished when the process stops
+        self.exchange()
+        self.writer.close()
+        # restarted process appends to the file, numbering from 1 again
+        self.writer = CaptureWriter(self.path, clock=self.clock.seconds)
+        self.exchange(self.readstatResponse, self.readvarResponse)
+        driver = ReplayDriver()
+        results = driver.run(self.records())
+
+        self.assertEqual(driver.mismatches, 0)
+        self.assertEqual([result[0] for result in results], [(1, 1), (2, 1)])
+        self.assertEqual([result[2] for result in results], [None, None])
+
+    def testLimit(self):
+        self.writer.maxBytes = 250
+        self.exchange(self.readstatResponse, self.readvarResponse)
+        self.assertTrue(self.writer.full)
+        self.assertTrue(os.path.getsize(self.path) <= 250)
+        self.assertEqual(len(self.records()), 3)
+
+    def testMain(self):
+        self.exchange(self.readstatResponse, self.readvarResponse)
+        self.writer.close()
+        output = StringIO()
+        main(["-v", self.path], stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "1.1 NTP OK: Offset 0.002063 secs"
+                                   "|offset=0.002063s;60.000000;120.000000;")
+        self.assertTrue(lines[1].startswith(
+            "1 exchanges, 0 failed, 0 requests differ from capture"
+        ))
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestCapture))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,185 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import socket
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.chrony import *
+from ZenPacks.zenoss.NtpMonitor.packet import STATE_CRITICAL
+from ZenPacks.zenoss.NtpMonitor.session import ACTION_RESULT, ACTION_ERROR
+
+__doc__ = """
+ChronySession is exercised against local UDP socket standing in for
+chronyd's cmdmon port.
+"""
+
+
+class CmdmonStandIn(object):
+    """
+    Answers tracking and n_sources requests like chronyd.
+    """
+    def __init__(self, offset=0.25, leap=0, refId=0xc0a80001, status=0):
+        self.offset = offset
+        self.leap = leap
+        self.refId = refId
+        self.status = status
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.settimeout(5)
+        self.port = self.socket.getsockname()[1]
+
+    def reply(self, request):
+        (_, _, _, _, command, _, sequence, _, _) = \
+            REQUEST_HEADER.unpack_from(request)
+        if command == REQ_TRACKING:
+            reply = RPY_TRACKING
+            floats = [encodeFloat(value) for value in (
+                self.offset, 0.2, 0.001, -12.5, 0.0, 0.042, 0.01, 0.001, 64.0
+            )]
+            data = TRACKING_DATA.pack(
+                self.refId, "\x00" * 16, 1, 0, 3, self.leap, 0, 0, 0,
+                *(floats + [0])
+            )
+        else:
+            reply = RPY_N_SOURCES
+            data = N_SOURCES_DATA.pack(4, 0)
+        header = REPLY_HEADER.pack(
+            PROTO_VERSION, PKT_TYPE_CMD_REPLY, 0, 0, command, reply,
+            self.status, 0, 0, 0, sequence, 0, 0
+        )
+        return header + data
+
+    def answer(self):
+        request, addr = self.socket.recvfrom(4096)
+        self.socket.sendto(self.reply(request), addr)
+        return request
+
+    def close(self):
+        self.socket.close()
+
+
+class TestChronyFloat(unittest.TestCase):
+    """
+    Test encoding of chrony's floating point numbers.
+    """
+    def testRoundTrip(self):
+        for value in (0.0, 1.0, -1.0, 0.25, -0.000123, 12.5, 1e-9, 3600.0):
+            decoded = decodeFloat(encodeFloat(value))
+            self.assertAlmostEqual(decoded, value,
+                                   delta=abs(value) * 1e-6 + 1e-12)
+
+    def testKnownValue(self):
+        # exponent 2 - 25, coefficient 2^23
+        self.assertEqual(decodeFloat(0x04800000), 1.0)
+
+
+class TestChronySession(unittest.TestCase):
+    """
+    Test exchange with chronyd over local UDP socket.
+    """
+    def setUp(self):
+        super(TestChronySession, self).setUp()
+        self.standIn = CmdmonStandIn()
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(5)
+
+    def tearDown(self):
+        self.client.close()
+        self.standIn.close()
+
+    def exchange(self, session):
+        """
+        Run session's round trip and return its final action.
+        """
+        session.start()
+        requests = [value for action, value in session.popActions()
+                    if action == ACTION_SEND]
+        self.assertEqual(len(requests), 2)
+        for request in requests:
+            self.client.sendto(request, ("127.0.0.1", self.standIn.port))
+        for _ in requests:
+            self.standIn.answer()
+        while not session.finished:
+            data, addr = self.client.recvfrom(4096)
+            session.datagramReceived(data, addr)
+        return session.popActions()[-1]
+
+    def testTracking(self):
+        session = ChronySession("127.0.0.1", self.standIn.port)
+        action, result = self.exchange(session)
+        self.assertEqual(action, ACTION_RESULT)
+        self.assertAlmostEqual(result["offset"], 0.25)
+        self.assertEqual(result["offsetResult"], STATE_OK)
+        self.assertEqual(result["status"], STATE_OK)
+        self.assertTrue(result["syncSource"])
+        self.assertFalse(result["liAlarm"])
+        self.assertEqual(result["stratum"], 3)
+        self.assertEqual(result["sources"], 4)
+        self.assertAlmostEqual(result["skew"], 0.042, places=6)
+        self.assertAlmostEqual(result["frequency"], -12.5, places=5)
+
+    def testRequestPadded(self):
+        session = ChronySession("127.0.0.1")
+        session.start()
+        requests = [value for action, value in session.popActions()
+                    if action == ACTION_SEND]
+        self.assertEqual(len(requests[0]),
+                         REPLY_HEADER.size + TRACKING_DATA.size)
+        self.assertEqual(len(requests[1]),
+                         REPLY_HEADER.size + N_SOURCES_DATA.size)
+
+    def testThresholds(self):
+        self.standIn.offset = 150.0
+        session = ChronySession("127.0.0.1", self.standIn.port)
+        action, result = self.exchange(session)
+        self.assertEqual(result["status"], STATE_CRITICAL)
+
+    def testUnsynchronized(self):
+        self.standIn.leap = LEAP_UNSYNCHRONIZED
+        session = ChronySession("127.0.0.1", self.standIn.port)
+        action, result = self.exchange(session)
+        self.assertEqual(action, ACTION_RESULT)
+        self.assertEqual(result["offsetResult"], STATE_UNKNOWN)
+        self.assertEqual(result["status"], STATE_WARNING)
+        self.assertFalse(result["syncSource"])
+        self.assertTrue(result["liAlarm"])
+
+    def testNotAuthorised(self):
+        self.standIn.status = 10
+        session = ChronySession("127.0.0.1", self.standIn.port)
+        action, error = self.exchange(session)
+        self.assertEqual(action, ACTION_ERROR)
+        self.assertIn("no command access", str(error))
+
+    def testUnexpectedReplyIgnored(self):
+        session = ChronySession("127.0.0.1")
+        session.start()
+        session.popActions()
+        session.datagramReceived("\x06\x02" + "\x00" * 60)
+        self.assertFalse(session.finished)
+        session.timeoutHandler()
+        self.assertEqual(session.popActions()[-1][0], ACTION_ERROR)
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestChronyFloat))
+    suite.addTest(makeSuite(TestChronySession))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
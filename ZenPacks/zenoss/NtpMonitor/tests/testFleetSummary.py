@@ -0,0 +1,70 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.fleet import FleetSummary
+from ZenPacks.zenoss.NtpMonitor.packet import STATE_OK, STATE_WARNING, \
+    STATE_CRITICAL
+
+
+class TestFleetSummary(unittest.TestCase):
+    """
+    Test collector-wide summary of checks.
+    """
+    def setUp(self):
+        super(TestFleetSummary, self).setUp()
+        self.fleet = FleetSummary(capacity=2)
+
+    def testSummary(self):
+        for i in range(101):
+            self.fleet.add("dev%d" % i, STATE_OK, i * 0.001, True)
+        self.fleet.add("dev100", STATE_WARNING, None, False)
+        self.fleet.add("dev101", STATE_CRITICAL, timeout=True)
+        summary = self.fleet.compute()
+        self.assertEqual(summary["targets"], 102)
+        self.assertEqual(summary["ok"], 100)
+        self.assertEqual(summary["warning"], 1)
+        self.assertEqual(summary["critical"], 1)
+        self.assertEqual(summary["unsynchronized"], 1)
+        self.assertEqual(summary["timeouts"], 1)
+        # offsets 0 to 99 ms
+        self.assertAlmostEqual(summary["offset_p50"], 0.0495)
+        self.assertAlmostEqual(summary["offset_max"], 0.099)
+
+    def testNoOffsets(self):
+        self.fleet.add("dev", STATE_CRITICAL, timeout=True)
+        summary = self.fleet.compute()
+        self.assertEqual(summary["targets"], 1)
+        self.assertNotIn("offset_p50", summary)
+
+    def testRemovedTarget(self):
+        self.fleet.add("dev1", STATE_OK, 0.001, True)
+        self.fleet.add("dev2", STATE_OK, 0.002, True)
+        self.fleet.remove("dev1")
+        summary = self.fleet.compute()
+        self.assertEqual(summary["targets"], 1)
+        self.assertEqual(summary["offset_max"], 0.002)
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestFleetSummary))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
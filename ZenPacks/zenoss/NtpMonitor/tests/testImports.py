@@ -0,0 +1,126 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import json
+import logging
+import os
+import subprocess
+import sys
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+
+__doc__ = """
+Modules are imported in a fresh interpreter, to keep start-up of
+daemons and worker processes cheap.
+"""
+
+log = logging.getLogger("zen.NtpMonitor")
+
+PROBE = """
+import json, sys, time
+started = time.time()
+import %s
+print(json.dumps({"seconds": time.time() - started,
+                  "modules": sorted(sys.modules)}))
+"""
+
+# never needed by zenhub nor by the worker processes
+COLLECTOR_MODULES = (
+    "numpy",
+    "sqlite3",
+    "twisted.internet.reactor",
+    "Products.ZenUtils.IpUtil",
+    "ZenPacks.zenoss.NtpMonitor.pool",
+    "ZenPacks.zenoss.NtpMonitor.history",
+    "ZenPacks.zenoss.NtpMonitor.fleet",
+)
+
+# loaded by plugins only once a check needs them
+PLUGIN_MODULES = COLLECTOR_MODULES + (
+    "cProfile",
+    "pstats",
+    "ZenPacks.zenoss.NtpMonitor.chrony",
+    "ZenPacks.zenoss.NtpMonitor.sntp",
+    "ZenPacks.zenoss.NtpMonitor.protocols",
+)
+
+
+def importModule(name, standalone=False):
+    """
+    Import module in a new interpreter.
+    :return: seconds the import took and names of loaded modules
+    :rtype: tuple
+    """
+    env = dict(os.environ)
+    env.pop("NTPMONITOR_STANDALONE", None)
+    if standalone:
+        env["NTPMONITOR_STANDALONE"] = "1"
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROBE % name], env=env
+    )
+    report = json.loads(output.splitlines()[-1])
+    log.info("Import of %s took %.3f secs, %d modules loaded", name,
+             report["seconds"], len(report["modules"]))
+    return report["seconds"], set(report["modules"])
+
+
+class TestImports(unittest.TestCase):
+    """
+    Test dependencies pulled in by importing the ZenPack's modules.
+    """
+    def assertNotLoaded(self, modules, names):
+        loaded = [name for name in names if name in modules]
+        self.assertEqual(loaded, [], "Unexpected imports: %s" % loaded)
+
+    def testDataSource(self):
+        _, modules = importModule(
+            "ZenPacks.zenoss.NtpMonitor.datasources.NtpMonitorDataSource"
+        )
+        self.assertIn("ZenPacks.zenoss.NtpMonitor.ntp", modules)
+        self.assertNotLoaded(modules, PLUGIN_MODULES)
+
+    def testPeerDataSource(self):
+        _, modules = importModule(
+            "ZenPacks.zenoss.NtpMonitor.datasources.NtpPeerDataSource"
+        )
+        self.assertNotLoaded(modules, PLUGIN_MODULES)
+
+    def testFleetDataSource(self):
+        _, modules = importModule(
+            "ZenPacks.zenoss.NtpMonitor.datasources.NtpFleetDataSource"
+        )
+        self.assertNotLoaded(modules, PLUGIN_MODULES)
+
+    def testWorker(self):
+        _, modules = importModule(
+            "ZenPacks.zenoss.NtpMonitor.worker", standalone=True
+        )
+        self.assertNotLoaded(modules, COLLECTOR_MODULES + (
+            "Globals",
+            "Products.CMFCore",
+            "ZenPacks.zenoss.ZenPackLib",
+            "twisted.internet.defer",
+        ))
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestImports))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
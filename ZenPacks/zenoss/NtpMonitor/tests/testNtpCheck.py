@@ -0,0 +1,104 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import json
+import socket
+import unittest
+from StringIO import StringIO
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor import check
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException, STATE_OK, \
+    STATE_CRITICAL
+
+
+class TestNtpCheck(unittest.TestCase):
+    """
+    Test command line NTP checker.
+    """
+    result = {
+        "offset": 0.136,
+        "offsetResult": 0,
+        "status": 0,
+        "syncSource": True,
+        "liAlarm": False,
+        "warning": 60.0,
+        "critical": 120.0
+    }
+
+    def testDescribeOk(self):
+        status, record = check.describe("ntp1", self.result, None)
+        self.assertEqual(status, STATE_OK)
+        self.assertEqual(record["status"], "OK")
+        self.assertEqual(
+            record["output"],
+            'NTP OK: Offset 0.136 secs|offset=0.136s;60.000000;120.000000;'
+        )
+
+    def testDescribeError(self):
+        error = NtpException("Timeout. No response from NTP server")
+        status, record = check.describe("ntp1", None, error)
+        self.assertEqual(status, STATE_CRITICAL)
+        self.assertEqual(
+            record["output"],
+            "NTP CRITICAL: Timeout. No response from NTP server"
+        )
+
+    def testReadHosts(self):
+        lines = ["ntp1\n", "  # comment\n", "\n", "ntp2 # inline\n"]
+        self.assertEqual(list(check.readHosts(lines)), ["ntp1", "ntp2"])
+
+    def testGetHostsStdin(self):
+        options, args = check.buildParser().parse_args(["-f", "-", "ntp0"])
+        hosts = check.getHosts(options, args, StringIO("ntp1\nntp2\n"))
+        self.assertEqual(hosts, ["ntp0", "ntp1", "ntp2"])
+
+    def testReferences(self):
+        options, _ = check.buildParser().parse_args(
+            ["-C", "-r", "ntp1, ntp2", "-r", "ntp3"]
+        )
+        self.assertEqual(check.getReferences(options),
+                         ["ntp1", "ntp2", "ntp3"])
+        options, _ = check.buildParser().parse_args(
+            ["-C", "-r", "ntp1", "--no-calibrate"]
+        )
+        self.assertEqual(check.getReferences(options), [])
+
+    def testMainJson(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        port = str(server.getsockname()[1])
+        stdout = StringIO()
+        try:
+            code = check.main(
+                ["--json", "-t", "0.1", "-p", port, "127.0.0.1"],
+                stdout=stdout
+            )
+        finally:
+            server.close()
+        self.assertEqual(code, 2)
+        record = json.loads(stdout.getvalue())
+        self.assertEqual(record["host"], "127.0.0.1")
+        self.assertEqual(record["status"], "CRITICAL")
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpCheck))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,165 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import socket
+import time
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.engine import NtpEngine
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+from ZenPacks.zenoss.NtpMonitor.timestamps import enableTimestamps, \
+    getReceiveTime
+
+__doc__ = """
+NtpEngine is exercised against local UDP socket answering with
+dumped READSTAT/READVAR responses.
+"""
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNtpEngine(unittest.TestCase):
+    """
+    Test standalone NTP engine.
+    """
+    readstatResponse = '\x16\x81\x00\x01\x06\x18\x00\x00\x00\x00\x00\x04g\xf3\x96Z'
+    readvarResponse = '\x16\x82\x00\x02\x96Zg\xf3\x00\x00\x00\x0eoffset=2.063\r\n\x00\x00'
+
+    def setUp(self):
+        super(TestNtpEngine, self).setUp()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.settimeout(5)
+        self.port = self.server.getsockname()[1]
+        self.clock = FakeClock()
+        self.engine = NtpEngine(parallel=2, clock=self.clock)
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.close()
+
+    def answer(self, response):
+        _, addr = self.server.recvfrom(4096)
+        self.server.sendto(response, addr)
+
+    def testExchange(self):
+        self.engine.submit("127.0.0.1", port=self.port, tag="dev1")
+        self.engine.step(maxWait=0)
+        self.answer(self.readstatResponse)
+        self.engine.step(maxWait=5)
+        self.answer(self.readvarResponse)
+        self.engine.step(maxWait=5)
+        tag, result, error = self.engine.finished.popleft()
+        self.assertEqual(tag, "dev1")
+        self.assertIsNone(error)
+        self.assertEqual(result["offset"], 0.002063)
+        self.assertFalse(self.engine.busy)
+
+    def testRoundTripTime(self):
+        self.engine.submit("127.0.0.1", port=self.port)
+        self.engine.step(maxWait=0)
+        self.answer(self.readstatResponse)
+        self.engine.step(maxWait=5)
+        self.answer(self.readvarResponse)
+        self.engine.step(maxWait=5)
+        _, result, _ = self.engine.finished.popleft()
+        self.assertTrue(0 <= result["rtt"] < 5)
+
+    def testRoundTripTimeOfEngineClock(self):
+        self.engine.submit("127.0.0.1", port=self.port)
+        self.engine.step(maxWait=0)
+        self.answer(self.readstatResponse)
+        self.clock.now += 0.25
+        self.engine.step(maxWait=5)
+        self.answer(self.readvarResponse)
+        self.clock.now += 0.5
+        self.engine.step(maxWait=5)
+        _, result, _ = self.engine.finished.popleft()
+        self.assertEqual(result["rtt"], 0.25)
+
+    def testKernelTimestamp(self):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        enabled = enableTimestamps(self.server)
+        before = time.time()
+        client.sendto("ping", ("127.0.0.1", self.port))
+        sent = time.time()
+        time.sleep(0.2)
+        self.server.recvfrom(16)
+        received = getReceiveTime(self.server, enabled)
+        client.close()
+        if enabled:
+            # arrival, not the time it was read
+            self.assertTrue(before <= received <= sent + 0.1)
+        else:
+            self.assertTrue(received >= sent + 0.2)
+
+    def testSessionRecycled(self):
+        self.engine.submit("127.0.0.1", port=self.port, timeout=10)
+        self.engine.step(maxWait=0)
+        self.clock.now += 10
+        list(self.engine.run())
+        session = self.engine.pool.free[-1]
+        check = self.engine.submit("127.0.0.1", port=self.port)
+        self.assertIs(check.session, session)
+
+    def testTimeout(self):
+        self.engine.submit("127.0.0.1", port=self.port, timeout=10)
+        self.engine.step(maxWait=0)
+        self.clock.now += 10
+        results = list(self.engine.run())
+        self.assertEqual(len(results), 1)
+        self.assertIsInstance(results[0][2], NtpException)
+
+    def testSameServerSerialized(self):
+        self.engine.submit("127.0.0.1", port=self.port, tag=1)
+        self.engine.submit("127.0.0.1", port=self.port, tag=2)
+        self.engine.step(maxWait=0)
+        self.assertEqual(len(self.engine.active), 1)
+        self.assertEqual(len(self.engine.blocked), 1)
+
+    def testParallelLimit(self):
+        servers = []
+        for _ in range(3):
+            server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            server.bind(("127.0.0.1", 0))
+            servers.append(server)
+            self.engine.submit("127.0.0.1", port=server.getsockname()[1])
+        self.engine.step(maxWait=0)
+        self.assertEqual(len(self.engine.active), 2)
+        self.assertEqual(len(self.engine.waiting), 1)
+        for server in servers:
+            server.close()
+
+    def testWithoutHost(self):
+        self.engine.submit(None)
+        results = list(self.engine.run())
+        self.assertIsInstance(results[0][2], NtpException)
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpEngine))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
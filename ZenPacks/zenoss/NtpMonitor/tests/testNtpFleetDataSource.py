@@ -0,0 +1,87 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.datasources import NtpFleetDataSource
+from ZenPacks.zenoss.NtpMonitor.fleet import FleetSummary
+from ZenPacks.zenoss.NtpMonitor.packet import STATE_OK, STATE_CRITICAL
+from mock import Mock
+
+
+class TestNtpFleetDataSource(unittest.TestCase):
+    """
+    Test datasource plugin of collector's fleet summary.
+    """
+    def setUp(self):
+        super(TestNtpFleetDataSource, self).setUp()
+        self.collector = NtpFleetDataSource.NtpFleetDataSourcePlugin()
+        self.fleet = FleetSummary()
+        self.config = Mock()
+        self.config.id = 'collectorhost'
+        ds = Mock()
+        ds.eventKey = None
+        ds.eventClass = '/Status/Ntp/Fleet'
+        self.config.datasources = [ds]
+
+    def summarize(self):
+        return self.collector.onSuccess(self.fleet.compute(), self.config)
+
+    def testValues(self):
+        self.fleet.add("dev1/NtpMonitor", STATE_OK, 0.1, True)
+        self.fleet.add("dev2/NtpMonitor", STATE_CRITICAL, timeout=True)
+
+        newData = self.summarize()
+
+        values = newData['values'][None]
+        self.assertEqual(values['targets'], 2)
+        self.assertEqual(values['critical'], 1)
+        self.assertEqual(values['timeouts'], 1)
+        self.assertEqual(values['offset_p50'], 0.1)
+        self.assertEqual(len(newData['events']), 1)
+        event = newData['events'][0]
+        self.assertEqual(event['device'], 'collectorhost')
+        self.assertEqual(event['eventKey'], 'NtpMonitorFleet')
+        self.assertEqual(event['severity'], 3)
+
+    def testEventWhileNotOk(self):
+        def severities():
+            return [event['severity'] for event in self.summarize()['events']]
+
+        self.fleet.add("dev1/NtpMonitor", STATE_OK, 0.1, True)
+        self.assertEqual(severities(), [0])
+        self.assertEqual(severities(), [])
+        self.fleet.add("dev2/NtpMonitor", STATE_CRITICAL, timeout=True)
+        self.assertEqual(severities(), [3])
+        self.assertEqual(severities(), [3])
+        self.fleet.remove("dev2/NtpMonitor")
+        self.assertEqual(severities(), [0])
+        self.assertEqual(severities(), [])
+
+    def testNoChecks(self):
+        newData = self.summarize()
+        self.assertEqual(dict(newData['values']), {})
+        self.assertEqual(newData['events'], [])
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpFleetDataSource))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -12,8 +12,15 @@ from Products.ZenUtils.Utils import unused
 unused(Globals)
 from ZenPacks.zenoss.NtpMonitor.datasources import NtpMonitorDataSource
 from ZenPacks.zenoss.NtpMonitor.ntp import *
+from ZenPacks.zenoss.NtpMonitor.admission import OverloadedError
+from ZenPacks.zenoss.NtpMonitor.fleet import FleetSummary
+from ZenPacks.zenoss.NtpMonitor.state import StateStore
+import sys
+import time
 import unittest
-from mock import Mock
+from mock import ANY, Mock
+from twisted.internet.defer import succeed, fail
+from twisted.python.failure import Failure
 
 
 class TestNtpMonitorDataSource(unittest.TestCase):
@@ -23,8 +30,11 @@ class TestNtpMonitorDataSource(unittest.TestCase):
     def setUp(self):
         super(TestNtpMonitorDataSource, self).setUp()
 
-    def _collector(self):
-        return NtpMonitorDataSource.NtpMonitorDataSourcePlugin()
+    def _collector(self, store=None):
+        collector = NtpMonitorDataSource.NtpMonitorDataSourcePlugin()
+        collector.store = store or StateStore(":memory:")
+        collector.fleet = FleetSummary()
+        return collector
 
 
     def testOnSuccessOffsetOk(self):
@@ -142,6 +152,339 @@ class TestNtpMonitorDataSource(unittest.TestCase):
             )
         )
 
+    def _config(self, heartbeat=3600):
+        config = Mock()
+        ds = Mock()
+        ds.datasource = 'testdatasource'
+        ds.eventKey = None
+        ds.params = {"heartbeat": heartbeat}
+        ds.cycletime = 300
+        config.datasources = [ds]
+        config.id = 'adeviceid'
+        return config
+
+    def _result(self, offset=0.136, status=0):
+        return {
+            "offset": offset,
+            "offsetResult": 0,
+            "status": status,
+            "syncSource": True,
+            "liAlarm": False,
+            "warning": 60.0,
+            "critical": 120.0
+        }
+
+    def testOnSuccessUnchangedEventSuppressed(self):
+        collector = self._collector()
+        config = self._config()
+
+        collector.onSuccess(self._result(0.136), config)
+        newData = collector.onSuccess(self._result(0.2), config)
+
+        self.assertEqual(newData['events'], [])
+        self.assertEqual(newData['values'][None]['offset'], 0.2)
+        # statistics include the sample just taken
+        self.assertAlmostEqual(newData['values'][None]['jitter'], 0.064)
+
+    def testOnSuccessChangedEventSent(self):
+        collector = self._collector()
+        config = self._config()
+
+        collector.onSuccess(self._result(status=0), config)
+        newData = collector.onSuccess(self._result(status=2), config)
+
+        self.assertEqual(len(newData['events']), 1)
+
+    def testOnErrorAfterSuccessSent(self):
+        collector = self._collector()
+        config = self._config()
+        failure = Mock()
+        failure.getErrorMessage.return_value = "Timeout"
+
+        collector.onSuccess(self._result(), config)
+        newData = collector.onError(failure, config)
+        self.assertEqual(len(newData['events']), 1)
+        newData = collector.onError(failure, config)
+        self.assertEqual(newData['events'], [])
+
+    def testOnSuccessHeartbeat(self):
+        collector = self._collector()
+        config = self._config()
+
+        collector.onSuccess(self._result(), config)
+        for key, (state, sent) in collector.lastEvents.items():
+            collector.lastEvents[key] = (state, sent - 3600)
+        newData = collector.onSuccess(self._result(), config)
+
+        self.assertEqual(len(newData['events']), 1)
+
+    def testOnSuccessHeartbeatDisabled(self):
+        collector = self._collector()
+        config = self._config(heartbeat=0)
+
+        collector.onSuccess(self._result(), config)
+        newData = collector.onSuccess(self._result(), config)
+
+        self.assertEqual(len(newData['events']), 1)
+
+    def testOnSuccessTrendEvent(self):
+        collector = self._collector()
+        config = self._config()
+        offsets = [0.001, -0.001] * 10 + [0.001 * i for i in range(2, 12)]
+
+        events = []
+        for offset in offsets:
+            newData = collector.onSuccess(self._result(offset), config)
+            events.extend(newData['events'])
+
+        trendEvents = [e for e in events if e['eventKey'] == 'NtpMonitorTrend']
+        self.assertEqual(len(trendEvents), 1)
+        self.assertEqual(trendEvents[0]['eventClass'], '/Status/Ntp/Trend')
+        self.assertTrue(trendEvents[0]['summary'].startswith(
+            'NTP offset trending up'
+        ))
+
+    def testOnSuccessNoTrendEvent(self):
+        collector = self._collector()
+        config = self._config()
+
+        for offset in [0.001, -0.001] * 20:
+            newData = collector.onSuccess(self._result(offset), config)
+            for event in newData['events']:
+                self.assertNotEqual(event['eventKey'], 'NtpMonitorTrend')
+
+    def testStableTargetIntervalGrows(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].params["maxInterval"] = 1200
+
+        for offset in [0.001, -0.001] * 10:
+            collector.onSuccess(self._result(offset), config)
+        self.assertEqual(collector.schedule.interval, 1200)
+
+        collector.onSuccess(self._result(status=2), config)
+        self.assertEqual(collector.schedule.interval, 300)
+
+    def testIntervalFixedByDefault(self):
+        collector = self._collector()
+        config = self._config()
+
+        for offset in [0.001, -0.001] * 10:
+            collector.onSuccess(self._result(offset), config)
+        self.assertEqual(collector.schedule.interval, 300)
+
+    def testErrorResetsInterval(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].params["maxInterval"] = 1800
+
+        for offset in [0.001, -0.001] * 10:
+            collector.onSuccess(self._result(offset), config)
+        self.assertTrue(collector.schedule.interval > 300)
+
+        collector.onError(Mock(getErrorMessage=lambda: 'timeout'), config)
+        self.assertEqual(collector.schedule.interval, 300)
+
+    def testOnSuccessStatusOnly(self):
+        collector = self._collector()
+        config = self._config()
+        result = self._result()
+        result.update(offsetResult=1, headerOnly=True, systemStatus={
+            "leap": 0, "source": 6, "eventCount": 3, "eventCode": 5
+        })
+
+        newData = collector.onSuccess(result, config)
+        self.assertEqual(newData['values'][None], {})
+        self.assertEqual(newData['events'][0]['severity'], 0)
+        self.assertEqual(newData['events'][0]['summary'],
+                         'NTP OK: Server synchronized (last event: clock_sync)')
+
+        result.update(status=2, syncSource=False)
+        newData = collector.onSuccess(result, config)
+        self.assertEqual(newData['events'][0]['severity'], 3)
+
+    def testCollectSkipped(self):
+        collector = self._collector()
+        config = self._config()
+        collector.schedule.nextProbe = time.time() + 600
+
+        results = []
+        collector.collect(config).addCallback(results.append)
+        self.assertEqual(results, [None])
+        newData = collector.onSuccess(None, config)
+        self.assertEqual(newData['events'], [])
+        self.assertEqual(newData['values'][None], {})
+
+    def testCollectSeveralServers(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].params.update(
+            hostname="ntp1, ntp2 ntp3", policy="median", quorum=2
+        )
+        offsets = {"ntp1": 0.1, "ntp2": 0.3}
+
+        def checkServer(datasource, hostname):
+            if hostname in offsets:
+                return succeed(self._result(offsets[hostname]))
+            return fail(NtpException("Timeout"))
+        collector.checkServer = checkServer
+
+        results = []
+        collector.collect(config).addCallback(results.append)
+        newData = collector.onSuccess(results[0], config)
+
+        values = newData['values'][None]
+        self.assertAlmostEqual(values['offset'], 0.2)
+        self.assertEqual(values['offset_1'], 0.1)
+        self.assertEqual(values['offset_2'], 0.3)
+        self.assertNotIn('offset_3', values)
+        self.assertEqual(values['responding'], 2)
+
+    def testCollectSingleServerParsed(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].params.update(hostname=" ntp1, ")
+        hostnames = []
+        collector.checkServer = \
+            lambda datasource, hostname: hostnames.append(hostname)
+
+        collector.collect(config)
+        self.assertEqual(hostnames, ["ntp1"])
+
+    def testCollectAtMostThreeServers(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].params.update(hostname="ntp1 ntp2 ntp3 ntp4")
+        hostnames = []
+
+        def checkServer(datasource, hostname):
+            hostnames.append(hostname)
+            return succeed(self._result())
+        collector.checkServer = checkServer
+
+        collector.collect(config)
+        self.assertEqual(hostnames, ["ntp1", "ntp2", "ntp3"])
+
+    def testCollectSeveralServersAllFailed(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].params.update(hostname="ntp1,ntp2")
+        collector.checkServer = \
+            lambda datasource, hostname: fail(NtpException("Timeout"))
+
+        errors = []
+        collector.collect(config).addErrback(errors.append)
+        self.assertEqual(errors[0].getErrorMessage(), "Timeout")
+
+    def testOnErrorOverloaded(self):
+        collector = self._collector()
+        config = self._config()
+        collector.onSuccess(self._result(), config)
+        events = dict(collector.lastEvents)
+
+        newData = collector.onError(Failure(OverloadedError()), config)
+        self.assertEqual(newData['events'], [])
+        self.assertEqual(collector.lastEvents, events)
+
+    def testPriority(self):
+        collector = self._collector()
+        config = self._config()
+        config.datasources[0].getProductionState = 1000
+        config.datasources[0].getPriority = 5
+        lab = self._config()
+        lab.datasources[0].getProductionState = 400
+        lab.datasources[0].getPriority = 3
+        self.assertLess(collector.getPriority(config),
+                        collector.getPriority(lab))
+        # unhealthy lab device goes before healthy production one
+        healthy = self._collector()
+        healthy.onSuccess(self._result(), config)
+        self.assertLess(collector.getPriority(lab),
+                        healthy.getPriority(config))
+
+    def testFleetSummaryRecorded(self):
+        collector = self._collector()
+        config = self._config()
+        collector.onSuccess(self._result(0.1), config)
+        failure = Mock()
+        failure.getErrorMessage.return_value = "Timeout"
+        other = self._config()
+        other.id = "otherdeviceid"
+        newData = collector.onError(failure, other)
+
+        # summaries are sent by NtpFleet datasources
+        self.assertEqual([e for e in newData['events']
+                          if e['eventKey'] == 'NtpMonitorFleet'], [])
+        summary = collector.fleet.compute()
+        self.assertEqual(summary['targets'], 2)
+        self.assertEqual(summary['timeouts'], 1)
+        self.assertEqual(summary['offset_p50'], 0.1)
+
+    def testWithoutNumpy(self):
+        # import of a module found None in sys.modules fails
+        names = ("ZenPacks.zenoss.NtpMonitor.history",
+                 "ZenPacks.zenoss.NtpMonitor.fleet")
+        saved = dict((name, sys.modules.get(name)) for name in names)
+        try:
+            sys.modules.update(dict.fromkeys(names))
+            collector = self._collector()
+            collector.fleet = None
+            newData = collector.onSuccess(self._result(0.1), self._config())
+        finally:
+            sys.modules.update(saved)
+            NtpMonitorDataSource._unavailable.clear()
+
+        self.assertEqual(newData['values'][None]['offset'], 0.1)
+        self.assertNotIn('jitter', newData['values'][None])
+        self.assertIsNone(collector.fleet)
+        self.assertEqual(newData['events'][-1]['severity'], 0)
+
+    def testParamsLiteralsNotEvaluated(self):
+        datasource = NtpMonitorDataSource.NtpMonitorDataSource()
+        datasource.talesEval = Mock(return_value="ntp.example.com")
+        datasource.warning = "30"
+        params = NtpMonitorDataSource.NtpMonitorDataSourcePlugin.params(
+            datasource, Mock()
+        )
+        datasource.talesEval.assert_called_once_with("${dev/id}", ANY)
+        # defaults are left to collect()
+        self.assertEqual(params,
+                         {"hostname": "ntp.example.com", "warning": "30"})
+        ds = Mock()
+        ds.params = params
+        self.assertEqual(NtpMonitorDataSource.getParam(ds, "port"), 123)
+
+    def testParamsExpressionEvaluatedOnce(self):
+        datasource = NtpMonitorDataSource.NtpMonitorDataSource()
+        datasource.talesEval = Mock(return_value="10.0.0.1")
+        datasource.hostname = "${dev/manageIp}"
+        datasource.policy = "${dev/manageIp}"
+        params = NtpMonitorDataSource.NtpMonitorDataSourcePlugin.params(
+            datasource, Mock()
+        )
+        self.assertEqual(datasource.talesEval.call_count, 1)
+        self.assertEqual(params["policy"], "10.0.0.1")
+
+    def testStateRestored(self):
+        store = StateStore(":memory:")
+        config = self._config()
+        collector = self._collector(store)
+        collector.restoreState(config)
+        for offset in [0.001, -0.001] * 10:
+            collector.onSuccess(self._result(offset), config)
+
+        restarted = self._collector(store)
+        restarted.restoreState(config)
+
+        self.assertEqual(restarted.schedule.interval,
+                         collector.schedule.interval)
+        self.assertEqual(restarted.detector.getState(),
+                         collector.detector.getState())
+        self.assertEqual(restarted.lastState, collector.lastState)
+        # unchanged state is not sent again after restart
+        newData = restarted.onSuccess(self._result(0.001), config)
+        self.assertEqual(newData['events'], [])
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
@@ -11,6 +11,7 @@ import Globals
 from Products.ZenUtils.Utils import unused
 unused(Globals)
 from ZenPacks.zenoss.NtpMonitor.ntp import *
+from ZenPacks.zenoss.NtpMonitor.packet import parseVariables
 import unittest
 
 __doc__= """
@@ -104,6 +105,12 @@ class TestNtpPacket(unittest.TestCase):
         packet = NtpPacket.fromData(self.readvarData)
         self.assertEqual(packet.status, 38490)
 
+    def testSystemStatus(self):
+        packet = NtpPacket.fromData(self.readstatData)
+        self.assertEqual(packet.systemStatus, {
+            "leap": 0, "source": 6, "eventCount": 1, "eventCode": 8
+        })
+
     def testFromDataAssoc(self):
         packet = NtpPacket.fromData(self.readvarData)
         self.assertEqual(packet.assoc, self.peer)
@@ -124,6 +131,22 @@ class TestNtpPacket(unittest.TestCase):
         packet = NtpPacket.fromData(self.readstatData)
         self.assertDictEqual(packet.peers, self.peers)
 
+    def testManyPeers(self):
+        data = '\x16\x81\x00\x01\x06\x18\x00\x00\x00\x00\x00\x0c' \
+            '\x00\x01\x96\x5a\x00\x02\x94\x24\x00\x03\x91\x14'
+        packet = NtpPacket.fromData(data)
+        self.assertDictEqual(
+            packet.peers, {1: 0x965a, 2: 0x9424, 3: 0x9114}
+        )
+
+    def testVariables(self):
+        packet = NtpPacket.fromData(self.readvarData)
+        self.assertDictEqual(packet.getVariables(), {"offset": "2.063"})
+        self.assertDictEqual(
+            parseVariables('srcadr=10.0.0.1, refid="GPS",\r\nstratum=1'),
+            {"srcadr": "10.0.0.1", "refid": "GPS", "stratum": "1"}
+        )
+
     def testErrorReadstat(self):
         packet = NtpPacket.fromData(self.readstatData)
         self.assertFalse(packet.hasError)
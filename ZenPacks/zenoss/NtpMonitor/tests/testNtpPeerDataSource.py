@@ -0,0 +1,109 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.datasources import NtpPeerDataSource
+from mock import Mock
+
+
+class TestNtpPeerDataSource(unittest.TestCase):
+    """
+    Test datasource plugin of NTP peers.
+    """
+    def _config(self, *assocIds):
+        config = Mock()
+        config.id = 'adeviceid'
+        config.datasources = []
+        for assocId in assocIds:
+            ds = Mock()
+            ds.component = 'peer%d' % assocId
+            ds.eventKey = None
+            ds.eventClass = '/Status/Ntp'
+            ds.params = {"assocId": assocId}
+            config.datasources.append(ds)
+        return config
+
+    def testOnSuccess(self):
+        collector = NtpPeerDataSource.NtpPeerDataSourcePlugin()
+        config = self._config(1, 2, 3)
+        result = {"peers": [
+            {"assocId": 1, "offset": 0.001, "delay": 0.02, "jitter": 0.0005},
+            {"assocId": 2, "offset": -0.002},
+        ]}
+
+        newData = collector.onSuccess(result, config)
+
+        self.assertDictEqual(dict(newData['values']), {
+            'peer1': {'offset': 0.001, 'delay': 0.02, 'jitter': 0.0005},
+            'peer2': {'offset': -0.002},
+        })
+        self.assertEqual(newData['events'][0]['severity'], 0)
+        self.assertEqual(newData['events'][0]['eventKey'], 'NtpPeer')
+        missing = dict((event['component'], event['severity'])
+                       for event in newData['events'][1:])
+        self.assertEqual(missing, {'peer1': 0, 'peer2': 0, 'peer3': 3})
+        self.assertEqual(newData['events'][3]['eventKey'], 'NtpPeerMissing')
+
+    def testMissingOnTransition(self):
+        collector = NtpPeerDataSource.NtpPeerDataSourcePlugin()
+        config = self._config(1, 2)
+        answered = {"peers": [{"assocId": 1, "offset": 0.001},
+                              {"assocId": 2, "offset": 0.002}]}
+        gone = {"peers": [{"assocId": 1, "offset": 0.001}]}
+
+        def missing(result):
+            newData = collector.onSuccess(result, config)
+            return dict((event['component'], event['severity'])
+                        for event in newData['events'][1:])
+
+        self.assertEqual(missing(answered), {'peer1': 0, 'peer2': 0})
+        self.assertEqual(missing(answered), {})
+        self.assertEqual(missing(gone), {'peer2': 3})
+        self.assertEqual(missing(gone), {})
+        self.assertEqual(missing(answered), {'peer2': 0})
+
+    def testOnSuccessNoPeerAnswered(self):
+        collector = NtpPeerDataSource.NtpPeerDataSourcePlugin()
+        result = {"peers": [{"assocId": 1}, {"assocId": 2}]}
+
+        newData = collector.onSuccess(result, self._config(1, 2))
+
+        self.assertEqual(dict(newData['values']), {})
+        self.assertEqual(newData['events'][0]['severity'], 4)
+        self.assertEqual(newData['events'][0]['eventKey'], 'NtpPeer')
+
+    def testOnError(self):
+        collector = NtpPeerDataSource.NtpPeerDataSourcePlugin()
+        result = Mock()
+        result.getErrorMessage.return_value = 'Timeout'
+
+        newData = collector.onError(result, self._config(1))
+
+        self.assertEqual(
+            newData['events'][0]['summary'],
+            'NTP CRITICAL: Unable to collect peers: Timeout'
+        )
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpPeerDataSource))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,173 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import struct
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.session import *
+from ZenPacks.zenoss.NtpMonitor.packet import NtpPacket
+
+
+def readstatResponse(sequence, peers):
+    data = "".join(struct.pack("!2H", *peer) for peer in peers)
+    return struct.pack("!B B 5H", 0x16, 0x81, sequence, 0x0618, 0, 0,
+                       len(data)) + data
+
+
+def readvarResponse(sequence, assoc, text, more=False, error=False):
+    opcode = 0x82 | (0x20 if more else 0) | (0x40 if error else 0)
+    padding = "\x00" * (-len(text) % 4)
+    return struct.pack("!B B 5H", 0x16, opcode, sequence, 0, assoc, 0,
+                       len(text)) + text + padding
+
+
+class TestNtpPeerSession(unittest.TestCase):
+    """
+    Test exchange reading variables of all associations.
+    """
+    def sent(self, actions):
+        return [NtpPacket.fromData(value) for action, value in actions
+                if action == ACTION_SEND]
+
+    def testDiscovery(self):
+        session = NtpPeerSession(host="127.0.0.1", timeout=5)
+        session.start()
+        session.popActions()
+        session.datagramReceived(
+            readstatResponse(1, [(10, 0x9614), (11, 0x9424)])
+        )
+        actions = session.popActions()
+        requests = self.sent(actions)
+        # all READVAR requests are sent at once, with a single timeout
+        self.assertEqual([r.assoc for r in requests], [10, 11])
+        self.assertEqual(actions[-1], (ACTION_TIMER, 5.0))
+        self.assertEqual(requests[0].peerData[:requests[0].count],
+                         PEER_VARIABLES)
+
+        session.datagramReceived(readvarResponse(
+            requests[1].sequence, 11, 'srcadr=10.0.0.2,refid="GPS",stratum=1'
+        ))
+        self.assertFalse(session.finished)
+        session.datagramReceived(readvarResponse(
+            requests[0].sequence, 10, "srcadr=10.0.0.1,refid=10.0.0.2,"
+            "stratum=2"
+        ))
+        actions = session.popActions()
+        self.assertEqual([a[1][0] for a in actions if a[0] == ACTION_PEER],
+                         [11, 10])
+        self.assertEqual(actions[-2], (ACTION_CANCEL, None))
+        self.assertEqual(actions[-1][0], ACTION_RESULT)
+        result = actions[-1][1]
+        self.assertTrue(result["syncSource"])
+        self.assertEqual(result["peers"], [
+            {"assocId": 10, "clockSelect": 6, "srcadr": "10.0.0.1",
+             "refid": "10.0.0.2", "stratum": 2},
+            {"assocId": 11, "clockSelect": 4, "srcadr": "10.0.0.2",
+             "refid": "GPS", "stratum": 1},
+        ])
+
+    def testKnownAssociations(self):
+        session = NtpPeerSession(host="127.0.0.1", assocIds=[7],
+                                 variables=PEER_STATS_VARIABLES)
+        session.start()
+        requests = self.sent(session.popActions())
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].opcode, 2)
+
+        session.datagramReceived(readvarResponse(
+            requests[0].sequence, 7, "offset=1.5,delay=20.0,", more=True
+        ))
+        self.assertFalse(session.finished)
+        session.datagramReceived(readvarResponse(
+            requests[0].sequence, 7, "jitter=0.25,reach=377\r\n"
+        ))
+        result = session.popActions()[-1][1]
+        self.assertEqual(result["peers"], [
+            {"assocId": 7, "offset": 0.0015, "delay": 0.02,
+             "jitter": 0.00025}
+        ])
+
+    def testErrorFallsBackToAllVariables(self):
+        session = NtpPeerSession(host="127.0.0.1", assocIds=[7],
+                                 variables=PEER_STATS_VARIABLES)
+        session.start()
+        request = self.sent(session.popActions())[0]
+        session.datagramReceived(
+            readvarResponse(request.sequence, 7, "", error=True)
+        )
+        retry = self.sent(session.popActions())[0]
+        self.assertEqual(retry.assoc, 7)
+        self.assertEqual(retry.count, 0)
+        session.datagramReceived(
+            readvarResponse(retry.sequence, 7, "offset=-3.0")
+        )
+        result = session.popActions()[-1][1]
+        self.assertEqual(result["peers"], [{"assocId": 7, "offset": -0.003}])
+
+    def testUnexpectedResponseIgnored(self):
+        session = NtpPeerSession(host="127.0.0.1", assocIds=[7])
+        session.start()
+        request = self.sent(session.popActions())[0]
+        session.datagramReceived(
+            readvarResponse(request.sequence, 8, "srcadr=10.0.0.8")
+        )
+        session.datagramReceived(
+            readvarResponse(request.sequence + 1, 7, "srcadr=10.0.0.8")
+        )
+        self.assertEqual(session.popActions(), [])
+        self.assertFalse(session.finished)
+
+    def testTimeoutKeepsAnsweredPeers(self):
+        session = NtpPeerSession(host="127.0.0.1", assocIds=[7, 8],
+                                 variables=PEER_STATS_VARIABLES)
+        session.start()
+        requests = self.sent(session.popActions())
+        session.datagramReceived(
+            readvarResponse(requests[0].sequence, 7, "offset=1.0")
+        )
+        self.assertEqual(
+            session.popActions(),
+            [(ACTION_PEER, (7, {"assocId": 7, "offset": 0.001}))]
+        )
+        session.timeoutHandler()
+        result = session.popActions()[-1][1]
+        self.assertEqual(result["peers"], [
+            {"assocId": 7, "offset": 0.001}, {"assocId": 8}
+        ])
+
+    def testTimeoutWithoutAnswers(self):
+        session = NtpPeerSession(host="127.0.0.1", assocIds=[7])
+        session.start()
+        session.popActions()
+        session.timeoutHandler()
+        self.assertEqual(session.popActions()[-1][0], ACTION_ERROR)
+
+    def testNoPeers(self):
+        session = NtpPeerSession(host="127.0.0.1", assocIds=[])
+        session.start()
+        actions = session.popActions()
+        self.assertEqual(actions[0][0], ACTION_RESULT)
+        self.assertEqual(actions[0][1]["peers"], [])
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpPeerSession))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -119,6 +119,22 @@ class TestNtpProtocolDynamic(unittest.TestCase):
 
         return d
 
+    def testPeerCallback(self):
+        peers = []
+        self.protocol = NtpProtocol(host="127.0.0.1")
+        self.protocol.transport = TestableDatagramTransport()
+        self.protocol.peerCallback = lambda *peer: peers.append(peer)
+        self.protocol.d = Deferred()
+
+        self.protocol.startProtocol()
+        readstat = '\x16\x81\x00\x01\x06\x18\x00\x00\x00\x00\x00\x04g\xf3\x96Z'
+        self.protocol.datagramReceived(data=readstat, addr=None)
+        readvar = '\x16\x82\x00\x02\x96Zg\xf3\x00\x00\x00\x0eoffset=2.063\r\n\x00\x00'
+        self.protocol.datagramReceived(data=readvar, addr=None)
+
+        self.assertEqual(peers, [(26611, {"offset": 0.002063})])
+        return self.protocol.d
+
     def testTimeout(self):
         def final(err):
             errMsg = 'Timeout. No response from NTP server'
@@ -0,0 +1,350 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import struct
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.session import *
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+
+__doc__ = """
+NtpSession is driven without reactor: datagrams and timeouts are fed
+in directly and produced actions are inspected.
+"""
+
+
+class TestNtpSession(unittest.TestCase):
+    """
+    Test I/O-free NTP exchange.
+    """
+    readstatRequest = '\x16\x01\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00'
+    readstatResponse = '\x16\x81\x00\x01\x06\x18\x00\x00\x00\x00\x00\x04g\xf3\x96Z'
+    readvarRequest = '\x16\x02\x00\x02\x00\x00g\xf3\x00\x00\x00\x06offset\x00\x00\x00\x00\x00\x00'
+    readvarResponse = '\x16\x82\x00\x02\x96Zg\xf3\x00\x00\x00\x0eoffset=2.063\r\n\x00\x00'
+
+    def setUp(self):
+        super(TestNtpSession, self).setUp()
+        self.session = NtpSession(host="127.0.0.1", timeout=5)
+
+    def testStartActions(self):
+        self.session.start()
+        self.assertEqual(
+            self.session.popActions(),
+            [(ACTION_SEND, self.readstatRequest), (ACTION_TIMER, 5.0)]
+        )
+
+    def testStartWithoutHost(self):
+        self.session.host = None
+        self.session.start()
+        actions = self.session.popActions()
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0][0], ACTION_ERROR)
+        self.assertIsInstance(actions[0][1], NtpException)
+
+    def testPopActionsClears(self):
+        self.session.start()
+        self.session.popActions()
+        self.assertEqual(self.session.popActions(), [])
+
+    def testExchange(self):
+        self.session.start()
+        self.session.popActions()
+        self.session.datagramReceived(self.readstatResponse)
+        self.assertEqual(
+            self.session.popActions(),
+            [
+                (ACTION_CANCEL, None),
+                (ACTION_SEND, self.readvarRequest),
+                (ACTION_TIMER, 5.0)
+            ]
+        )
+        self.session.datagramReceived(self.readvarResponse)
+        actions = self.session.popActions()
+        self.assertEqual(actions[0], (ACTION_CANCEL, None))
+        self.assertEqual(actions[1], (ACTION_PEER, (26611, {"offset": 0.002063})))
+        self.assertEqual(actions[2][0], ACTION_RESULT)
+        self.assertEqual(actions[2][1]["offset"], 0.002063)
+        self.assertTrue(actions[2][1]["syncSource"])
+        self.assertTrue(self.session.finished)
+
+    def testTimeout(self):
+        self.session.start()
+        self.session.popActions()
+        self.session.timeoutHandler()
+        actions = self.session.popActions()
+        self.assertEqual(actions[0][0], ACTION_ERROR)
+        self.assertEqual(
+            str(actions[0][1]), "Timeout. No response from NTP server"
+        )
+
+    def testIgnoreAfterFinish(self):
+        self.session.start()
+        self.session.timeoutHandler()
+        self.session.popActions()
+        self.session.datagramReceived(self.readstatResponse)
+        self.session.timeoutHandler()
+        self.assertEqual(self.session.popActions(), [])
+
+    def testRoundTripTime(self):
+        self.session.start()
+        self.session.requestSent(100.0)
+        self.session.responseReceived(100.004)
+        self.session.datagramReceived(self.readstatResponse)
+        self.session.requestSent(101.0)
+        self.session.responseReceived(101.002)
+        # later fragment of the same response
+        self.session.responseReceived(101.5)
+        self.session.datagramReceived(self.readvarResponse)
+        action, result = self.session.popActions()[-1]
+        self.assertEqual(action, ACTION_RESULT)
+        self.assertAlmostEqual(result["rtt"], 0.002)
+
+    def testStatusOnly(self):
+        self.session.checkMode = CHECK_STATUS
+        self.session.start()
+        self.session.popActions()
+        self.session.datagramReceived(self.readstatResponse)
+        actions = self.session.popActions()
+        self.assertNotIn(ACTION_SEND, [action for action, _ in actions])
+        action, result = actions[-1]
+        self.assertEqual(action, ACTION_RESULT)
+        self.assertTrue(result["headerOnly"])
+        self.assertTrue(result["syncSource"])
+        self.assertEqual(result["status"], STATE_OK)
+        self.assertEqual(result["systemStatus"]["eventCount"], 1)
+        self.assertEqual(formatResult(result)[1],
+                         "NTP OK: Server synchronized (last event: no_sys_peer)")
+
+    def testAutoReadsOffsetAfterEvent(self):
+        for lastEventCount, readvar in ((1, False), (0, True), (None, True)):
+            session = NtpSession(host="127.0.0.1", timeout=5)
+            session.checkMode = CHECK_AUTO
+            session.lastEventCount = lastEventCount
+            session.start()
+            session.popActions()
+            session.datagramReceived(self.readstatResponse)
+            actions = session.popActions()
+            self.assertEqual((ACTION_SEND, self.readvarRequest) in actions,
+                             readvar)
+            self.assertEqual(session.finished, not readvar)
+
+    def twoPeers(self):
+        self.session.start()
+        self.session.datagramReceived(struct.pack(
+            "!B B 5H 4H", 0x16, 0x81, 1, 0x0618, 0, 0, 8,
+            1, 0x9614, 2, 0x9614
+        ))
+        self.session.popActions()
+        return self.session.currentPeer
+
+    def readvar(self, assoc, text, opcode=0x82):
+        return struct.pack("!B B 5H", 0x16, opcode, 2, 0, assoc, 0,
+                           len(text)) + text
+
+    def testPeerStreamed(self):
+        peer = self.twoPeers()
+        self.session.datagramReceived(self.readvar(peer, "offset=-4.0"))
+        actions = self.session.popActions()
+        self.assertIn((ACTION_PEER, (peer, {"offset": -0.004})), actions)
+        self.assertFalse(self.session.finished)
+
+    def testTimeoutKeepsOffsets(self):
+        peer = self.twoPeers()
+        self.session.datagramReceived(self.readvar(peer, "offset=-4.0"))
+        self.session.popActions()
+        self.session.timeoutHandler()
+        actions = self.session.popActions()
+        self.assertEqual(actions[-1][0], ACTION_RESULT)
+        self.assertEqual(actions[-1][1]["offset"], -0.004)
+
+    def testFailedPeerSkipped(self):
+        peer = self.twoPeers()
+        # error bit, then again for all variables
+        self.session.datagramReceived(self.readvar(peer, "", opcode=0xc2))
+        self.session.datagramReceived(self.readvar(peer, "", opcode=0xc2))
+        actions = self.session.popActions()
+        self.assertEqual(actions[-2][0], ACTION_SEND)
+        other = self.session.currentPeer
+        self.assertNotEqual(other, peer)
+        self.session.datagramReceived(self.readvar(other, "offset=1.0"))
+        actions = self.session.popActions()
+        self.assertEqual(actions[-1][0], ACTION_RESULT)
+        self.assertEqual(actions[-1][1]["offset"], 0.001)
+
+    def testLongResponseSkipped(self):
+        peer = self.twoPeers()
+        fragment = self.readvar(peer, "x" * 400, opcode=0xa2)
+        for _ in range(MAX_BUFFERED // 400 + 1):
+            self.session.datagramReceived(fragment)
+        self.assertNotEqual(self.session.currentPeer, peer)
+        self.assertEqual(self.session.dataQueue, "")
+
+    def testLateFragmentsOfSkippedPeer(self):
+        peer = self.twoPeers()
+        fragment = self.readvar(peer, "x" * 400, opcode=0xa2)
+        for _ in range(MAX_BUFFERED // 400 + 1):
+            self.session.datagramReceived(fragment)
+        other = self.session.currentPeer
+        # server keeps answering the skipped request
+        self.session.datagramReceived(fragment)
+        self.session.datagramReceived(self.readvar(peer, "offset=9.0"))
+        self.assertEqual(self.session.dataQueue, "")
+        self.session.datagramReceived(self.readvar(other, "offset=1.0"))
+        actions = self.session.popActions()
+        self.assertNotIn((ACTION_PEER, (peer, {"offset": 0.009})), actions)
+        self.assertIn((ACTION_PEER, (other, {"offset": 0.001})), actions)
+        self.assertEqual(actions[-1][1]["offset"], 0.001)
+
+    def testLateFragmentKeepsTimeout(self):
+        peer = self.twoPeers()
+        fragment = self.readvar(peer, "x" * 400, opcode=0xa2)
+        for _ in range(MAX_BUFFERED // 400 + 1):
+            self.session.datagramReceived(fragment)
+        self.session.popActions()
+        self.session.datagramReceived(fragment)
+        actions = self.session.popActions()
+        self.assertEqual(actions[-1], (ACTION_TIMER, 5.0))
+        # next peer never answers, the check still ends
+        self.session.timeoutHandler()
+        self.assertTrue(self.session.finished)
+
+    def testSilentAfterReadvarFragment(self):
+        peer = self.twoPeers()
+        self.session.datagramReceived(
+            self.readvar(peer, "offset=3.0,", opcode=0xa2)
+        )
+        self.assertEqual(self.session.popActions()[-1], (ACTION_TIMER, 5.0))
+        self.session.timeoutHandler()
+        actions = self.session.popActions()
+        self.assertEqual(actions[-1][0], ACTION_ERROR)
+        self.assertTrue(self.session.finished)
+
+    def testSilentAfterReadstatFragment(self):
+        self.session.start()
+        self.session.popActions()
+        self.session.datagramReceived(struct.pack(
+            "!B B 5H 2H", 0x16, 0xa1, 1, 0x0618, 0, 0, 4, 1, 0x9614
+        ))
+        self.assertEqual(self.session.popActions(),
+                         [(ACTION_CANCEL, None), (ACTION_TIMER, 5.0)])
+        self.session.timeoutHandler()
+        self.assertEqual(self.session.popActions()[-1][0], ACTION_ERROR)
+
+    def testTooManyPeers(self):
+        self.session.start()
+        count = 100
+        for index in range(MAX_PEERS // count + 1):
+            assocs = []
+            for assoc in range(index * count + 1, (index + 1) * count + 1):
+                assocs.extend((assoc, 0x9614))
+            self.session.datagramReceived(struct.pack(
+                "!B B 5H %dH" % len(assocs), 0x16, 0xa1, 1, 0x0618, 0, 0,
+                len(assocs) * 2, *assocs
+            ))
+        action, error = self.session.popActions()[-1]
+        self.assertEqual(action, ACTION_ERROR)
+        self.assertIn("Too many peers", str(error))
+
+    def testResetReusesSession(self):
+        self.session.start()
+        self.session.datagramReceived(self.readstatResponse)
+        pool = SessionPool(maxSize=1)
+        pool.release(self.session)
+        pool.release(NtpSession())
+        session = pool.acquire("10.0.0.1", port=1123, timeout=2)
+        self.assertIs(session, self.session)
+        self.assertEqual(pool.free, [])
+        self.assertEqual((session.host, session.port, session.timeout),
+                         ("10.0.0.1", 1123, 2.0))
+        self.assertEqual(session.warning, NtpSession.DEFAULT_WARNING)
+        self.assertTrue(session.readstat)
+        self.assertEqual(session.peersToCheck, {})
+        self.assertEqual(session.popActions(), [])
+        self.assertFalse(hasattr(session, "__dict__"))
+
+    def testAllPeersFailed(self):
+        peer = self.twoPeers()
+        self.session.datagramReceived(self.readvar(peer, "", opcode=0xc2))
+        self.session.datagramReceived(self.readvar(peer, "", opcode=0xc2))
+        other = self.session.currentPeer
+        self.session.datagramReceived(self.readvar(other, "", opcode=0xc2))
+        actions = self.session.popActions()
+        self.assertEqual(actions[-1][0], ACTION_ERROR)
+
+
+class TestCombineResults(unittest.TestCase):
+    """
+    Test combining results of several servers.
+    """
+    def result(self, offset, syncSource=True, known=True):
+        return {
+            "offset": offset,
+            "offsetResult": STATE_OK if known else STATE_UNKNOWN,
+            "status": STATE_OK if syncSource else STATE_WARNING,
+            "syncSource": syncSource,
+            "liAlarm": False,
+            "warning": 1.0,
+            "critical": 2.0
+        }
+
+    def testBest(self):
+        results = [self.result(0.5), self.result(-0.1), None]
+        combined = combineResults(results, POLICY_BEST)
+        self.assertEqual(combined["offset"], -0.1)
+        self.assertEqual(combined["responding"], 2)
+        self.assertIs(combined["servers"], results)
+
+    def testMedian(self):
+        combined = combineResults(
+            [self.result(0.1), self.result(5.0, syncSource=False),
+             self.result(0.3)],
+            POLICY_MEDIAN
+        )
+        self.assertEqual(combined["offset"], 0.3)
+        self.assertTrue(combined["syncSource"])
+        self.assertEqual(combined["status"], STATE_OK)
+
+    def testMedianEven(self):
+        combined = combineResults(
+            [self.result(1.0), self.result(2.0), self.result(0, known=False)],
+            POLICY_MEDIAN
+        )
+        self.assertEqual(combined["offset"], 1.5)
+        self.assertEqual(combined["status"], STATE_WARNING)
+
+    def testQuorum(self):
+        results = [self.result(0.1), self.result(0.2), None]
+        combined = combineResults(results, POLICY_QUORUM, 2)
+        self.assertEqual(combined["offsetResult"], STATE_OK)
+        combined = combineResults(results, POLICY_QUORUM, 3)
+        self.assertEqual(combined["offsetResult"], STATE_UNKNOWN)
+        status, summary, _ = formatResult(combined)
+        self.assertEqual(status, STATE_CRITICAL)
+        self.assertEqual(
+            summary,
+            "NTP CRITICAL: Offset unknown (2 of 3 servers responding)"
+        )
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpSession))
+    suite.addTest(makeSuite(TestCombineResults))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,112 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import json
+import unittest
+from StringIO import StringIO
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.engine import NtpEngine
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+from ZenPacks.zenoss.NtpMonitor import pool
+from ZenPacks.zenoss.NtpMonitor.pool import NtpWorkerPool, NtpWorkerProtocol
+from ZenPacks.zenoss.NtpMonitor.worker import NtpWorker
+from twisted.test import proto_helpers
+
+
+class TestNtpWorker(unittest.TestCase):
+    """
+    Test child side of worker pool.
+    """
+    def setUp(self):
+        super(TestNtpWorker, self).setUp()
+        self.output = StringIO()
+        self.engine = NtpEngine()
+        self.worker = NtpWorker(self.engine, self.output)
+
+    def tearDown(self):
+        self.engine.close()
+
+    def testPartialLines(self):
+        self.worker.dataReceived('{"id": 1, "ho')
+        self.assertFalse(self.engine.waiting)
+        self.worker.dataReceived('st": "ntp1"}\n')
+        self.assertEqual(self.engine.waiting[0].tag, 1)
+
+    def testInvalidRequest(self):
+        self.worker.dataReceived('not json\n{"host": "ntp1"}\n')
+        self.assertFalse(self.engine.waiting)
+
+    def testEndOfInput(self):
+        self.worker.dataReceived('')
+        self.assertTrue(self.worker.closed)
+
+    def testFlush(self):
+        self.engine.finished.append((7, {"offset": 0.1}, None))
+        self.engine.finished.append((8, None, NtpException("Timeout")))
+        self.worker.flush()
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0]),
+                         {"id": 7, "result": {"offset": 0.1}})
+        self.assertEqual(json.loads(lines[1]), {"id": 8, "error": "Timeout"})
+
+
+class TestNtpWorkerPool(unittest.TestCase):
+    """
+    Test parent side of worker pool.
+    """
+    def testShardStable(self):
+        pool = NtpWorkerPool(4)
+        self.assertEqual(pool.shard("10.0.0.1"), pool.shard("10.0.0.1"))
+        shards = set(pool.shard("10.0.0.%d" % i) for i in range(100))
+        self.assertEqual(shards, set(range(4)))
+
+    def testResponses(self):
+        results = []
+        worker = NtpWorkerProtocol(NtpWorkerPool(1), 0)
+        worker.transport = proto_helpers.StringTransport()
+        d1 = worker.check({"host": "ntp1"})
+        d1.addCallback(results.append)
+        d2 = worker.check({"host": "ntp2"})
+        d2.addErrback(lambda f: results.append(f.getErrorMessage()))
+        request = json.loads(worker.transport.value().splitlines()[0])
+        self.assertEqual(request, {"host": "ntp1", "id": 1})
+        worker.outReceived('{"id": 2, "error": "Timeout"}\n{"id": 1, ')
+        worker.outReceived('"result": {"offset": 0.5}}\n')
+        self.assertEqual(results, ["Timeout", {"offset": 0.5}])
+        self.assertFalse(worker.pending)
+
+    def testSharedPool(self):
+        previous = pool._pool
+        pool._pool = None
+        try:
+            shared = pool.getWorkerPool(2)
+            self.assertIs(pool.getWorkerPool(4), shared)
+            self.assertIs(pool.getWorkerPool(2), shared)
+            self.assertEqual(shared.size, 4)
+            self.assertFalse(shared.workers)
+        finally:
+            pool._pool = previous
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestNtpWorker))
+    suite.addTest(makeSuite(TestNtpWorkerPool))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
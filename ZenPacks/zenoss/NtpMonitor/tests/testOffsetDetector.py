@@ -0,0 +1,74 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import random
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.detect import OffsetDetector, TREND_UP, \
+    TREND_DOWN
+
+
+class TestOffsetDetector(unittest.TestCase):
+    """
+    Test EWMA/CUSUM trend detection.
+    """
+    def setUp(self):
+        super(TestOffsetDetector, self).setUp()
+        self.random = random.Random(1)
+
+    def noise(self, count, sigma=0.001):
+        return [self.random.gauss(0, sigma) for _ in range(count)]
+
+    def testStableClock(self):
+        detector = OffsetDetector()
+        trends = [detector.update(offset) for offset in self.noise(500)]
+        self.assertEqual(trends.count(None), len(trends))
+
+    def testWalkingUp(self):
+        detector = OffsetDetector()
+        for offset in self.noise(30):
+            detector.update(offset)
+        trend = None
+        for step in range(1, 10):
+            trend = detector.update(0.002 * step) or trend
+        # detected long before reaching static 60 s threshold
+        self.assertEqual(trend, TREND_UP)
+
+    def testStepDown(self):
+        detector = OffsetDetector()
+        for offset in self.noise(30):
+            detector.update(offset)
+        trends = [detector.update(-0.01) for _ in range(3)]
+        self.assertEqual(trends[-1], TREND_DOWN)
+
+    def testNoAlarmDuringWarmup(self):
+        detector = OffsetDetector()
+        trends = [detector.update(offset) for offset in (0, 1, 2, 3, 4, 5)]
+        self.assertEqual(trends, [None] * 6)
+
+    def testCompactState(self):
+        detector = OffsetDetector()
+        self.assertFalse(hasattr(detector, "__dict__"))
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestOffsetDetector))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,132 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import math
+import unittest
+import warnings
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.history import OffsetHistory
+
+
+class TestOffsetHistory(unittest.TestCase):
+    """
+    Test offset ring buffers and stability statistics.
+    """
+    def setUp(self):
+        super(TestOffsetHistory, self).setUp()
+        self.history = OffsetHistory(size=8, capacity=2)
+
+    def fill(self, row, offsets, interval=300.0):
+        for i, offset in enumerate(offsets):
+            self.history.add(row, 1000.0 + i * interval, offset)
+
+    def testDrift(self):
+        row = self.history.allocate()
+        # 3 ms per 300 s = 10 ppm, ring wrapped twice
+        self.fill(row, [i * 0.003 for i in range(20)])
+        stats = self.history.getStats(row, 0, 0)
+        self.assertAlmostEqual(stats["drift"], 10.0)
+        self.assertAlmostEqual(stats["jitter"], 0.003)
+        self.assertAlmostEqual(stats["adev"], 0.0)
+
+    def testAlternating(self):
+        row = self.history.allocate()
+        self.fill(row, [0.001, -0.001] * 4)
+        stats = self.history.getStats(row, 0, 0)
+        # second differences are +-0.004
+        self.assertAlmostEqual(stats["tdev"], 0.004 / math.sqrt(6))
+        self.assertAlmostEqual(
+            stats["adev"], 0.004 / (math.sqrt(2) * 300.0)
+        )
+
+    def testUnevenSampling(self):
+        row = self.history.allocate()
+        # 10 ppm drift probed after 300, 600, 1200 and 2400 s
+        when = 1000.0
+        for interval in (0, 300, 600, 1200, 2400):
+            when += interval
+            self.history.add(row, when, (when - 1000.0) * 1e-5)
+        stats = self.history.getStats(row, 0, 0)
+        self.assertAlmostEqual(stats["drift"], 10.0)
+        self.assertAlmostEqual(stats["jitter"], 0.003)
+        self.assertAlmostEqual(stats["adev"], 0.0)
+        self.assertAlmostEqual(stats["tdev"], 0.0)
+
+    def testTooFewSamples(self):
+        row = self.history.allocate()
+        self.fill(row, [0.001])
+        self.assertEqual(self.history.getStats(row, 0, 0), {})
+        self.history.add(row, 1300.0, 0.002)
+        stats = self.history.getStats(row, 0, 0)
+        self.assertIn("jitter", stats)
+        self.assertNotIn("adev", stats)
+
+    def testRowsIndependent(self):
+        rows = [self.history.allocate() for _ in range(3)]
+        self.fill(rows[0], [i * 0.003 for i in range(8)])
+        self.fill(rows[2], [0.0] * 8)
+        self.assertAlmostEqual(
+            self.history.getStats(rows[0], 0, 0)["drift"], 10.0
+        )
+        self.assertEqual(self.history.getStats(rows[1], 0, 0), {})
+        self.assertAlmostEqual(self.history.getStats(rows[2], 0, 0)["drift"], 0)
+
+    def testComputedOncePerInterval(self):
+        row = self.history.allocate()
+        self.fill(row, [0.001, 0.002, 0.003])
+        self.history.getStats(row, 100.0, 300.0)
+        stats = self.history.stats
+        self.history.getStats(row, 399.0, 300.0)
+        self.assertIs(self.history.stats, stats)
+        self.history.getStats(row, 400.0, 300.0)
+        self.assertIsNot(self.history.stats, stats)
+
+    def testLatestSampleIncluded(self):
+        rows = [self.history.allocate() for _ in range(2)]
+        self.fill(rows[0], [0.001, 0.002, 0.003])
+        self.history.getStats(rows[0], 100.0, 300.0)
+        # samples arriving within the interval count at once
+        self.fill(rows[1], [0.0, 0.003])
+        self.assertAlmostEqual(
+            self.history.getStats(rows[1], 200.0, 300.0)["drift"], 10.0
+        )
+        self.history.add(rows[1], 1600.0, 0.006)
+        self.assertIn("adev", self.history.getStats(rows[1], 250.0, 300.0))
+
+    def testEmptyRowsSilent(self):
+        row = self.history.allocate()
+        self.fill(row, [0.001, 0.002, 0.003])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.history.getStats(row, 0, 0)
+        self.assertEqual(caught, [])
+
+    def testRelease(self):
+        row = self.history.allocate()
+        self.fill(row, [0.001, 0.002, 0.003])
+        self.history.release(row)
+        self.assertEqual(self.history.allocate(), row)
+        self.assertEqual(self.history.getStats(row, 0, 0), {})
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestOffsetHistory))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,66 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.schedule import PollSchedule
+
+
+class TestPollSchedule(unittest.TestCase):
+    """
+    Test adaptive probing interval.
+    """
+    def testFirstProbeDue(self):
+        self.assertTrue(PollSchedule().isDue(0, 300))
+
+    def testStableDoublesToCeiling(self):
+        schedule = PollSchedule()
+        intervals = [schedule.update(0, 300, 1800, True) for _ in range(4)]
+        self.assertEqual(intervals, [600, 1200, 1800, 1800])
+
+    def testNoisyHalvesToFloor(self):
+        schedule = PollSchedule()
+        schedule.update(0, 300, 2400, True)
+        schedule.update(0, 300, 2400, True)
+        schedule.update(0, 300, 2400, True)
+        intervals = [schedule.update(0, 300, 2400, False) for _ in range(4)]
+        self.assertEqual(intervals, [1200, 600, 300, 300])
+
+    def testResetToFloor(self):
+        schedule = PollSchedule()
+        schedule.update(0, 300, 1800, True)
+        self.assertEqual(schedule.update(0, 300, 1800, True, reset=True), 300)
+
+    def testCeilingBelowFloor(self):
+        schedule = PollSchedule()
+        self.assertEqual(schedule.update(0, 300, 0, True), 300)
+
+    def testIsDue(self):
+        schedule = PollSchedule()
+        schedule.update(1000, 300, 1800, True)
+        self.assertFalse(schedule.isDue(1300, 300))
+        # collector cycles may come slightly early
+        self.assertTrue(schedule.isDue(1590, 300))
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestPollSchedule))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,106 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor import profiling
+from ZenPacks.zenoss.NtpMonitor.packet import NtpPacket
+
+
+class LogRecords(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestProfiling(unittest.TestCase):
+    """
+    Test profiling of the collection hot path.
+    """
+    readvarData = '\x16\x82\x00\x02\x96Zg\xf3\x00\x00\x00\x0eoffset=2.063\r\n\x00\x00'
+
+    def setUp(self):
+        super(TestProfiling, self).setUp()
+        self.now = 1000.0
+        self.profiler = profiling.Profiler(interval=300,
+                                           clock=lambda: self.now)
+        self.original = profiling._profiler
+        profiling._profiler = self.profiler
+        self.handler = LogRecords()
+        self.logger = logging.getLogger("zen.NtpMonitor")
+        self.level = self.logger.level
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiling._profiler = self.original
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+        shutil.rmtree(self.directory)
+
+    def testDisabled(self):
+        NtpPacket.fromData(self.readvarData)
+        self.assertEqual(self.profiler.timings, {})
+
+    def testTimings(self):
+        self.profiler.request()
+        for _ in range(3):
+            NtpPacket.fromData(self.readvarData).getPeerOffset()
+        self.assertEqual(
+            self.profiler.timings["NtpPacket.fromData"][0], 3
+        )
+
+    def testReport(self):
+        path = os.path.join(self.directory, "profile.pstats")
+        self.profiler.request(path)
+        NtpPacket.fromData(self.readvarData)
+        self.now += 300
+        NtpPacket.fromData(self.readvarData)
+
+        report = [m for m in self.handler.messages
+                  if m.startswith("NTP profile")]
+        self.assertEqual(len(report), 1)
+        self.assertIn("NtpPacket.fromData", report[0])
+        self.assertTrue(os.path.exists(path))
+        # not requested during the interval
+        self.assertFalse(self.profiler.enabled)
+
+    def testKeptEnabled(self):
+        self.profiler.request()
+        self.now += 200
+        self.profiler.request()
+        self.now += 100
+        NtpPacket.fromData(self.readvarData)
+        self.assertTrue(self.profiler.enabled)
+        self.assertEqual(self.profiler.timings, {})
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestProfiling))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,242 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import heapq
+import random
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from ZenPacks.zenoss.NtpMonitor.ntp import NtpProtocol, ReactorTimerWheel, \
+    TIMER_TICK
+from ZenPacks.zenoss.NtpMonitor.packet import NtpException
+
+__doc__ = """
+Tens of thousands of NtpProtocol sessions run at once over an in-memory
+network under twisted's Clock. The network delays replies and drops some
+of them, deterministically, so timeouts and timer bookkeeping are
+exercised at fleet scale within a normal test run. Costs are counted as
+operations on the timer wheel and the transport, not measured in time.
+"""
+
+READSTAT_RESPONSE = '\x16\x81\x00\x01\x06\x18\x00\x00\x00\x00\x00\x04g\xf3\x96Z'
+READVAR_RESPONSE = '\x16\x82\x00\x02\x96Zg\xf3\x00\x00\x00\x0eoffset=2.063\r\n\x00\x00'
+TIMEOUT = 5.0
+
+
+class SimulatedNetwork(object):
+    """
+    Answers requests of all sessions like ntpd with one peer, after
+    random latency, losing a fraction of replies.
+    """
+    def __init__(self, clock, loss=0.0, latency=(0.001, 0.2), seed=0,
+                 observer=None):
+        self.clock = clock
+        # called whenever the clock advanced or datagrams were delivered
+        self.observer = observer
+        self.loss = loss
+        self.latency = latency
+        self.random = random.Random(seed)
+        # (delivery time, sequence, protocol, datagram)
+        self.queue = []
+        self.counter = 0
+        # hosts which lost at least one reply
+        self.lossy = set()
+
+    def send(self, protocol, data):
+        if self.random.random() < self.loss:
+            self.lossy.add(protocol.host)
+            return
+        # opcode 1 is READSTAT, 2 READVAR
+        opcode = ord(data[1]) & 0x1f
+        reply = READSTAT_RESPONSE if opcode == 1 else READVAR_RESPONSE
+        self.counter += 1
+        heapq.heappush(self.queue, (
+            self.clock.seconds() + self.random.uniform(*self.latency),
+            self.counter, protocol, reply
+        ))
+
+    def run(self, until):
+        """
+        Deliver datagrams and advance clock up to time until.
+        """
+        while True:
+            due = until
+            if self.queue:
+                due = min(due, self.queue[0][0])
+            if due > self.clock.seconds():
+                self.clock.advance(due - self.clock.seconds())
+            while self.queue and self.queue[0][0] <= self.clock.seconds():
+                _, _, protocol, reply = heapq.heappop(self.queue)
+                protocol.datagramReceived(reply, (protocol.host, 123))
+            if self.observer:
+                self.observer()
+            if self.clock.seconds() >= until and not self.queue:
+                return
+
+
+class SimulatedTransport(object):
+    """
+    Connected datagram transport writing to SimulatedNetwork.
+    """
+    def __init__(self, network, protocol, operations):
+        self.network = network
+        self.protocol = protocol
+        self.operations = operations
+
+    def connect(self, host, port):
+        pass
+
+    def write(self, data, addr=None):
+        self.operations["write"] += 1
+        self.network.send(self.protocol, data)
+
+
+class CountingTimerWheel(ReactorTimerWheel):
+    """
+    ReactorTimerWheel counting timers placed into buckets, including
+    cascades, removed, expired and ticks advanced.
+    """
+    def __init__(self, operations, clock):
+        ReactorTimerWheel.__init__(self, clock=clock)
+        self.operations = operations
+
+    def place(self, timer):
+        self.operations["place"] += 1
+        ReactorTimerWheel.place(self, timer)
+
+    def timerRemoved(self):
+        self.operations["remove"] += 1
+        ReactorTimerWheel.timerRemoved(self)
+
+    def advance(self, now=None):
+        self.operations["advance"] += 1
+        expired = ReactorTimerWheel.advance(self, now)
+        self.operations["expire"] += expired
+        return expired
+
+
+class TestScale(unittest.TestCase):
+    """
+    Test many concurrent NtpProtocol sessions under simulated time.
+    """
+    def setUp(self):
+        super(TestScale, self).setUp()
+        self.clock = Clock()
+        self.operations = dict.fromkeys(
+            ("write", "place", "remove", "advance", "expire"), 0
+        )
+        self.timers = CountingTimerWheel(self.operations, self.clock)
+
+    def runSessions(self, count, loss=0.0, seed=0):
+        """
+        Start count sessions at once and run them to completion.
+        :return: network, results and errors by host, operations on the
+            timer wheel and the transport
+        """
+        results = {}
+        errors = {}
+        started = [0]
+
+        def checkBounds():
+            inFlight = started[0] - len(results) - len(errors)
+            # at most one armed timeout per unfinished session
+            self.assertLessEqual(len(self.timers), inFlight)
+            # the wheel is driven by a single delayed call
+            self.assertLessEqual(len(self.clock.getDelayedCalls()), 1)
+
+        def succeeded(result, host):
+            results[host] = result
+
+        def failed(failure, host):
+            errors[host] = (self.clock.seconds(), failure.value)
+
+        network = SimulatedNetwork(self.clock, loss, seed=seed,
+                                   observer=checkBounds)
+        for i in range(count):
+            host = "10.%d.%d.%d" % (i >> 16, (i >> 8) & 0xff, i & 0xff)
+            protocol = NtpProtocol(host, timeout=TIMEOUT)
+            protocol.transport = SimulatedTransport(
+                network, protocol, self.operations
+            )
+            protocol.timers = self.timers
+            protocol.d = Deferred()
+            protocol.d.addCallback(succeeded, host)
+            protocol.d.addErrback(failed, host)
+            protocol.startProtocol()
+            started[0] += 1
+            checkBounds()
+        self.assertEqual(len(self.timers), count)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        network.run(TIMEOUT + 2 * TIMER_TICK)
+        return network, results, errors, dict(self.operations)
+
+    def testTenThousandSessions(self):
+        network, results, errors, _ = self.runSessions(10000)
+        self.assertEqual(len(results), 10000)
+        self.assertEqual(errors, {})
+        for result in results.itervalues():
+            self.assertEqual(result["offset"], 0.002063)
+        # all timeouts cancelled, ticker stopped
+        self.assertEqual(len(self.timers), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def testLossCausesTimeouts(self):
+        network, results, errors, _ = self.runSessions(10000, loss=0.05)
+        self.assertEqual(set(errors), network.lossy)
+        self.assertEqual(len(results) + len(errors), 10000)
+        self.assertTrue(0 < len(errors) < 2000)
+        for failedAt, error in errors.itervalues():
+            self.assertIsInstance(error, NtpException)
+            self.assertIn("Timeout", str(error))
+            # never early, at most two ticks late, after the latency of
+            # a READSTAT reply at most
+            self.assertLessEqual(failedAt, 0.2 + TIMEOUT + 2 * TIMER_TICK)
+            self.assertGreaterEqual(failedAt, TIMEOUT)
+        self.assertEqual(len(self.timers), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def testDeterministic(self):
+        _, _, errors, _ = self.runSessions(2000, loss=0.1, seed=7)
+        self.setUp()
+        _, _, again, _ = self.runSessions(2000, loss=0.1, seed=7)
+        self.assertEqual(
+            dict((host, failedAt) for host, (failedAt, _) in errors.items()),
+            dict((host, failedAt) for host, (failedAt, _) in again.items())
+        )
+
+    def testLinearScaling(self):
+        _, _, _, small = self.runSessions(2000, loss=0.05)
+        self.setUp()
+        _, _, _, large = self.runSessions(10000, loss=0.05)
+        # a request and its timeout per exchange, no work per session
+        # grows with the number of sessions
+        for name in ("write", "place", "remove", "expire"):
+            self.assertLessEqual(large[name], 2 * 10000, name)
+            self.assertLessEqual(large[name] / 10000.0,
+                                 small[name] / 2000.0 * 1.2, name)
+        # ticks depend on the timeout only
+        self.assertEqual(large["advance"], small["advance"])
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestScale))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
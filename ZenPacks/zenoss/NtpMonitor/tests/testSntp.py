@@ -0,0 +1,243 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import socket
+import time
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.sntp import *
+from ZenPacks.zenoss.NtpMonitor.engine import NtpEngine
+from ZenPacks.zenoss.NtpMonitor.protocols import Calibrator
+from ZenPacks.zenoss.NtpMonitor.session import ACTION_RESULT, ACTION_ERROR, \
+    formatResult
+
+__doc__ = """
+SntpSession is exercised against local UDP socket standing in for an
+NTP server whose clock is shifted from the collector's.
+"""
+
+
+class SntpStandIn(object):
+    """
+    Answers mode 3 requests with clock shifted by shift seconds.
+    """
+    def __init__(self, shift=0.0, leap=0, stratum=2):
+        self.shift = shift
+        self.leap = leap
+        self.stratum = stratum
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.settimeout(5)
+        self.port = self.socket.getsockname()[1]
+
+    def reply(self, request):
+        values = SNTP_PACKET.unpack(request)
+        now = toTimestamp(time.time() + self.shift)
+        return SNTP_PACKET.pack(
+            self.leap << 6 | SNTP_VERSION << 3 | MODE_SERVER, self.stratum,
+            6, -20, 0, 0, "GPS\x00", 0, 0,
+            values[13], values[14], now[0], now[1], now[0], now[1]
+        )
+
+    def answer(self):
+        request, addr = self.socket.recvfrom(4096)
+        self.socket.sendto(self.reply(request), addr)
+
+    def close(self):
+        self.socket.close()
+
+
+class TestCalibration(unittest.TestCase):
+    """
+    Test estimate of the collector's clock offset.
+    """
+    def testShortestDelayWins(self):
+        calibration = Calibration()
+        calibration.add("ref1", 0.010, 0.002, 1000.0)
+        calibration.add("ref1", 0.050, 0.080, 1010.0)
+        self.assertEqual(calibration.getCorrection(1010.0), 0.010)
+
+    def testMedianOfReferences(self):
+        calibration = Calibration()
+        for reference, offset in (("ref1", 0.01), ("ref2", 0.02),
+                                  ("ref3", 0.9)):
+            calibration.add(reference, offset, 0.001, 1000.0)
+        self.assertEqual(calibration.getCorrection(1000.0), 0.02)
+
+    def testStale(self):
+        calibration = Calibration(maxAge=600)
+        self.assertEqual(calibration.getCorrection(1000.0), 0.0)
+        calibration.add("ref1", 0.01, 0.001, 1000.0)
+        calibration.add("ref2", 0.03, 0.001, 1700.0)
+        # ref1's sample is too old to count
+        self.assertEqual(calibration.getCorrection(1700.0), 0.03)
+        self.assertEqual(calibration.getCorrection(2400.0), 0.0)
+
+
+class TestCalibrator(unittest.TestCase):
+    """
+    Test checks waiting for the first samples of references.
+    """
+    def testReadyAfterFirstRound(self):
+        calibrator = Calibrator()
+        calibrator.pending = 2
+        ready = []
+        calibrator.whenReady().addCallback(ready.append)
+        calibrator.done()
+        self.assertEqual(ready, [])
+        calibrator.done()
+        self.assertEqual(ready, [None])
+        # later checks do not wait
+        calibrator.whenReady().addCallback(ready.append)
+        self.assertEqual(ready, [None, None])
+
+
+class TestSntpSession(unittest.TestCase):
+    """
+    Test SNTP exchange over local UDP socket.
+    """
+    def setUp(self):
+        super(TestSntpSession, self).setUp()
+        self.standIn = SntpStandIn()
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(5)
+
+    def tearDown(self):
+        self.client.close()
+        self.standIn.close()
+
+    def exchange(self, session):
+        """
+        Run session's round trip and return its final action.
+        """
+        session.start()
+        request = session.popActions()[0][1]
+        self.client.sendto(request, ("127.0.0.1", self.standIn.port))
+        self.standIn.answer()
+        data, addr = self.client.recvfrom(4096)
+        session.responseReceived(time.time())
+        session.datagramReceived(data, addr)
+        return session.popActions()[-1]
+
+    def testServerBehind(self):
+        self.standIn.shift = -2.0
+        session = SntpSession("127.0.0.1", self.standIn.port, warning=1,
+                              critical=5)
+        action, result = self.exchange(session)
+        self.assertEqual(action, ACTION_RESULT)
+        self.assertAlmostEqual(result["offset"], 2.0, delta=0.05)
+        self.assertEqual(result["status"], STATE_WARNING)
+        self.assertEqual(result["stratum"], 2)
+        self.assertTrue(0 <= result["delay"] < 0.05)
+
+    def testCorrected(self):
+        # collector is 0.5 secs behind both reference and server
+        self.standIn.shift = 0.5
+        calibration = Calibration()
+        calibration.add("ref", 0.5, 0.001, time.time())
+        session = SntpSession("127.0.0.1", self.standIn.port)
+        session.calibration = calibration
+        action, result = self.exchange(session)
+        self.assertAlmostEqual(result["offset"], 0.0, delta=0.05)
+        self.assertAlmostEqual(result["correction"], 0.5)
+
+    def testUnsynchronized(self):
+        self.standIn.leap = LEAP_UNSYNCHRONIZED
+        session = SntpSession("127.0.0.1", self.standIn.port)
+        action, result = self.exchange(session)
+        self.assertEqual(result["offsetResult"], STATE_UNKNOWN)
+        self.assertEqual(result["status"], STATE_WARNING)
+        self.assertTrue(result["liAlarm"])
+
+    def testKissOfDeath(self):
+        self.standIn.stratum = 0
+        session = SntpSession("127.0.0.1", self.standIn.port)
+        action, error = self.exchange(session)
+        self.assertEqual(action, ACTION_ERROR)
+        self.assertIn("Kiss-o'-Death", str(error))
+
+    def testUnexpectedReplyIgnored(self):
+        session = SntpSession("127.0.0.1")
+        session.start()
+        session.popActions()
+        session.datagramReceived(SNTP_PACKET.pack(
+            SNTP_VERSION << 3 | MODE_SERVER, 2, 0, 0, 0, 0, "GPS\x00",
+            *([1] * 8)
+        ))
+        self.assertFalse(session.finished)
+
+
+class TestCalibratedEngine(unittest.TestCase):
+    """
+    Test calibration of client mode checks in NtpEngine.
+    """
+    def setUp(self):
+        super(TestCalibratedEngine, self).setUp()
+        self.reference = SntpStandIn(shift=0.5)
+        self.server = SntpStandIn(shift=0.5)
+        self.engine = NtpEngine()
+
+    def tearDown(self):
+        self.engine.close()
+        self.reference.close()
+        self.server.close()
+
+    def testReferenceCorrects(self):
+        self.engine.calibrate(["127.0.0.1"], port=self.reference.port)
+        self.engine.submit("127.0.0.1", self.server.port, checkMode="client")
+        self.engine.step(maxWait=0)
+        # check waits for the reference
+        self.assertEqual(len(self.engine.held), 1)
+        self.reference.answer()
+        self.engine.step(maxWait=5)
+        self.engine.step(maxWait=0)
+        self.server.answer()
+        results = list(self.engine.run())
+        # reference's sample is not a result
+        self.assertEqual(len(results), 1)
+        _, result, error = results[0]
+        self.assertIsNone(error)
+        self.assertAlmostEqual(result["correction"], 0.5, delta=0.05)
+        self.assertAlmostEqual(result["offset"], 0.0, delta=0.05)
+        self.assertTrue(result["calibrated"])
+
+    def testReferenceTimedOut(self):
+        self.engine.calibrate(["127.0.0.1"], timeout=0.2,
+                              port=self.reference.port)
+        self.engine.submit("127.0.0.1", self.server.port, checkMode="client")
+        self.engine.step(maxWait=0)
+        self.engine.step(maxWait=1)
+        self.engine.step(maxWait=0)
+        self.assertEqual(len(self.engine.held), 0)
+        self.server.answer()
+        _, result, error = list(self.engine.run())[0]
+        self.assertIsNone(error)
+        self.assertEqual(result["correction"], 0.0)
+        self.assertFalse(result["calibrated"])
+        self.assertIn("(uncalibrated)", formatResult(result)[1])
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestCalibration))
+    suite.addTest(makeSuite(TestCalibrator))
+    suite.addTest(makeSuite(TestSntpSession))
+    suite.addTest(makeSuite(TestCalibratedEngine))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,85 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import os
+import shutil
+import tempfile
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.state import StateStore
+
+
+class TestStateStore(unittest.TestCase):
+    """
+    Test on-disk state of targets.
+    """
+    def setUp(self):
+        super(TestStateStore, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "var", "state.sqlite")
+        self.now = 1000.0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, **kwargs):
+        return StateStore(self.path, clock=lambda: self.now, **kwargs)
+
+    def testUnknownKey(self):
+        self.assertIsNone(self.store().get("dev/ds"))
+
+    def testFlushedAfterInterval(self):
+        store = self.store(flushInterval=60)
+        store.put("dev/ds", {"schedule": [600, 1600]})
+        self.assertIsNone(self.store().get("dev/ds"))
+        # pending state is visible in the same store
+        self.assertEqual(store.get("dev/ds"), {"schedule": [600, 1600]})
+
+        self.now += 60
+        store.put("dev2/ds", {"schedule": [300, 1360]})
+        other = self.store()
+        self.assertEqual(other.get("dev/ds"), {"schedule": [600, 1600]})
+        self.assertEqual(other.get("dev2/ds"), {"schedule": [300, 1360]})
+
+    def testClose(self):
+        store = self.store()
+        store.put("dev/ds", {"lastState": None})
+        store.close()
+        self.assertEqual(self.store().get("dev/ds"), {"lastState": None})
+
+    def testOldStateDropped(self):
+        store = self.store()
+        store.put("dev/ds", {})
+        store.close()
+        self.now += 8 * 86400
+        self.assertIsNone(self.store().get("dev/ds"))
+
+    def testUnusableFile(self):
+        self.path = self.directory
+        store = self.store()
+        store.put("dev/ds", {})
+        store.close()
+        self.assertIsNone(store.get("dev/ds"))
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestStateStore))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
@@ -0,0 +1,140 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import Globals
+import unittest
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+from ZenPacks.zenoss.NtpMonitor.timerwheel import TimerWheel
+from ZenPacks.zenoss.NtpMonitor.ntp import ReactorTimerWheel
+from twisted.internet.task import Clock
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Test hierarchical timer wheel.
+    """
+    def setUp(self):
+        super(TestTimerWheel, self).setUp()
+        self.clock = FakeClock()
+        self.fired = []
+        self.wheel = TimerWheel(tick=1.0, levels=(8, 4, 4), clock=self.clock)
+
+    def runUntil(self, now):
+        self.clock.now = now
+        return self.wheel.advance()
+
+    def testNotEarly(self):
+        self.wheel.schedule(3.0, self.fired.append, "a")
+        self.runUntil(102.9)
+        self.assertEqual(self.fired, [])
+        self.runUntil(103.0)
+        self.assertEqual(self.fired, ["a"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def testCancel(self):
+        timer = self.wheel.schedule(3.0, self.fired.append, "a")
+        self.assertTrue(timer.active())
+        timer.cancel()
+        self.assertFalse(timer.active())
+        self.assertEqual(len(self.wheel), 0)
+        self.runUntil(110.0)
+        self.assertEqual(self.fired, [])
+
+    def testBatch(self):
+        for i in range(1000):
+            self.wheel.schedule(5.0, self.fired.append, i)
+        self.assertEqual(self.runUntil(105.0), 1000)
+        self.assertEqual(len(self.fired), 1000)
+
+    def testUpperLevels(self):
+        # beyond level 0 (8 ticks) and level 1 (32 ticks)
+        def fire(delay):
+            self.fired.append((delay, self.clock.now))
+
+        for delay in (7.0, 20.0, 100.0, 300.0):
+            self.wheel.schedule(delay, fire, delay)
+        for second in range(101, 401):
+            self.runUntil(float(second))
+        self.assertEqual(
+            self.fired,
+            [(7.0, 107.0), (20.0, 120.0), (100.0, 200.0), (300.0, 400.0)]
+        )
+
+    def testIdleSkip(self):
+        self.runUntil(1000.0)
+        self.wheel.schedule(2.0, self.fired.append, "a")
+        self.runUntil(1001.0)
+        self.assertEqual(self.fired, [])
+        self.runUntil(1002.0)
+        self.assertEqual(self.fired, ["a"])
+
+
+class TestReactorTimerWheel(unittest.TestCase):
+    """
+    Test timer wheel driven by reactor.
+    """
+    def setUp(self):
+        super(TestReactorTimerWheel, self).setUp()
+        self.clock = Clock()
+        self.fired = []
+        self.wheel = ReactorTimerWheel(tick=0.5, clock=self.clock)
+
+    def testSingleDelayedCall(self):
+        for i in range(100):
+            self.wheel.schedule(60.0, self.fired.append, i)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(60.0)
+        self.assertEqual(len(self.fired), 100)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def testStopWhenEmpty(self):
+        timer = self.wheel.schedule(60.0, self.fired.append, 1)
+        timer.cancel()
+        self.assertFalse(self.wheel.ticker.running)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def testRescheduleWhileExpiring(self):
+        other = self.wheel.schedule(60.0, self.fired.append, "other")
+
+        def expire():
+            # last armed timer cancelled, new one armed in the same tick
+            other.cancel()
+            self.wheel.schedule(10.0, self.fired.append, "next")
+        self.wheel.schedule(5.0, expire)
+        self.clock.advance(5.0)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(10.0)
+        self.assertEqual(self.fired, ["next"])
+        self.assertFalse(self.wheel.ticker.running)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+def test_suite():
+    """
+    Return test suite for this module.
+    """
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestTimerWheel))
+    suite.addTest(makeSuite(TestReactorTimerWheel))
+    return suite
+
+if __name__ == "__main__":
+    from zope.testrunner.runner import Runner
+    runner = Runner(found_suites=[test_suite()])
+    runner.run()
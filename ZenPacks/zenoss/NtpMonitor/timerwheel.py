@@ -0,0 +1,157 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Hierarchical timer wheel for response timeouts of NTP sessions.
+
+Time is divided into ticks. Level 0 has one slot per tick, every next
+level has slots covering whole rotation of the level below. Arming and
+cancelling a timer is a set insertion/removal; timers of a tick expire
+together and timers on upper levels are cascaded down when the lower
+level wraps around. Precision is one tick, timers never fire early.
+"""
+
+import math
+import time
+
+
+class Timer(object):
+    """
+    Handle of a scheduled callback, compatible with DelayedCall's
+    active() and cancel().
+    """
+    __slots__ = ("wheel", "expiry", "callback", "args", "bucket")
+
+    def __init__(self, wheel, expiry, callback, args):
+        self.wheel = wheel
+        self.expiry = expiry
+        self.callback = callback
+        self.args = args
+        self.bucket = None
+
+    def active(self):
+        return self.bucket is not None
+
+    def cancel(self):
+        if self.bucket is not None:
+            self.bucket.discard(self)
+            self.bucket = None
+            self.wheel.timerRemoved()
+
+    def getTime(self):
+        return self.wheel.tickTime(self.expiry)
+
+
+class TimerWheel(object):
+    """
+    Timers are advanced explicitly with advance().
+    """
+    def __init__(self, tick=0.5, levels=(256, 64, 64), clock=time.time):
+        """
+        Initialize TimerWheel.
+        :param tick: resolution of timers in seconds
+        :param levels: number of slots on every level
+        :param clock: function returning current time in seconds
+        """
+        self.tick = float(tick)
+        self.clock = clock
+        self.start = clock()
+        self.current = 0
+        self.count = 0
+        self.sizes = tuple(levels)
+        self.spans = []
+        span = 1
+        for size in self.sizes:
+            self.spans.append(span)
+            span *= size
+        self.levels = [[set() for _ in range(size)] for size in self.sizes]
+
+    def __len__(self):
+        return self.count
+
+    def tickOf(self, when):
+        return int(math.floor((when - self.start) / self.tick))
+
+    def tickTime(self, tick):
+        return self.start + tick * self.tick
+
+    def schedule(self, delay, callback, *args):
+        """
+        Call callback after at least delay seconds.
+        :return: handle of scheduled call
+        :rtype: Timer
+        """
+        if not self.count:
+            # nothing is armed, skip idle ticks at once
+            self.current = max(self.current, self.tickOf(self.clock()))
+        now = self.clock()
+        expiry = int(math.ceil((now + delay - self.start) / self.tick))
+        timer = Timer(self, max(expiry, self.current + 1), callback, args)
+        self.place(timer)
+        self.count += 1
+        return timer
+
+    def place(self, timer):
+        distance = timer.expiry - self.current
+        last = len(self.sizes) - 1
+        for level, size in enumerate(self.sizes):
+            span = self.spans[level]
+            if distance < span * size or level == last:
+                bucket = self.levels[level][(timer.expiry // span) % size]
+                break
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def timerRemoved(self):
+        self.count -= 1
+
+    def advance(self, now=None):
+        """
+        Expire all timers due until now.
+        :return: number of expired timers
+        :rtype: int
+        """
+        target = self.tickOf(self.clock() if now is None else now)
+        expired = 0
+        while self.current < target and self.count:
+            self.current += 1
+            self.cascade()
+            bucket = self.levels[0][self.current % self.sizes[0]]
+            if not bucket:
+                continue
+            timers = list(bucket)
+            bucket.clear()
+            for timer in timers:
+                timer.bucket = None
+            self.count -= len(timers)
+            expired += len(timers)
+            for timer in timers:
+                timer.callback(*timer.args)
+        if not self.count:
+            self.current = max(self.current, target)
+        return expired
+
+    def cascade(self):
+        for level in range(1, len(self.sizes)):
+            span = self.spans[level]
+            if self.current % span:
+                break
+            bucket = self.levels[level][(self.current // span) %
+                                        self.sizes[level]]
+            timers = list(bucket)
+            bucket.clear()
+            for timer in timers:
+                if timer.expiry <= self.current:
+                    # overdue, expires with current tick
+                    timer.expiry = self.current
+                    bucket0 = self.levels[0][self.current % self.sizes[0]]
+                    bucket0.add(timer)
+                    timer.bucket = bucket0
+                else:
+                    self.place(timer)
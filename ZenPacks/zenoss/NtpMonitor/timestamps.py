@@ -0,0 +1,77 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Kernel receive timestamps of UDP datagrams.
+
+Linux stamps datagrams when they arrive and returns the stamp of the
+datagram read last with the SIOCGSTAMPNS ioctl, so round trip times do
+not include the time the datagram waited for the reactor or the select
+loop. Python 2 has no recvmsg() to read SO_TIMESTAMPNS ancillary data,
+and with that option set the kernel keeps the stamp only in ancillary
+data. The first SIOCGSTAMPNS call turns stamping on for the socket
+instead. Elsewhere, or if the kernel refuses, the current time is used.
+"""
+
+import errno
+import fcntl
+import logging
+import socket
+import struct
+import sys
+import time
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+KERNEL_TIMESTAMPS = sys.platform.startswith("linux")
+SIOCGSTAMPNS = 0x8907
+TIMESPEC = struct.Struct("@ll")
+
+
+def readStamp(sock):
+    seconds, nanoseconds = TIMESPEC.unpack(fcntl.ioctl(
+        sock.fileno(), SIOCGSTAMPNS, TIMESPEC.pack(0, 0)
+    ))
+    return seconds + nanoseconds * 1e-9
+
+
+def enableTimestamps(sock):
+    """
+    Ask kernel to stamp datagrams received by sock.
+    :return: True if receive times will come from kernel
+    :rtype: bool
+    """
+    if not KERNEL_TIMESTAMPS or sock is None:
+        return False
+    try:
+        readStamp(sock)
+    except (IOError, OSError, socket.error) as ex:
+        # nothing received yet, stamping is on from now
+        if ex.args[0] != errno.ENOENT:
+            log.debug("Kernel timestamps not available: %s", ex)
+            return False
+    return True
+
+
+def getReceiveTime(sock, enabled=True):
+    """
+    Return time of arrival of the datagram read last from sock.
+    :param enabled: result of enableTimestamps() for sock
+    :return: seconds since the epoch, current time without kernel stamp
+    :rtype: float
+    """
+    if enabled:
+        try:
+            stamp = readStamp(sock)
+            if stamp:
+                return stamp
+        except (IOError, OSError, socket.error) as ex:
+            log.debug("Unable to read kernel timestamp: %s", ex)
+    return time.time()
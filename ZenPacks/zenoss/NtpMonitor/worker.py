@@ -0,0 +1,113 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2018, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Worker process running NTP checks for NtpWorkerPool.
+
+Requests are read from stdin and results are written to stdout, one
+JSON object per line:
+
+* request: {"id": 1, "host": "10.0.0.1", "port": 123, "timeout": 60,
+  "warning": 60, "critical": 120}
+* response: {"id": 1, "result": {...}} or {"id": 1, "error": "..."}
+
+The worker exits when stdin is closed and all checks are finished.
+"""
+
+import errno
+import json
+import logging
+import os
+import sys
+from optparse import OptionParser
+from ZenPacks.zenoss.NtpMonitor.engine import NtpEngine
+
+
+log = logging.getLogger("zen.NtpMonitor")
+
+READ_SIZE = 65536
+
+
+class NtpWorker(object):
+    """
+    Feeds requests from a stream into NtpEngine and writes results back.
+    """
+    def __init__(self, engine, output):
+        self.engine = engine
+        self.output = output
+        self.buffer = ""
+        self.closed = False
+
+    def handleLine(self, line):
+        try:
+            request = json.loads(line)
+            self.engine.submit(
+                request.get("host"), request.get("port"),
+                request.get("timeout"), request.get("warning"),
+                request.get("critical"), tag=request["id"],
+                checkMode=request.get("checkMode"),
+                lastEventCount=request.get("lastEventCount")
+            )
+        except (ValueError, KeyError, TypeError, AttributeError):
+            log.warn("Invalid request: %r", line)
+
+    def dataReceived(self, data):
+        if not data:
+            self.closed = True
+            return
+        self.buffer += data
+        lines = self.buffer.split("\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                self.handleLine(line)
+
+    def flush(self):
+        finished = self.engine.finished
+        if not finished:
+            return
+        while finished:
+            tag, result, error = finished.popleft()
+            if error is not None:
+                response = {"id": tag, "error": str(error)}
+            else:
+                response = {"id": tag, "result": result}
+            self.output.write(json.dumps(response) + "\n")
+        self.output.flush()
+
+    def run(self, inputFd):
+        while not self.closed or self.engine.busy:
+            readers = () if self.closed else (inputFd,)
+            ready = self.engine.step(readers=readers)
+            if ready:
+                try:
+                    self.dataReceived(os.read(inputFd, READ_SIZE))
+                except OSError as ex:
+                    if ex.errno != errno.EINTR:
+                        raise
+            self.flush()
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--parallel", dest="parallel", type="int",
+                      default=256,
+                      help="maximum number of checks in flight "
+                           "[default: %default]")
+    options, _ = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    engine = NtpEngine(parallel=options.parallel)
+    try:
+        NtpWorker(engine, sys.stdout).run(sys.stdin.fileno())
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -65,6 +65,9 @@ setup(
     # of this form.
     entry_points = {
         'zenoss.zenpacks': '%s = %s' % (NAME, NAME),
+        'console_scripts': [
+            'zenntpcheck = %s.check:main' % NAME,
+        ],
     },
 
     # All ZenPack eggs must be installed in unzipped form.